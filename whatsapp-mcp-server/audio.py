@@ -1,6 +1,310 @@
+import asyncio
+import glob
+import hashlib
+import io
+import json
 import os
+import signal
 import subprocess
 import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from ogg_opus import OPUS_GRANULE_RATE, OggOpusWriter, packet_samples, read_opus_stream
+
+# Converted voice notes are cached by content so repeated sends skip ffmpeg.
+# The directory must be readable by the bridge, like the temp files were.
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'whatsapp-mcp-audio'))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+# Partial outputs and old temp conversions older than this are removed by the sweep
+AUDIO_TEMP_MAX_AGE = float(os.getenv('AUDIO_TEMP_MAX_AGE', '3600'))
+# Cache entries used this recently are never evicted, so a path handed out for
+# sending stays on disk until the bridge has read it
+AUDIO_CACHE_GRACE_SECONDS = float(os.getenv('AUDIO_CACHE_GRACE_SECONDS', '300'))
+
+TEMP_PREFIX = "whatsapp-mcp-"
+_PARTIAL_SUFFIX = ".partial.ogg"
+
+_cache_lock = threading.Lock()
+# Conversions of the same key are serialized by one of a fixed set of locks
+_KEY_LOCK_STRIPES = 64
+_key_locks = [threading.Lock() for _ in range(_KEY_LOCK_STRIPES)]
+_digests = {}
+_probes = {}
+_cache_stats = {
+    "hits": 0, "misses": 0, "evictions": 0, "orphans_removed": 0,
+    "pass_through": 0, "remux": 0, "encode": 0, "segmented": 0,
+}
+
+# How prepare_voice_note turns an input into an Opus/Ogg voice note
+STRATEGY_PASS_THROUGH = "pass_through"
+STRATEGY_REMUX = "remux"
+STRATEGY_ENCODE = "encode"
+FFPROBE_TIMEOUT = float(os.getenv('FFPROBE_TIMEOUT', '15'))
+
+# Opt-in: encode inputs longer than AUDIO_SEGMENT_MIN_DURATION seconds as
+# AUDIO_SEGMENT_SECONDS-long segments in parallel, then join them into one Ogg
+AUDIO_SEGMENT_ENABLED = os.getenv('AUDIO_SEGMENT_ENABLED', 'false').lower() in ('true', '1', 'yes', 'on')
+AUDIO_SEGMENT_MIN_DURATION = float(os.getenv('AUDIO_SEGMENT_MIN_DURATION', '600'))
+AUDIO_SEGMENT_SECONDS = float(os.getenv('AUDIO_SEGMENT_SECONDS', '120'))
+
+# ffmpeg scheduling: at most FFMPEG_WORKERS encoders run at once, at most
+# FFMPEG_QUEUE_SIZE more wait for a worker, and further submissions wait up to
+# FFMPEG_QUEUE_WAIT seconds for room before being rejected.
+FFMPEG_WORKERS = int(os.getenv('FFMPEG_WORKERS', str(os.cpu_count() or 2)))
+FFMPEG_QUEUE_SIZE = int(os.getenv('FFMPEG_QUEUE_SIZE', '32'))
+FFMPEG_QUEUE_WAIT = float(os.getenv('FFMPEG_QUEUE_WAIT', '10'))
+FFMPEG_TIMEOUT = float(os.getenv('FFMPEG_TIMEOUT', '120'))
+
+# Pipes to and from a streaming ffmpeg job are moved in chunks of this size
+STREAM_CHUNK_SIZE = 64 * 1024
+# Only the tail of a streaming job's stderr is kept for error messages
+_STDERR_TAIL_CHUNKS = 16
+
+
+class FfmpegBusyError(RuntimeError):
+    """Raised when the ffmpeg queue stays full for longer than FFMPEG_QUEUE_WAIT."""
+
+
+def _kill(process):
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    process.kill()
+
+
+def _is_stream(data):
+    return data is not None and hasattr(data, "read")
+
+
+def _feed(pipe, source):
+    """Write source (a buffer or readable object) to pipe chunk by chunk, then close it."""
+    try:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source)
+            for offset in range(0, len(view), STREAM_CHUNK_SIZE):
+                pipe.write(view[offset:offset + STREAM_CHUNK_SIZE])
+        else:
+            for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b""):
+                pipe.write(chunk)
+    except OSError:
+        # ffmpeg stopped reading (it failed or was killed); its exit status says why
+        pass
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+
+def _drain(pipe, sink):
+    """Read pipe to EOF chunk by chunk, handing each chunk to sink."""
+    for chunk in iter(lambda: pipe.read(STREAM_CHUNK_SIZE), b""):
+        sink(chunk)
+
+
+class FfmpegPool:
+    """
+    Fixed-size worker pool for ffmpeg processes with a bounded queue.
+    
+    Every job runs with a timeout; a process that exceeds it is killed so a
+    stuck decoder cannot hold a worker forever. Jobs can be awaited
+    synchronously (run), asynchronously (run_async) or as futures (submit).
+    """
+
+    def __init__(self, workers=FFMPEG_WORKERS, queue_size=FFMPEG_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0, "completed": 0, "failed": 0, "timed_out": 0, "rejected": 0,
+            "queued": 0, "running": 0,
+            "encode_seconds_total": 0.0, "encode_seconds_max": 0.0, "queue_wait_seconds_total": 0.0,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ffmpeg")
+            return self._executor
+
+    def _count(self, **changes):
+        with self._lock:
+            for name, delta in changes.items():
+                self._metrics[name] += delta
+
+    def _communicate(self, process, input_data, timeout):
+        try:
+            return process.communicate(input_data, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            process.communicate()
+            self._count(timed_out=1)
+            raise RuntimeError(f"ffmpeg timed out after {timeout:g}s and was killed")
+
+    def _stream(self, process, input_data, output, timeout):
+        """
+        Move data through ffmpeg in STREAM_CHUNK_SIZE chunks.
+        
+        stdin is fed and stderr drained on helper threads while this thread
+        drains stdout into output, so no side is ever held in memory whole and
+        neither pipe can fill up and stall the other.
+        """
+        stderr_tail = deque(maxlen=_STDERR_TAIL_CHUNKS)
+        helpers = [threading.Thread(target=_drain, args=(process.stderr, stderr_tail.append), daemon=True)]
+        if input_data is not None:
+            helpers.append(threading.Thread(target=_feed, args=(process.stdin, input_data), daemon=True))
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            _kill(process)
+
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        for helper in helpers:
+            helper.start()
+        timer.start()
+        written = 0
+        try:
+            for chunk in iter(lambda: process.stdout.read(STREAM_CHUNK_SIZE), b""):
+                output.write(chunk)
+                written += len(chunk)
+        except BaseException:
+            _kill(process)
+            raise
+        finally:
+            process.wait()
+            timer.cancel()
+            for helper in helpers:
+                helper.join()
+            process.stdout.close()
+            process.stderr.close()
+        if timed_out.is_set():
+            self._count(timed_out=1)
+            raise RuntimeError(f"ffmpeg timed out after {timeout:g}s and was killed")
+        return written, b"".join(stderr_tail)
+
+    def _run_job(self, cmd, timeout, input_data, output, submitted_at):
+        started = time.monotonic()
+        self._count(queued=-1, running=1, queue_wait_seconds_total=started - submitted_at)
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                # Own process group, so a kill also reaches anything ffmpeg spawned
+                start_new_session=(os.name == "posix"),
+            )
+            if output is not None or _is_stream(input_data):
+                sink = output if output is not None else io.BytesIO()
+                written, stderr = self._stream(process, input_data, sink, timeout)
+                stdout = written if output is not None else sink.getvalue()
+            else:
+                stdout, stderr = self._communicate(process, input_data, timeout)
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    process.returncode, cmd, None, stderr.decode("utf-8", errors="replace")
+                )
+            self._count(completed=1)
+            return stdout
+        except Exception:
+            self._count(failed=1)
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._metrics["running"] -= 1
+                self._metrics["encode_seconds_total"] += elapsed
+                self._metrics["encode_seconds_max"] = max(self._metrics["encode_seconds_max"], elapsed)
+            self._slots.release()
+
+    def submit(self, cmd, timeout=FFMPEG_TIMEOUT, input_data=None, output=None):
+        """
+        Queue an ffmpeg command.
+        
+        A readable input_data or an output makes the job stream: stdin and
+        stdout are moved in STREAM_CHUNK_SIZE chunks instead of being held in
+        memory whole.
+        
+        Args:
+            cmd (list): The command line to run
+            timeout (float, optional): Seconds before the process is killed (default: FFMPEG_TIMEOUT)
+            input_data (bytes | file-like, optional): Data or readable binary object to feed to the process on stdin
+            output (file-like, optional): Writable binary object that receives stdout as it is produced
+        
+        Returns:
+            concurrent.futures.Future: Resolves to the process's stdout as bytes,
+                or to the number of bytes written when output is given
+            
+        Raises:
+            FfmpegBusyError: If the queue stayed full for FFMPEG_QUEUE_WAIT seconds
+        """
+        if not self._slots.acquire(timeout=FFMPEG_QUEUE_WAIT):
+            self._count(rejected=1)
+            raise FfmpegBusyError("Audio conversion queue is full, try again shortly")
+        self._count(submitted=1, queued=1)
+        try:
+            future = self._get_executor().submit(self._run_job, cmd, timeout, input_data, output, time.monotonic())
+        except Exception:
+            self._count(queued=-1)
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _release_cancelled(self, future):
+        # A job cancelled while queued never reaches _run_job to give back its slot
+        if future.cancelled():
+            self._count(queued=-1)
+            self._slots.release()
+
+    def run(self, cmd, timeout=FFMPEG_TIMEOUT, input_data=None, output=None):
+        """Run an ffmpeg command on the pool and wait for its stdout (or for output to be written)."""
+        return self.submit(cmd, timeout, input_data, output).result()
+
+    async def run_async(self, cmd, timeout=FFMPEG_TIMEOUT, input_data=None, output=None):
+        """Async flavor of run(); the event loop is not blocked while waiting for room or for ffmpeg."""
+        loop = asyncio.get_running_loop()
+        # Waiting for a queue slot can block, so do it off the loop
+        future = await loop.run_in_executor(None, self.submit, cmd, timeout, input_data, output)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        """
+        Queue depth, running jobs and timing counters.
+        
+        Returns:
+            dict: Counters plus mean encode and queue wait times in seconds
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+        finished = metrics["completed"] + metrics["failed"]
+        metrics["encode_seconds_mean"] = round(metrics["encode_seconds_total"] / finished, 3) if finished else None
+        metrics["queue_wait_seconds_mean"] = round(metrics["queue_wait_seconds_total"] / finished, 3) if finished else None
+        metrics["workers"] = self.workers
+        metrics["queue_size"] = self.queue_size
+        return metrics
+
+
+_pool = FfmpegPool()
+# Encoder pre-skip by (bitrate, sample_rate), see _opus_pre_skip
+_pre_skip_cache = {}
+
+
+def get_pool():
+    """Return the shared ffmpeg worker pool."""
+    return _pool
+
 
 def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate=24000):
     """
@@ -18,7 +322,8 @@ def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate
         
     Raises:
         FileNotFoundError: If the input file doesn't exist
-        RuntimeError: If the ffmpeg conversion fails
+        FfmpegBusyError: If too many conversions are already queued
+        RuntimeError: If the ffmpeg conversion fails or times out
     """
     if not os.path.isfile(input_file):
         raise FileNotFoundError(f"Input file not found: {input_file}")
@@ -33,9 +338,225 @@ def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate
         os.makedirs(output_dir)
     
     # Build the ffmpeg command
-    cmd = [
-        "ffmpeg",
-        "-i", input_file,
+    cmd = ["ffmpeg", "-i", input_file] + _opus_args(bitrate, sample_rate) + [
+        "-y",                        # Overwrite output file if it exists
+        output_file
+    ]
+    
+    try:
+        # Run the ffmpeg command on the shared worker pool
+        _pool.run(cmd)
+        return output_file
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to convert audio. You likely need to install ffmpeg {e.stderr}")
+
+
+def should_segment(input_file):
+    """
+    Whether convert_to_opus_ogg_segmented should be used for input_file.
+    
+    Args:
+        input_file (str): Path to the input audio file
+    
+    Returns:
+        bool: True if segmenting is enabled and the probed duration exceeds
+            AUDIO_SEGMENT_MIN_DURATION; False if it is disabled or the duration is unknown
+    """
+    if not AUDIO_SEGMENT_ENABLED:
+        return False
+    probe = probe_audio(input_file)
+    duration = probe and probe.get("duration")
+    return bool(duration) and duration > max(AUDIO_SEGMENT_MIN_DURATION, AUDIO_SEGMENT_SECONDS)
+
+
+def _opus_pre_skip(bitrate, sample_rate):
+    """
+    The pre-skip, in 48 kHz samples, that the encoder writes for these settings.
+    
+    Found once per setting by encoding a moment of silence and reading the
+    OpusHead packet, since it depends on the libopus build.
+    """
+    key = (bitrate, sample_rate)
+    if key not in _pre_skip_cache:
+        cmd = [
+            "ffmpeg",
+            "-f", "lavfi",
+            "-i", f"anullsrc=r={sample_rate}:cl=mono",
+            "-t", "0.1",
+        ] + _opus_args(bitrate, sample_rate) + ["-f", "ogg", "pipe:1"]
+        try:
+            encoded = _pool.run(cmd)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Failed to probe the Opus encoder. You likely need to install ffmpeg {e.stderr}")
+        _pre_skip_cache[key] = read_opus_stream(io.BytesIO(encoded)).pre_skip
+    return _pre_skip_cache[key]
+
+
+def _segment_plan(total_samples, segment_samples, frame_samples, pre_skip, min_last_samples):
+    """
+    Cut points for convert_to_opus_ogg_segmented, in samples at the encoder's rate.
+    
+    Returns a list of (start, end, lead_packets) tuples; end is None for the
+    last segment. The audio kept from segment i covers [b_i, b_i+1) with
+    b_0 = 0 and b_i = i * segment_samples - pre_skip, so that every segment
+    except the last encodes to whole frames. Segments after the first start
+    lead_packets frames early: the encoder is primed on real audio, and the
+    lead-in packets (its priming plus the overlap) are dropped at the join.
+    The last segment is never planned shorter than min_last_samples, since
+    total_samples comes from a probed duration and may be a little off.
+    """
+    lead_packets = pre_skip // frame_samples + 1
+    plan = []
+    start = 0
+    index = 1
+    while index * segment_samples - pre_skip < total_samples - min_last_samples:
+        end = index * segment_samples - pre_skip
+        plan.append((start, end, lead_packets if plan else 0))
+        start = end - (lead_packets * frame_samples - pre_skip)
+        index += 1
+    plan.append((start, None, lead_packets if plan else 0))
+    return plan
+
+
+def convert_to_opus_ogg_segmented(input_file, output_file, bitrate="32k", sample_rate=24000,
+                                  segment_seconds=AUDIO_SEGMENT_SECONDS, duration=None):
+    """
+    Convert a long audio file to Opus/Ogg by encoding segments in parallel.
+    
+    Every segment is encoded by its own ffmpeg job on the shared pool and the
+    packets are then joined into one Ogg stream in Python. A stream copy of
+    independently encoded segments would repeat the encoder's pre-skip
+    (priming) at every boundary and leave granule positions that don't match
+    the audio, so the cuts are sample-aligned instead (see _segment_plan):
+    each segment is cut from the resampled audio with atrim, segments after
+    the first start a few frames early, and those lead-in packets are dropped
+    when joining. The output therefore has the same samples at the same
+    positions as a whole-file encode, with one pre-skip at the start and
+    granule positions recomputed from the packets; the last segment's end
+    trim is kept. What remains at a join is that the encoder state
+    (prediction, band energies) restarts from the lead-in rather than
+    continuing, which can make the first frame after a join differ slightly
+    from a whole-file encode.
+    
+    If a segment doesn't come out as planned (a different pre-skip or
+    length), the file is encoded whole with convert_to_opus_ogg instead.
+    
+    Args:
+        input_file (str): Path to the input audio file
+        output_file (str): Path to write the .ogg file to
+        bitrate (str, optional): Target bitrate for Opus encoding (default: "32k")
+        sample_rate (int, optional): Sample rate for output (default: 24000)
+        segment_seconds (float, optional): Length of each segment, rounded to whole 60 ms frames (default: AUDIO_SEGMENT_SECONDS)
+        duration (float, optional): Input duration in seconds; probed if not given
+    
+    Returns:
+        str: Path to the converted file
+        
+    Raises:
+        FileNotFoundError: If the input file doesn't exist
+        FfmpegBusyError: If too many conversions are already queued
+        RuntimeError: If the duration is unknown or any ffmpeg step fails or times out
+    """
+    if not os.path.isfile(input_file):
+        raise FileNotFoundError(f"Input file not found: {input_file}")
+    if duration is None:
+        probe = probe_audio(input_file)
+        duration = probe and probe.get("duration")
+    if not duration:
+        raise RuntimeError(f"Could not determine the duration of {input_file}")
+
+    # Granule positions and pre-skip count 48 kHz samples; the cuts are made at the encoder's rate
+    scale = OPUS_GRANULE_RATE // sample_rate
+    pre_skip = _opus_pre_skip(bitrate, sample_rate)
+    frame = sample_rate * 60 // 1000
+    if OPUS_GRANULE_RATE % sample_rate or pre_skip % scale:
+        return convert_to_opus_ogg(input_file, output_file, bitrate, sample_rate)
+    plan = _segment_plan(
+        int(duration * sample_rate),
+        max(1, round(segment_seconds * 1000 / 60)) * frame,
+        frame,
+        pre_skip // scale,
+        sample_rate,
+    )
+
+    with tempfile.TemporaryDirectory(prefix=TEMP_PREFIX) as work_dir:
+        segment_files = []
+        futures = []
+        try:
+            for start, end, _ in plan:
+                segment_file = os.path.join(work_dir, f"segment-{len(segment_files):05d}.ogg")
+                # Seek to a whole second at least a second early, so the resampler
+                # runs on the same grid as for the whole file and has settled by
+                # the cut, then trim to the exact sample
+                seek = max(0, start // sample_rate - 1)
+                trim = f"aresample={sample_rate},atrim=start_sample={start - seek * sample_rate}"
+                if end is not None:
+                    trim += f":end_sample={end - seek * sample_rate}"
+                cmd = ["ffmpeg"] + (["-ss", str(seek)] if seek else []) + [
+                    "-i", input_file,
+                    "-map", "0:a:0",
+                    "-af", trim,
+                ] + _opus_args(bitrate, sample_rate) + ["-y", segment_file]
+                futures.append(_pool.submit(cmd))
+                segment_files.append(segment_file)
+            for future in futures:
+                future.result()
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Failed to convert audio segment. You likely need to install ffmpeg {e.stderr}")
+        finally:
+            # Drop still-queued segments of a failed conversion and let running
+            # ones finish before their directory is removed
+            for future in futures:
+                future.cancel()
+            wait(futures)
+
+        try:
+            _join_opus_segments(segment_files, plan, output_file, pre_skip, frame * scale, scale)
+        except ValueError as e:
+            print(f"Segmented encode of {input_file} did not line up ({e}), encoding it whole")
+            return convert_to_opus_ogg(input_file, output_file, bitrate, sample_rate)
+
+    _count("segmented")
+    return output_file
+
+
+def _join_opus_segments(segment_files, plan, output_file, pre_skip, frame, scale):
+    """
+    Join segments encoded per _segment_plan into one Ogg Opus stream.
+    
+    Lengths are in 48 kHz samples except the plan's, which are at the
+    encoder's rate (scale is the ratio).
+    
+    Raises:
+        ValueError: If a segment is unreadable or not encoded as planned
+    """
+    with open(output_file, "wb") as out:
+        writer = None
+        final_granule = 0
+        for segment_file, (start, end, lead_packets) in zip(segment_files, plan):
+            with open(segment_file, "rb") as f:
+                segment = read_opus_stream(f)
+            if segment.pre_skip != pre_skip:
+                raise ValueError(f"pre-skip {segment.pre_skip} instead of {pre_skip}")
+            packets = segment.packets
+            if sum(packet_samples(packet) for packet in packets[:lead_packets]) != lead_packets * frame:
+                raise ValueError("unexpected lead-in packets")
+            if end is not None:
+                # Inner segments hold whole frames and nothing to trim at the end
+                expected = (end - start) * scale + pre_skip
+                if segment.final_granule != expected or sum(map(packet_samples, packets)) != expected:
+                    raise ValueError(f"segment of {segment.final_granule} samples instead of {expected}")
+            if writer is None:
+                writer = OggOpusWriter(out, segment.head, segment.tags)
+            for packet in packets[lead_packets:]:
+                writer.write(packet)
+            # Each segment's granule counts its pre-skip, which the lead-in packets cover after the first
+            final_granule += segment.final_granule - lead_packets * frame
+        writer.finish(final_granule)
+
+
+def _opus_args(bitrate, sample_rate):
+    return [
         "-c:a", "libopus",
         "-b:a", bitrate,
         "-ar", str(sample_rate),
@@ -43,20 +564,47 @@ def convert_to_opus_ogg(input_file, output_file=None, bitrate="32k", sample_rate
         "-vbr", "on",           # Variable bitrate
         "-compression_level", "10",  # Maximum compression
         "-frame_duration", "60",     # 60ms frames (good for voice)
-        "-y",                        # Overwrite output file if it exists
-        output_file
     ]
+
+
+def _pipe_source(source):
+    """Return (ffmpeg input argument, buffer or readable object for stdin, or None) for a source."""
+    if isinstance(source, (bytes, bytearray, memoryview)) or hasattr(source, "read"):
+        return "pipe:0", source
+    if not os.path.isfile(source):
+        raise FileNotFoundError(f"Input file not found: {source}")
+    return source, None
+
+
+def transcode_to_opus_ogg(source, bitrate="32k", sample_rate=24000, output=None):
+    """
+    Convert audio to Opus/Ogg through pipes, without temp files.
+    
+    In-memory and file-like sources are fed to ffmpeg's stdin in
+    STREAM_CHUNK_SIZE chunks from a helper thread while the encoded stream is
+    drained from stdout in chunks, so a file-like source (e.g. an upload) is
+    never read into memory whole, and with output given neither is the
+    result. Containers that need seeking to decode (e.g. MP4/M4A with the
+    index at the end) can only be read from a path.
     
+    Args:
+        source (str | bytes | file-like): Path, buffer or readable binary object (e.g. an upload) with the input audio
+        bitrate (str, optional): Target bitrate for Opus encoding (default: "32k")
+        sample_rate (int, optional): Sample rate for output (default: 24000)
+        output (file-like, optional): Writable binary object to stream the encoded audio into
+    
+    Returns:
+        bytes | int: The Opus/Ogg encoded audio, or the number of bytes written to output
+        
+    Raises:
+        FileNotFoundError: If source is a path that doesn't exist
+        FfmpegBusyError: If too many conversions are already queued
+        RuntimeError: If the ffmpeg conversion fails or times out
+    """
+    input_arg, input_data = _pipe_source(source)
+    cmd = ["ffmpeg", "-i", input_arg] + _opus_args(bitrate, sample_rate) + ["-f", "ogg", "pipe:1"]
     try:
-        # Run the ffmpeg command and capture output
-        process = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
-        return output_file
+        return _pool.run(cmd, input_data=input_data, output=output)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"Failed to convert audio. You likely need to install ffmpeg {e.stderr}")
 
@@ -78,7 +626,7 @@ def convert_to_opus_ogg_temp(input_file, bitrate="32k", sample_rate=24000):
         RuntimeError: If the ffmpeg conversion fails
     """
     # Create a temporary file with .ogg extension
-    temp_file = tempfile.NamedTemporaryFile(suffix=".ogg", delete=False)
+    temp_file = tempfile.NamedTemporaryFile(prefix=TEMP_PREFIX, suffix=".ogg", delete=False)
     temp_file.close()
     
     try:
@@ -92,6 +640,363 @@ def convert_to_opus_ogg_temp(input_file, bitrate="32k", sample_rate=24000):
         raise e
 
 
+def file_digest(path):
+    """
+    SHA-256 of a file's content, memoized on (path, size, mtime).
+    
+    Args:
+        path (str): Path to the file
+    
+    Returns:
+        str: Hex digest of the file content
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(memo_key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        if len(_digests) > 1024:
+            _digests.clear()
+        _digests[memo_key] = digest
+    return digest
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _cache_key(content_digest, bitrate, sample_rate):
+    params = f"{content_digest}|libopus|{bitrate}|{sample_rate}|voip|60"
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+
+def _key_lock(key):
+    return _key_locks[hash(key) % _KEY_LOCK_STRIPES]
+
+
+def convert_to_opus_ogg_cached(source, bitrate="32k", sample_rate=24000):
+    """
+    Convert audio to Opus/Ogg, reusing an earlier conversion of the same content.
+    
+    Results are stored in AUDIO_CACHE_DIR under a hash of the input content and
+    encoding parameters, so sending the same audio again (even from another path)
+    does not run ffmpeg. Concurrent requests for the same content wait for a
+    single conversion. The returned file stays valid until evicted by the
+    size-bounded LRU sweep.
+    
+    The input may be a path or, to avoid writing it to disk first, an
+    in-memory buffer or file-like object; ffmpeg reads it through a pipe and
+    the encoded output is streamed to disk exactly once, as the cache entry.
+    Seekable file-like inputs are hashed and encoded chunk by chunk without
+    being read into memory whole.
+    
+    Args:
+        source (str | bytes | file-like): Path, buffer or readable object with the input audio
+        bitrate (str, optional): Target bitrate for Opus encoding (default: "32k")
+        sample_rate (int, optional): Sample rate for output (default: 24000)
+    
+    Returns:
+        str: Path to the cached .ogg file
+        
+    Raises:
+        FileNotFoundError: If source is a path that doesn't exist
+        FfmpegBusyError: If too many conversions are already queued
+        RuntimeError: If the ffmpeg conversion fails or times out
+    """
+    if isinstance(source, str):
+        if not os.path.isfile(source):
+            raise FileNotFoundError(f"Input file not found: {source}")
+        content_digest = file_digest(source)
+    elif hasattr(source, "read") and _seekable(source):
+        # Hash in chunks, then rewind so ffmpeg can stream the same bytes
+        start = source.tell()
+        hasher = hashlib.sha256()
+        for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+        source.seek(start)
+        content_digest = hasher.hexdigest()
+    else:
+        # A pipe can only be read once, and the key is needed before encoding
+        if hasattr(source, "read"):
+            source = source.read()
+        content_digest = hashlib.sha256(source).hexdigest()
+
+    def produce(partial_file):
+        if isinstance(source, str) and should_segment(source):
+            convert_to_opus_ogg_segmented(source, partial_file, bitrate, sample_rate)
+        elif isinstance(source, str):
+            convert_to_opus_ogg(source, partial_file, bitrate, sample_rate)
+        else:
+            with open(partial_file, "wb") as f:
+                transcode_to_opus_ogg(source, bitrate, sample_rate, output=f)
+
+    return _cached_output(_cache_key(content_digest, bitrate, sample_rate), produce)
+
+
+def _cached_output(key, produce):
+    """Return the cache file for key, calling produce(partial_path) to create it on a miss."""
+    cached_file = os.path.join(AUDIO_CACHE_DIR, key + ".ogg")
+    with _key_lock(key):
+        if os.path.isfile(cached_file):
+            # Refresh the entry's position in the LRU order
+            os.utime(cached_file)
+            _count("hits")
+            return cached_file
+
+        _count("misses")
+        os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+        partial_file = os.path.join(AUDIO_CACHE_DIR, f"{key}.{uuid.uuid4().hex}{_PARTIAL_SUFFIX}")
+        try:
+            produce(partial_file)
+            os.replace(partial_file, cached_file)
+        finally:
+            if os.path.exists(partial_file):
+                os.unlink(partial_file)
+
+    sweep_cache(keep=cached_file)
+    return cached_file
+
+
+def probe_audio(path):
+    """
+    Identify the container and audio codec of a file with ffprobe.
+    
+    Results are memoized on (path, size, mtime), so repeated sends of the same
+    file probe it only once.
+    
+    Args:
+        path (str): Path to the media file
+    
+    Returns:
+        dict: {"format": container names, "duration": seconds or None,
+            "audio_codecs": [...], "has_video": bool},
+            or None if the file could not be probed (e.g. ffprobe is missing)
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _cache_lock:
+        if memo_key in _probes:
+            return _probes[memo_key]
+
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=format_name,duration:stream=codec_type,codec_name",
+        "-of", "json",
+        path
+    ]
+    try:
+        output = json.loads(_pool.run(cmd, timeout=FFPROBE_TIMEOUT))
+        streams = output.get("streams", [])
+        duration = output.get("format", {}).get("duration")
+        probe = {
+            "format": output.get("format", {}).get("format_name", ""),
+            "duration": float(duration) if duration not in (None, "N/A") else None,
+            "audio_codecs": [st.get("codec_name") for st in streams if st.get("codec_type") == "audio"],
+            # Cover art in MP3/M4A shows up as a video stream too; it is dropped either way
+            "has_video": any(st.get("codec_type") == "video" for st in streams),
+        }
+    except FfmpegBusyError:
+        # Don't remember a probe that never ran
+        return None
+    except (OSError, ValueError, RuntimeError, subprocess.CalledProcessError):
+        probe = None
+
+    with _cache_lock:
+        if len(_probes) > 1024:
+            _probes.clear()
+        _probes[memo_key] = probe
+    return probe
+
+
+def choose_voice_note_strategy(path):
+    """
+    Decide how to turn a file into an Opus/Ogg voice note.
+    
+    Args:
+        path (str): Path to the audio file
+    
+    Returns:
+        str: STRATEGY_PASS_THROUGH if it already is a .ogg file holding only Opus,
+            STRATEGY_REMUX if it holds Opus in another container (WebM, MKA, MP4, CAF)
+            or under another extension (.opus, .oga), or STRATEGY_ENCODE otherwise.
+            If the file cannot be probed, .ogg files are passed through and
+            everything else is encoded.
+    """
+    # The bridge only sends files named .ogg as voice notes; anything else
+    # goes out as a document, so other names get a stream copy to .ogg
+    is_ogg_name = path.lower().endswith(".ogg")
+    probe = probe_audio(path)
+    if probe is None:
+        return STRATEGY_PASS_THROUGH if is_ogg_name else STRATEGY_ENCODE
+    if not probe["audio_codecs"] or probe["audio_codecs"][0] != "opus":
+        return STRATEGY_ENCODE
+    formats = probe["format"].split(",")
+    if is_ogg_name and "ogg" in formats and len(probe["audio_codecs"]) == 1 and not probe["has_video"]:
+        return STRATEGY_PASS_THROUGH
+    return STRATEGY_REMUX
+
+
+def remux_to_ogg(input_file, output_file):
+    """
+    Copy the first audio stream of a file into an Ogg container without re-encoding.
+    
+    Args:
+        input_file (str): Path to a file whose first audio stream is Opus
+        output_file (str): Path to write the .ogg file to
+    
+    Returns:
+        str: Path to the remuxed file
+        
+    Raises:
+        RuntimeError: If ffmpeg fails or times out
+    """
+    cmd = [
+        "ffmpeg",
+        "-i", input_file,
+        "-map", "0:a:0",
+        "-c:a", "copy",
+        "-f", "ogg",
+        "-y",
+        output_file
+    ]
+    try:
+        _pool.run(cmd)
+        return output_file
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to remux audio: {e.stderr}")
+
+
+def prepare_voice_note(input_file, bitrate="32k", sample_rate=24000):
+    """
+    Get an Opus/Ogg file for input_file, doing as little work as possible.
+    
+    .ogg files holding Opus are used as they are, Opus in other containers or
+    under another extension is remuxed with a stream copy, and anything else is encoded. Remuxed and encoded
+    results go through the conversion cache.
+    
+    Args:
+        input_file (str): Path to the input audio file
+        bitrate (str, optional): Target bitrate when encoding (default: "32k")
+        sample_rate (int, optional): Sample rate when encoding (default: 24000)
+    
+    Returns:
+        str: Path to send as the voice note
+        
+    Raises:
+        FileNotFoundError: If the input file doesn't exist
+        FfmpegBusyError: If too many conversions are already queued
+        RuntimeError: If the conversion fails or times out
+    """
+    if not os.path.isfile(input_file):
+        raise FileNotFoundError(f"Input file not found: {input_file}")
+
+    strategy = choose_voice_note_strategy(input_file)
+    _count(strategy)
+    if strategy == STRATEGY_PASS_THROUGH:
+        return input_file
+    if strategy == STRATEGY_REMUX:
+        key = hashlib.sha256(f"{file_digest(input_file)}|remux".encode("utf-8")).hexdigest()
+        try:
+            return _cached_output(key, lambda partial_file: remux_to_ogg(input_file, partial_file))
+        except RuntimeError:
+            # Some containers can't be stream-copied into Ogg; encoding always works
+            pass
+    return convert_to_opus_ogg_cached(input_file, bitrate, sample_rate)
+
+
+def sweep_cache(keep=None):
+    """
+    Enforce AUDIO_CACHE_MAX_BYTES and remove orphaned temp files.
+    
+    Cached conversions are evicted least recently used first, except those
+    used within AUDIO_CACHE_GRACE_SECONDS, which may still be waiting to be
+    sent. Partial outputs left by interrupted conversions and old
+    convert_to_opus_ogg_temp files are removed once older than AUDIO_TEMP_MAX_AGE.
+    
+    Args:
+        keep (str, optional): A cache file that must not be evicted (e.g. one about to be sent)
+    """
+    cutoff = time.time() - AUDIO_TEMP_MAX_AGE
+    orphans = glob.glob(os.path.join(AUDIO_CACHE_DIR, "*" + _PARTIAL_SUFFIX))
+    orphans += glob.glob(os.path.join(tempfile.gettempdir(), TEMP_PREFIX + "*.ogg"))
+    for path in orphans:
+        try:
+            if os.path.getmtime(path) < cutoff:
+                _remove(path, "orphans_removed")
+        except OSError:
+            continue
+
+    entries = []
+    for path in glob.glob(os.path.join(AUDIO_CACHE_DIR, "*.ogg")):
+        if path.endswith(_PARTIAL_SUFFIX):
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    recent = time.time() - AUDIO_CACHE_GRACE_SECONDS
+    for mtime, size, path in sorted(entries):
+        # Entries are in LRU order, so once one is recent all the rest are too
+        if total <= AUDIO_CACHE_MAX_BYTES or mtime >= recent:
+            break
+        if path == keep:
+            continue
+        if _evict(path, recent):
+            total -= size
+
+
+def _evict(path, recent):
+    # Under the entry's key lock, so a concurrent hit either refreshes the
+    # mtime before this check or finds the file gone and converts again. A
+    # lock held by a running conversion means the entry is left for next time.
+    lock = _key_lock(os.path.basename(path)[:-len(".ogg")])
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        if os.path.getmtime(path) >= recent:
+            return False
+        return _remove(path, "evictions")
+    except OSError:
+        return False
+    finally:
+        lock.release()
+
+
+def _count(counter):
+    with _cache_lock:
+        _cache_stats[counter] += 1
+
+
+def _remove(path, counter):
+    try:
+        os.unlink(path)
+    except OSError:
+        return False
+    _count(counter)
+    return True
+
+
+def cache_stats():
+    """
+    Hit/miss/eviction counters of the conversion cache.
+    
+    Returns:
+        dict: Counters plus the cache directory and its size limit
+    """
+    with _cache_lock:
+        return dict(_cache_stats, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES)
+
+
 if __name__ == "__main__":
     # Example usage
     import sys
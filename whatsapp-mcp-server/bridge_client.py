@@ -0,0 +1,213 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+import concurrency
+
+# Connection pool and timeouts for calls to the Go bridge (overridable through the environment)
+BRIDGE_MAX_CONNECTIONS = int(os.getenv('BRIDGE_MAX_CONNECTIONS', '20'))
+BRIDGE_MAX_KEEPALIVE = int(os.getenv('BRIDGE_MAX_KEEPALIVE', '10'))
+BRIDGE_KEEPALIVE_EXPIRY = float(os.getenv('BRIDGE_KEEPALIVE_EXPIRY', '30'))
+BRIDGE_CONNECT_TIMEOUT = float(os.getenv('BRIDGE_CONNECT_TIMEOUT', '5'))
+# Sending media makes the bridge upload it to WhatsApp before it answers
+BRIDGE_SEND_TIMEOUT = float(os.getenv('BRIDGE_SEND_TIMEOUT', '60'))
+BRIDGE_DOWNLOAD_TIMEOUT = float(os.getenv('BRIDGE_DOWNLOAD_TIMEOUT', '120'))
+BRIDGE_MAX_RETRIES = int(os.getenv('BRIDGE_MAX_RETRIES', '3'))
+BRIDGE_RETRY_BASE_DELAY = float(os.getenv('BRIDGE_RETRY_BASE_DELAY', '0.25'))
+
+# Read timeout per endpoint; anything else uses BRIDGE_SEND_TIMEOUT
+_READ_TIMEOUTS = {
+    "/send": BRIDGE_SEND_TIMEOUT,
+    "/download": BRIDGE_DOWNLOAD_TIMEOUT,
+}
+
+# Endpoints that are safe to repeat: downloading the same media twice just
+# rewrites the same file. /send is not, since a retry after a timeout could
+# deliver the message twice, so it is only retried when the connection was
+# never established.
+_IDEMPOTENT_ENDPOINTS = {"/download"}
+_RETRYABLE_STATUS = {502, 503, 504}
+_LATENCY_SAMPLES = 256
+
+
+class _EndpointMetrics:
+    """Call counts and recent latencies for one bridge endpoint."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.samples: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.calls += 1
+        self.total_seconds += seconds
+        self.samples.append(seconds)
+        if not ok:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "mean_seconds": round(self.total_seconds / self.calls, 4) if self.calls else None,
+            "p50_seconds": percentile(0.5),
+            "p95_seconds": percentile(0.95),
+            "max_seconds": round(ordered[-1], 4) if ordered else None,
+        }
+
+
+class BridgeClient:
+    """Pooled keep-alive HTTP client for the bridge API, in sync and async flavors.
+
+    Both flavors share the timeout, retry and metrics policy. The async client
+    is bound to the event loop it was first used on and is recreated if a
+    different loop calls it.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _EndpointMetrics] = {}
+
+    # -- clients --------------------------------------------------------------
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=BRIDGE_MAX_CONNECTIONS,
+            max_keepalive_connections=BRIDGE_MAX_KEEPALIVE,
+            keepalive_expiry=BRIDGE_KEEPALIVE_EXPIRY,
+        )
+
+    def _sync_client(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(base_url=self.base_url, limits=self._limits())
+        return self._client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, limits=self._limits())
+            self._async_loop = loop
+        return self._async_client
+
+    # -- policy ---------------------------------------------------------------
+
+    def _timeout(self, endpoint: str) -> httpx.Timeout:
+        read = _READ_TIMEOUTS.get(endpoint, BRIDGE_SEND_TIMEOUT)
+        return httpx.Timeout(read, connect=BRIDGE_CONNECT_TIMEOUT)
+
+    def _should_retry(self, endpoint: str, attempt: int, error: Optional[Exception],
+                      response: Optional[httpx.Response]) -> bool:
+        if attempt >= BRIDGE_MAX_RETRIES:
+            return False
+        if isinstance(error, httpx.ConnectError):
+            # Nothing reached the bridge, so even /send is safe to repeat
+            return True
+        if endpoint not in _IDEMPOTENT_ENDPOINTS:
+            return False
+        if error is not None:
+            return isinstance(error, httpx.TransportError)
+        return response is not None and response.status_code in _RETRYABLE_STATUS
+
+    def _retry_delay(self, attempt: int) -> float:
+        delay = BRIDGE_RETRY_BASE_DELAY * (2 ** attempt)
+        return delay + random.uniform(0, delay)
+
+    def _metrics_for(self, endpoint: str) -> _EndpointMetrics:
+        metrics = self._metrics.get(endpoint)
+        if metrics is None:
+            with self._lock:
+                metrics = self._metrics.setdefault(endpoint, _EndpointMetrics())
+        return metrics
+
+    def _record(self, endpoint: str, started: float, ok: bool, retried: bool) -> None:
+        metrics = self._metrics_for(endpoint)
+        with self._lock:
+            metrics.record(time.monotonic() - started, ok)
+            if retried:
+                metrics.retries += 1
+
+    # -- requests -------------------------------------------------------------
+
+    def post(self, endpoint: str, payload: Dict[str, Any]) -> httpx.Response:
+        """POST payload as JSON to endpoint (e.g. "/send").
+
+        Raises:
+            httpx.HTTPError: If the bridge could not be reached or timed out after all retries
+        """
+        with concurrency.activity():
+            client = self._sync_client()
+            attempt = 0
+            while True:
+                started = time.monotonic()
+                response, error = None, None
+                try:
+                    response = client.post(endpoint, json=payload, timeout=self._timeout(endpoint))
+                except httpx.HTTPError as e:
+                    error = e
+                retry = self._should_retry(endpoint, attempt, error, response)
+                self._record(endpoint, started, error is None and response.status_code < 500, retry)
+                if not retry:
+                    if error is not None:
+                        raise error
+                    return response
+                time.sleep(self._retry_delay(attempt))
+                attempt += 1
+
+    async def apost(self, endpoint: str, payload: Dict[str, Any]) -> httpx.Response:
+        """Async flavor of post()."""
+        with concurrency.activity():
+            client = self._get_async_client()
+            attempt = 0
+            while True:
+                started = time.monotonic()
+                response, error = None, None
+                try:
+                    response = await client.post(endpoint, json=payload, timeout=self._timeout(endpoint))
+                except httpx.HTTPError as e:
+                    error = e
+                retry = self._should_retry(endpoint, attempt, error, response)
+                self._record(endpoint, started, error is None and response.status_code < 500, retry)
+                if not retry:
+                    if error is not None:
+                        raise error
+                    return response
+                await asyncio.sleep(self._retry_delay(attempt))
+                attempt += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint call/error/retry counts and latency percentiles."""
+        with self._lock:
+            return {endpoint: metrics.snapshot() for endpoint, metrics in self._metrics.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self) -> None:
+        client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.aclose()
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+from typing import List
+
+import db
+from sidecar import SidecarIndex
+
+# Schema alias the summary is attached under on pooled messages.db readers
+SUMMARY_SCHEMA = "summary"
+
+# A row replaces the stored last message when it is at least as recent
+_NEWER = "COALESCE(excluded.last_timestamp, '') >= COALESCE(last_timestamp, '')"
+_UPSERT_SUMMARY = f"""
+    INSERT INTO chat_summary (
+        chat_jid, last_message_id, last_sender, last_content, last_timestamp, last_is_from_me, message_count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (chat_jid) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        last_message_id = CASE WHEN {_NEWER} THEN excluded.last_message_id ELSE last_message_id END,
+        last_sender = CASE WHEN {_NEWER} THEN excluded.last_sender ELSE last_sender END,
+        last_content = CASE WHEN {_NEWER} THEN excluded.last_content ELSE last_content END,
+        last_is_from_me = CASE WHEN {_NEWER} THEN excluded.last_is_from_me ELSE last_is_from_me END,
+        last_timestamp = CASE WHEN {_NEWER} THEN excluded.last_timestamp ELSE last_timestamp END
+"""
+
+
+class ChatSummaryIndex(SidecarIndex):
+    """Per-chat last message and message count, maintained from new messages rows.
+
+    Replaces joining chats to messages on last_message_time = timestamp, which
+    scans a chat's messages and returns one row per message when several share
+    the last timestamp. The last message is the one with the greatest
+    timestamp; on a tie the most recently stored row wins.
+
+    summary_messages records every (id, chat_jid) counted, so a message the
+    bridge rewrites (INSERT OR REPLACE, new rowid) updates the summary without
+    being counted twice.
+    """
+
+    name = "chat_summary"
+    filename = "chat_summary.db"
+    source_columns = "id, chat_jid, sender, content, timestamp, is_from_me"
+
+    def create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_summary (
+                chat_jid TEXT PRIMARY KEY,
+                last_message_id TEXT,
+                last_sender TEXT,
+                last_content TEXT,
+                last_timestamp TIMESTAMP,
+                last_is_from_me BOOLEAN,
+                message_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS summary_messages (
+                id TEXT NOT NULL,
+                chat_jid TEXT NOT NULL,
+                PRIMARY KEY (id, chat_jid)
+            ) WITHOUT ROWID
+        """)
+
+    def apply(self, conn: sqlite3.Connection, rows: List[tuple]) -> None:
+        for _, message_id, chat_jid, sender, content, timestamp, is_from_me in rows:
+            added = conn.execute(
+                "INSERT OR IGNORE INTO summary_messages (id, chat_jid) VALUES (?, ?)",
+                (message_id, chat_jid),
+            ).rowcount
+            conn.execute(_UPSERT_SUMMARY, (chat_jid, message_id, sender, content, timestamp, is_from_me, added))
+
+    def reset(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM chat_summary")
+        conn.execute("DELETE FROM summary_messages")
+
+    def attach_to(self, source_path: str) -> None:
+        """Make the summary queryable as summary.* from pooled readers of source_path."""
+        self.connection()
+        db.register_attachment(source_path, SUMMARY_SCHEMA, self.path)
+
+
+_index = ChatSummaryIndex(os.getenv('CHAT_SUMMARY_PATH') or None)
+
+
+def get_index() -> ChatSummaryIndex:
+    return _index
+
+
+def prepare(source_path: str) -> bool:
+    """Get the summary ready for a query against source_path.
+
+    Returns True if chat listings can read last messages from it, False if
+    they should join messages directly (the summary is still building).
+    """
+    try:
+        _index.attach_to(source_path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Chat summary unavailable: {e}")
+        return False
+    return _index.refresh(source_path)
+
+
+def start(source_path: str) -> None:
+    """Start building/maintaining the summary in the background (e.g. at server start)."""
+    try:
+        _index.attach_to(source_path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Chat summary unavailable: {e}")
+        return
+    _index.start_background_sync(source_path)
@@ -0,0 +1,173 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, TypeVar
+
+# Resource classes blocking work is run under. Each class gets its own bounded
+# thread pool so that, e.g., a burst of ffmpeg conversions cannot starve
+# database reads. Bridge HTTP calls don't need a pool: they go through the
+# async client in bridge_client.py, bounded by its connection limit.
+RESOURCE_DB = "db"
+RESOURCE_AUDIO = "audio"
+
+_LIMITS = {
+    RESOURCE_DB: int(os.getenv('MCP_DB_CONCURRENCY', '8')),
+    RESOURCE_AUDIO: int(os.getenv('MCP_AUDIO_CONCURRENCY', str(os.cpu_count() or 2))),
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_counters: Dict[str, Dict[str, int]] = {name: {"queued": 0, "running": 0, "completed": 0} for name in _LIMITS}
+_lock = threading.Lock()
+_last_activity = time.monotonic()
+# Interactive work in flight outside the pools (bridge calls, async tools, long-polls)
+_in_flight = 0
+# Set on threads doing background work, whose calls must not look interactive
+_background = threading.local()
+
+T = TypeVar("T")
+
+
+def _executor(resource: str) -> ThreadPoolExecutor:
+    executor = _executors.get(resource)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(resource)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=max(1, _LIMITS[resource]),
+                    thread_name_prefix=f"mcp-{resource}",
+                )
+                _executors[resource] = executor
+    return executor
+
+
+def _tracked(resource: str, state: Dict[str, bool], func: Callable[[], Any]) -> Any:
+    counters = _counters[resource]
+    with _lock:
+        if not state["dequeued"]:
+            state["dequeued"] = True
+            counters["queued"] -= 1
+        counters["running"] += 1
+    try:
+        return func()
+    finally:
+        global _last_activity
+        with _lock:
+            counters["running"] -= 1
+            counters["completed"] += 1
+            _last_activity = time.monotonic()
+
+
+async def run_blocking(resource: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call on the pool for its resource class without blocking the event loop.
+
+    Calls beyond the class's concurrency limit wait in the pool's queue.
+    """
+    if resource not in _LIMITS:
+        raise ValueError(f"Unknown resource class: {resource}")
+    state = {"dequeued": False}
+    with _lock:
+        _counters[resource]["queued"] += 1
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    try:
+        return await loop.run_in_executor(_executor(resource), _tracked, resource, state, call)
+    finally:
+        # A caller cancelled while still queued never reaches _tracked
+        with _lock:
+            if not state["dequeued"]:
+                state["dequeued"] = True
+                _counters[resource]["queued"] -= 1
+
+
+class RateLimiter:
+    """Space out async operations to at most rate per second (unlimited if rate <= 0)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@contextmanager
+def activity() -> Iterator[None]:
+    """Count the enclosed work as interactive for idle_seconds().
+
+    run_blocking calls are counted already; this covers work that never goes
+    through a pool, such as bridge requests and async tools waiting on them.
+    A no-op on threads inside background().
+    """
+    global _in_flight, _last_activity
+    if getattr(_background, "active", False):
+        yield
+        return
+    with _lock:
+        _in_flight += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _in_flight -= 1
+            _last_activity = time.monotonic()
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    """Keep work done by this thread inside the block from counting as activity."""
+    previous = getattr(_background, "active", False)
+    _background.active = True
+    try:
+        yield
+    finally:
+        _background.active = previous
+
+
+def interactive(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Decorate an async entry point so each call counts as activity while it runs."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs) -> T:
+        with activity():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def idle_seconds() -> float:
+    """Seconds since the last tool call finished, or 0 while any is queued or running.
+
+    Background jobs use this to stay out of the way of interactive calls.
+    """
+    with _lock:
+        if _in_flight or any(counters["queued"] or counters["running"] for counters in _counters.values()):
+            return 0.0
+        return time.monotonic() - _last_activity
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Concurrency limit and queued/running/completed call counts per resource class."""
+    with _lock:
+        return {
+            name: {"limit": _LIMITS[name], **counters}
+            for name, counters in _counters.items()
+        }
+
+
+def shutdown(wait: bool = False) -> None:
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
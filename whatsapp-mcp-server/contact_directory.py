@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import db
+from name_cache import CONTACTS_FINGERPRINT, NICKNAMES_FINGERPRINT, content_fingerprint
+
+# Source tables are re-checked at most this often while the bridge keeps writing
+CONTACT_DIRECTORY_REFRESH_SECONDS = float(os.getenv('CONTACT_DIRECTORY_REFRESH_SECONDS', '1.0'))
+
+_GRAM_SIZE = 3
+# Characters people type around phone numbers, e.g. "+972 (50) 123-4567"
+_PHONE_PUNCTUATION = frozenset("+-() .")
+
+
+@dataclass
+class ContactEntry:
+    """One contact as held in memory, with its search and sort keys precomputed."""
+    jid: str
+    phone_number: str
+    first_name: Optional[str]
+    full_name: Optional[str]
+    push_name: Optional[str]
+    business_name: Optional[str]
+    nickname: Optional[str]
+    # Case-folded searchable fields and the trigrams occurring in them
+    haystack: Tuple[str, ...]
+    grams: FrozenSet[str]
+    # Same order as the SQL it replaces: full_name, push_name, first_name, JID
+    sort_key: str
+
+    @property
+    def display_name(self) -> str:
+        return self.full_name or self.push_name or self.first_name or self.business_name or self.phone_number
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + _GRAM_SIZE] for i in range(len(text) - _GRAM_SIZE + 1)}
+
+
+def _make_entry(row: tuple, nickname: Optional[str]) -> ContactEntry:
+    jid, first_name, full_name, push_name, business_name = row
+    haystack = tuple(
+        field.casefold() for field in (first_name, full_name, push_name, business_name, nickname, jid) if field
+    )
+    grams: Set[str] = set()
+    for field in haystack:
+        grams |= _grams(field)
+    return ContactEntry(
+        jid=jid,
+        phone_number=jid.split('@')[0] if '@' in jid else jid,
+        first_name=first_name,
+        full_name=full_name,
+        push_name=push_name,
+        business_name=business_name,
+        nickname=nickname,
+        haystack=haystack,
+        grams=frozenset(grams),
+        sort_key=full_name or push_name or first_name or jid,
+    )
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold a search string; a phone number typed with punctuation is reduced to its digits."""
+    folded = query.strip().casefold()
+    if any(ch.isdigit() for ch in folded) and all(ch.isdigit() or ch in _PHONE_PUNCTUATION for ch in folded):
+        return "".join(ch for ch in folded if ch.isdigit())
+    return folded
+
+
+class ContactDirectory:
+    """In-memory copy of whatsmeow_contacts (plus nicknames) with a trigram index.
+
+    Matching keeps the semantics of the SQL it replaces (a case-insensitive
+    substring of any name field or the JID) but folds case for all scripts
+    and also matches nicknames. Queries of three or more characters only
+    check contacts sharing the query's rarest trigram; shorter ones walk the
+    presorted list and stop at the limit.
+
+    The directory is reloaded lazily: PRAGMA data_version tells whether either
+    database was written, the name-cache fingerprints whether contacts or
+    nicknames actually changed, and then only changed contacts are re-indexed.
+    """
+
+    def __init__(self, messages_db_path: str, whatsapp_db_path: str):
+        self.messages_db_path = messages_db_path
+        self.whatsapp_db_path = whatsapp_db_path
+        self._entries: Dict[str, ContactEntry] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._ordered: List[ContactEntry] = []
+        self._nicknames: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self._watchers = {
+            messages_db_path: db.DataVersionWatcher(messages_db_path),
+            whatsapp_db_path: db.DataVersionWatcher(whatsapp_db_path),
+        }
+        self._fingerprints: Dict[str, Optional[tuple]] = {}
+        self._nicknames_dirty = False
+        self._loaded = False
+        self._last_check = 0.0
+        self.reloads = 0
+        self.reindexed = 0
+
+    # -- loading --------------------------------------------------------------
+
+    def _fingerprint_changed(self, key: str, db_path: str, sql: str) -> bool:
+        fingerprint = content_fingerprint(db_path, sql)
+        changed = self._fingerprints.get(key) != fingerprint
+        self._fingerprints[key] = fingerprint
+        return changed
+
+    def _load_nicknames(self) -> Dict[str, str]:
+        rows = db.fetchall(self.messages_db_path, "SELECT jid, nickname FROM contact_nicknames")
+        return {jid: nickname for jid, nickname in rows if nickname}
+
+    def _load_contacts(self) -> Dict[str, tuple]:
+        rows = db.fetchall(self.whatsapp_db_path, """
+            SELECT DISTINCT their_jid, first_name, full_name, push_name, business_name
+            FROM whatsmeow_contacts
+            WHERE their_jid NOT LIKE '%@g.us'
+        """)
+        # With several linked accounts a contact can appear once per our_jid; keep the first
+        contacts: Dict[str, tuple] = {}
+        for row in rows:
+            contacts.setdefault(row[0], row)
+        return contacts
+
+    def _index(self, entry: ContactEntry) -> None:
+        self._entries[entry.jid] = entry
+        for gram in entry.grams:
+            self._postings.setdefault(gram, set()).add(entry.jid)
+
+    def _unindex(self, jid: str) -> None:
+        entry = self._entries.pop(jid, None)
+        if entry is None:
+            return
+        for gram in entry.grams:
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(jid)
+                if not postings:
+                    del self._postings[gram]
+
+    def _reload(self, contacts_changed: bool, nicknames_changed: bool) -> None:
+        touched: Set[str] = set()
+        if nicknames_changed:
+            nicknames = self._load_nicknames()
+            touched = {jid for jid in set(nicknames) | set(self._nicknames)
+                       if nicknames.get(jid) != self._nicknames.get(jid)}
+            self._nicknames = nicknames
+
+        if contacts_changed:
+            contacts = self._load_contacts()
+            for jid in list(self._entries):
+                if jid not in contacts:
+                    self._unindex(jid)
+        else:
+            contacts = {}
+            for jid in touched:
+                entry = self._entries.get(jid)
+                if entry is not None:
+                    contacts[jid] = (jid, entry.first_name, entry.full_name, entry.push_name, entry.business_name)
+
+        reindexed = 0
+        for jid, row in contacts.items():
+            current = self._entries.get(jid)
+            nickname = self._nicknames.get(jid)
+            if (current is not None and jid not in touched
+                    and (current.first_name, current.full_name, current.push_name, current.business_name) == row[1:]
+                    and current.nickname == nickname):
+                continue
+            self._unindex(jid)
+            self._index(_make_entry(row, nickname))
+            reindexed += 1
+
+        if reindexed or contacts_changed:
+            self._ordered = sorted(self._entries.values(), key=lambda entry: entry.sort_key)
+        self.reloads += 1
+        self.reindexed += reindexed
+
+    def refresh(self, force: bool = False) -> None:
+        """Bring the directory up to date with both databases.
+
+        Raises:
+            sqlite3.Error: If the source tables cannot be read
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._loaded and now - self._last_check < CONTACT_DIRECTORY_REFRESH_SECONDS:
+                return
+            self._last_check = now
+            contacts_written = self._watchers[self.whatsapp_db_path].poll()
+            messages_written = self._watchers[self.messages_db_path].poll()
+            contacts_changed = contacts_written and self._fingerprint_changed(
+                'contacts', self.whatsapp_db_path, CONTACTS_FINGERPRINT)
+            nicknames_changed = self._nicknames_dirty or (messages_written and self._fingerprint_changed(
+                'nicknames', self.messages_db_path, NICKNAMES_FINGERPRINT))
+            if not self._loaded or contacts_changed or nicknames_changed:
+                self._reload(contacts_changed or not self._loaded, nicknames_changed or not self._loaded)
+                self._loaded = True
+                self._nicknames_dirty = False
+
+    def note_nickname_write(self) -> None:
+        """Re-read nicknames on the next query after this process changed one, without waiting for the refresh interval."""
+        with self._lock:
+            self._nicknames_dirty = True
+            self._last_check = 0.0
+
+    # -- queries --------------------------------------------------------------
+
+    def search(self, query: str, limit: int = 50) -> List[ContactEntry]:
+        """Contacts whose name fields, nickname or JID contain query, in display-name order."""
+        self.refresh()
+        needle = normalize_query(query)
+        with self._lock:
+            if len(needle) < _GRAM_SIZE:
+                matches = []
+                for entry in self._ordered:
+                    if any(needle in field for field in entry.haystack):
+                        matches.append(entry)
+                        if len(matches) >= limit:
+                            break
+                return matches
+
+            gram_postings = [self._postings.get(gram) for gram in _grams(needle)]
+            if any(postings is None for postings in gram_postings):
+                return []
+            candidates: Iterable[str] = min(gram_postings, key=len)
+            matches = [
+                entry for entry in (self._entries[jid] for jid in candidates)
+                if any(needle in field for field in entry.haystack)
+            ]
+        matches.sort(key=lambda entry: entry.sort_key)
+        return matches[:limit]
+
+    def list(self, limit: int = 100) -> List[ContactEntry]:
+        """The first limit contacts in display-name order."""
+        self.refresh()
+        with self._lock:
+            return self._ordered[:limit]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "contacts": len(self._entries),
+                "grams": len(self._postings),
+                "reloads": self.reloads,
+                "reindexed": self.reindexed,
+            }
@@ -0,0 +1,250 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Connection tuning (overridable through the environment)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', str(32 * 1024)))
+SQLITE_MAX_RETRIES = int(os.getenv('SQLITE_MAX_RETRIES', '5'))
+SQLITE_RETRY_BASE_DELAY = float(os.getenv('SQLITE_RETRY_BASE_DELAY', '0.05'))
+
+# Errors the Go bridge can cause while it holds the write lock or checkpoints the WAL
+_RETRYABLE_ERRORS = ("database is locked", "database is busy", "database table is locked", "disk i/o error")
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_all_connections: List[sqlite3.Connection] = []
+
+# Sidecar databases attached (read-only) to every pooled reader of a main database:
+# main db path -> {schema alias: sidecar path}
+_attachments: Dict[str, Dict[str, str]] = {}
+
+
+class _PooledConnection:
+    """A long-lived connection owned by a single thread."""
+
+    def __init__(self, conn: sqlite3.Connection, inode: Optional[int]):
+        self.conn = conn
+        self.inode = inode
+        self.attached: Dict[str, str] = {}
+
+
+def _file_inode(db_path: str) -> Optional[int]:
+    try:
+        return os.stat(db_path).st_ino
+    except OSError:
+        return None
+
+
+def _open(db_path: str, readonly: bool) -> sqlite3.Connection:
+    """Open and tune a new connection to db_path."""
+    if readonly:
+        uri = f"file:{db_path}?mode=ro"
+    else:
+        uri = f"file:{db_path}"
+    conn = sqlite3.connect(
+        uri,
+        uri=True,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+    )
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    with _registry_lock:
+        _all_connections.append(conn)
+    return conn
+
+
+def _discard(conn: sqlite3.Connection) -> None:
+    with _registry_lock:
+        if conn in _all_connections:
+            _all_connections.remove(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def get_connection(db_path: str, readonly: bool = True) -> sqlite3.Connection:
+    """Return this thread's pooled connection to db_path.
+
+    Connections are opened once per (thread, database, mode) and reused across
+    calls so the page cache and mmap stay warm. If the database file is replaced
+    on disk (e.g. the bridge re-created the store), the connection is reopened.
+    """
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = {}
+
+    key = (db_path, readonly)
+    inode = _file_inode(db_path)
+    pooled = pool.get(key)
+    if pooled is not None and pooled.inode != inode:
+        _discard(pooled.conn)
+        pooled = None
+
+    if pooled is None:
+        pooled = _PooledConnection(_open(db_path, readonly), inode)
+        pool[key] = pooled
+
+    wanted = _attachments.get(db_path)
+    if readonly and wanted and wanted != pooled.attached and not pooled.conn.in_transaction:
+        _sync_attachments(pooled, wanted)
+    return pooled.conn
+
+
+def _sync_attachments(pooled: _PooledConnection, wanted: Dict[str, str]) -> None:
+    for alias, path in list(pooled.attached.items()):
+        if wanted.get(alias) != path:
+            pooled.conn.execute(f"DETACH DATABASE {alias}")
+            del pooled.attached[alias]
+    for alias, path in wanted.items():
+        if alias not in pooled.attached:
+            try:
+                pooled.conn.execute(f"ATTACH DATABASE ? AS {alias}", (f"file:{path}?mode=ro",))
+                pooled.attached[alias] = path
+            except sqlite3.Error as e:
+                print(f"Could not attach {path} as {alias}: {e}")
+
+
+def register_attachment(db_path: str, alias: str, attached_path: str) -> None:
+    """Attach attached_path read-only as schema alias on every pooled reader of db_path.
+
+    Lets queries join a sidecar index (e.g. the full-text index) against the
+    main database without copying rows between connections.
+    """
+    with _registry_lock:
+        _attachments.setdefault(db_path, {})[alias] = attached_path
+
+
+def reset_connection(db_path: str, readonly: bool = True) -> None:
+    """Drop this thread's pooled connection to db_path so the next call reconnects."""
+    pool = getattr(_local, 'pool', None)
+    if not pool:
+        return
+    pooled = pool.pop((db_path, readonly), None)
+    if pooled is not None:
+        _discard(pooled.conn)
+
+
+def close_all() -> None:
+    """Close every pooled connection in every thread (used on shutdown)."""
+    with _registry_lock:
+        connections = list(_all_connections)
+        _all_connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def _is_retryable(error: sqlite3.Error) -> bool:
+    message = str(error).lower()
+    return any(text in message for text in _RETRYABLE_ERRORS)
+
+
+def run_with_retry(db_path: str, operation: Callable[[sqlite3.Connection], Any], readonly: bool = True) -> Any:
+    """Run operation(conn) on the pooled connection, retrying while the bridge holds a lock.
+
+    busy_timeout already waits for most writer locks; the retry loop covers the
+    cases SQLite reports immediately (WAL checkpoint/recovery, schema changes)
+    with jittered exponential backoff.
+    """
+    attempt = 0
+    while True:
+        conn = get_connection(db_path, readonly)
+        try:
+            return operation(conn)
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if attempt >= SQLITE_MAX_RETRIES or not _is_retryable(e):
+                raise
+            if "disk i/o error" in str(e).lower():
+                reset_connection(db_path, readonly)
+            delay = SQLITE_RETRY_BASE_DELAY * (2 ** attempt)
+            time.sleep(delay + random.uniform(0, delay))
+            attempt += 1
+
+
+def fetchone(db_path: str, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+    """Run a read query and return the first row."""
+    return run_with_retry(db_path, lambda conn: conn.execute(sql, params).fetchone())
+
+
+def fetchall(db_path: str, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    """Run a read query and return all rows."""
+    return run_with_retry(db_path, lambda conn: conn.execute(sql, params).fetchall())
+
+
+def read_transaction(db_path: str, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+    """Run operation(conn) inside one read transaction so all its queries see the same snapshot."""
+    def transaction(conn: sqlite3.Connection) -> Any:
+        conn.execute("BEGIN")
+        try:
+            return operation(conn)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+    return run_with_retry(db_path, transaction)
+
+
+def execute_write(db_path: str, sql: str, params: Sequence[Any] = ()) -> int:
+    """Run a write statement in its own transaction and return the affected row count."""
+    def operation(conn: sqlite3.Connection) -> int:
+        with conn:
+            return conn.execute(sql, params).rowcount
+    return run_with_retry(db_path, operation, readonly=False)
+
+
+class DataVersionWatcher:
+    """Detect commits made to a database by other connections (e.g. the Go bridge).
+
+    PRAGMA data_version is only comparable on the same connection, so each
+    watcher keeps its own dedicated read-only connection.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._inode: Optional[int] = None
+        self._last_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def poll(self) -> bool:
+        """Return True if the database changed since the previous poll (always True on the first)."""
+        with self._lock:
+            inode = _file_inode(self.db_path)
+            if self._conn is not None and inode != self._inode:
+                _discard(self._conn)
+                self._conn = None
+                self._last_version = None
+            if self._conn is None:
+                self._conn = _open(self.db_path, readonly=True)
+                self._inode = inode
+            try:
+                version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                _discard(self._conn)
+                self._conn = None
+                self._last_version = None
+                return True
+            changed = version != self._last_version
+            self._last_version = version
+            return changed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                _discard(self._conn)
+                self._conn = None
+                self._last_version = None
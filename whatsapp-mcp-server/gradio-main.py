@@ -1,20 +1,38 @@
 import os
+import json
 import logging
+from typing import Dict, List, Optional
 import gradio as gr
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+from concurrency import (
+    RESOURCE_AUDIO,
+    RESOURCE_DB,
+    run_blocking,
+    stats as concurrency_stats
+)
+import serialization
 from whatsapp import (
+    BATCH_SEND_CONCURRENCY,
+    BATCH_SEND_MAX_ITEMS,
+    BATCH_SEND_RATE,
+    MEDIA_BATCH_CONCURRENCY,
+    MEDIA_BATCH_MAX_ITEMS,
     search_contacts as whatsapp_search_contacts,
-    list_messages as whatsapp_list_messages,
-    list_chats as whatsapp_list_chats,
+    list_messages_page as whatsapp_list_messages_page,
+    list_chats_page as whatsapp_list_chats_page,
     get_chat as whatsapp_get_chat,
     get_direct_chat_by_contact as whatsapp_get_direct_chat_by_contact,
-    get_contact_chats as whatsapp_get_contact_chats,
+    get_contact_chats_page as whatsapp_get_contact_chats_page,
     get_last_interaction as whatsapp_get_last_interaction,
     get_message_context as whatsapp_get_message_context,
-    send_message as whatsapp_send_message,
-    send_file as whatsapp_send_file,
+    get_changes_async as whatsapp_get_changes,
+    send_message_async as whatsapp_send_message,
+    send_file_async as whatsapp_send_file,
+    send_messages_batch_async as whatsapp_send_messages_batch,
     send_audio_message as whatsapp_audio_voice_message,
-    download_media as whatsapp_download_media,
+    download_media_async as whatsapp_download_media,
+    download_media_batch_async as whatsapp_download_media_batch,
+    find_media_messages as whatsapp_find_media_messages,
     get_contact_by_jid as whatsapp_get_contact_by_jid,
     get_contact_by_phone as whatsapp_get_contact_by_phone,
     list_all_contacts as whatsapp_list_all_contacts,
@@ -22,7 +40,9 @@ from whatsapp import (
     set_contact_nickname as whatsapp_set_contact_nickname,
     get_contact_nickname as whatsapp_get_contact_nickname,
     remove_contact_nickname as whatsapp_remove_contact_nickname,
-    list_contact_nicknames as whatsapp_list_contact_nicknames
+    list_contact_nicknames as whatsapp_list_contact_nicknames,
+    get_store_stats as whatsapp_get_store_stats,
+    start_background_services as whatsapp_start_background_services
 )
 
 # Configure logging
@@ -39,20 +59,36 @@ mcp = FastMCP(
     
 )
 
+def _respond(value, format: str = "", default: Optional[str] = None) -> str:
+    """Render a tool result as compact JSON, columnar JSON or text (see serialization.py)."""
+    return serialization.dumps(value, serialization.resolve_format(format, default))
+
+def _status(result: Dict) -> str:
+    """Render a success/message reply; these are always compact JSON."""
+    return serialization.dumps(result, serialization.FORMAT_JSON)
+
+def _respond_page(items, next_cursor, format: str = "", default: Optional[str] = None) -> str:
+    """Render a page of a listing plus the cursor for the next page, if there is one."""
+    return serialization.dumps_page(items, next_cursor, serialization.resolve_format(format, default))
+
 # Define MCP tools (these will be exposed through both MCP and Gradio)
+# Tools are async so the SSE event loop keeps serving other sessions: SQLite
+# and ffmpeg work runs on per-resource worker pools, bridge calls use the
+# async HTTP client.
 
 @mcp.tool()
-def search_contacts(query: str) -> str:
+async def search_contacts(query: str, format: str = "") -> str:
     """Search WhatsApp contacts by name or phone number.
     
     Parameters:
     - query: Search term to match against contact names or phone numbers
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
-    contacts = whatsapp_search_contacts(query)
-    return str(contacts)
+    contacts = await run_blocking(RESOURCE_DB, whatsapp_search_contacts, query)
+    return _respond(contacts, format)
 
 @mcp.tool()
-def list_messages(
+async def list_messages(
     after: str = "",
     before: str = "",
     sender_phone_number: str = "",
@@ -62,7 +98,10 @@ def list_messages(
     page: int = 0,
     include_context: bool = True,
     context_before: int = 1,
-    context_after: int = 1
+    context_after: int = 1,
+    sort_by: str = "timestamp",
+    cursor: str = "",
+    format: str = ""
 ) -> str:
     """Get WhatsApp messages matching specified criteria with optional context.
     
@@ -71,13 +110,17 @@ def list_messages(
     - before: ISO-8601 formatted date string to only return messages before this date (optional, leave empty if not needed)
     - sender_phone_number: Phone number to filter messages by sender (optional, leave empty if not needed)
     - chat_jid: Chat JID to filter messages by chat (optional, leave empty if not needed)
-    - query: Search term to filter messages by content (optional, leave empty if not needed)
+    - query: Search terms to filter messages by content. Words match by prefix, use "double quotes" for an exact phrase (optional, leave empty if not needed)
     - limit: Maximum number of messages to return (default: 20)
     - page: Page number for pagination (default: 0)
     - include_context: Whether to include messages before and after matches (default: true)
     - context_before: Number of messages to include before each match (default: 1)
     - context_after: Number of messages to include after each match (default: 1)
+    - sort_by: "timestamp" for newest first, or "relevance" to rank query matches by relevance (default: "timestamp")
+    - cursor: "Next cursor" value from the previous call to fetch the following page; preferred over page for paging through long histories (optional, leave empty if not needed)
+    - format: Response format: "text" (readable transcript), "json" (structured) or "columns" (lists as {"columns": [...], "rows": [[...]]}) (default: "text")
     """
+    response_format = serialization.resolve_format(format, serialization.FORMAT_TEXT)
     # Convert empty strings to None for internal processing
     after_param = after if after else None
     before_param = before if before else None
@@ -85,7 +128,8 @@ def list_messages(
     chat_param = chat_jid if chat_jid else None
     query_param = query if query else None
     
-    messages = whatsapp_list_messages(
+    messages, next_cursor = await run_blocking(
+        RESOURCE_DB, whatsapp_list_messages_page,
         after=after_param,
         before=before_param,
         sender_phone_number=sender_param,
@@ -95,17 +139,22 @@ def list_messages(
         page=page,
         include_context=include_context,
         context_before=context_before,
-        context_after=context_after
+        context_after=context_after,
+        sort_by=sort_by,
+        cursor=cursor if cursor else None,
+        formatted=response_format == serialization.FORMAT_TEXT
     )
-    return str(messages)
+    return serialization.dumps_page(messages, next_cursor, response_format)
 
 @mcp.tool()
-def list_chats(
+async def list_chats(
     query: str = "",
     limit: int = 20,
     page: int = 0,
     include_last_message: bool = True,
-    sort_by: str = "last_active"
+    sort_by: str = "last_active",
+    cursor: str = "",
+    format: str = ""
 ) -> str:
     """Get WhatsApp chats matching specified criteria.
     
@@ -115,67 +164,81 @@ def list_chats(
     - page: Page number for pagination (default: 0)
     - include_last_message: Whether to include the last message in each chat (default: true)
     - sort_by: Field to sort results by, either "last_active" or "name" (default: "last_active")
+    - cursor: "Next cursor" value from the previous call to fetch the following page (optional, leave empty if not needed)
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
     # Convert empty string to None for internal processing
     query_param = query if query else None
     
-    chats = whatsapp_list_chats(
+    chats, next_cursor = await run_blocking(
+        RESOURCE_DB, whatsapp_list_chats_page,
         query=query_param,
         limit=limit,
         page=page,
         include_last_message=include_last_message,
-        sort_by=sort_by
+        sort_by=sort_by,
+        cursor=cursor if cursor else None
     )
-    return str(chats)
+    return _respond_page(chats, next_cursor, format)
 
 @mcp.tool()
-def get_chat(chat_jid: str, include_last_message: bool = True) -> str:
+async def get_chat(chat_jid: str, include_last_message: bool = True, format: str = "") -> str:
     """Get WhatsApp chat metadata by JID.
     
     Parameters:
     - chat_jid: The JID of the chat to retrieve
     - include_last_message: Whether to include the last message (default: true)
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
-    chat = whatsapp_get_chat(chat_jid, include_last_message)
-    return str(chat)
+    chat = await run_blocking(RESOURCE_DB, whatsapp_get_chat, chat_jid, include_last_message)
+    return _respond(chat, format)
 
 @mcp.tool()
-def get_direct_chat_by_contact(sender_phone_number: str) -> str:
+async def get_direct_chat_by_contact(sender_phone_number: str, format: str = "") -> str:
     """Get WhatsApp chat metadata by sender phone number.
     
     Parameters:
     - sender_phone_number: The phone number to search for
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
-    chat = whatsapp_get_direct_chat_by_contact(sender_phone_number)
-    return str(chat)
+    chat = await run_blocking(RESOURCE_DB, whatsapp_get_direct_chat_by_contact, sender_phone_number)
+    return _respond(chat, format)
 
 @mcp.tool()
-def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> str:
+async def get_contact_chats(jid: str, limit: int = 20, page: int = 0, cursor: str = "", format: str = "") -> str:
     """Get all WhatsApp chats involving the contact.
     
     Parameters:
     - jid: The contact's JID to search for
     - limit: Maximum number of chats to return (default: 20)
     - page: Page number for pagination (default: 0)
+    - cursor: "Next cursor" value from the previous call to fetch the following page (optional, leave empty if not needed)
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
-    chats = whatsapp_get_contact_chats(jid, limit, page)
-    return str(chats)
+    chats, next_cursor = await run_blocking(RESOURCE_DB, whatsapp_get_contact_chats_page, jid, limit, page, cursor if cursor else None)
+    return _respond_page(chats, next_cursor, format)
 
 @mcp.tool()
-def get_last_interaction(jid: str) -> str:
+async def get_last_interaction(jid: str, format: str = "") -> str:
     """Get most recent WhatsApp message involving the contact.
     
     Parameters:
     - jid: The JID of the contact to search for
+    - format: Response format: "text" (readable transcript), "json" (structured) or "columns" (lists as {"columns": [...], "rows": [[...]]}) (default: "text")
     """
-    message = whatsapp_get_last_interaction(jid)
-    return message
+    response_format = serialization.resolve_format(format, serialization.FORMAT_TEXT)
+    message = await run_blocking(
+        RESOURCE_DB, whatsapp_get_last_interaction, jid,
+        formatted=response_format == serialization.FORMAT_TEXT
+    )
+    return serialization.dumps(message, response_format)
 
 @mcp.tool()
-def get_message_context(
+async def get_message_context(
     message_id: str,
     before: int = 5,
-    after: int = 5
+    after: int = 5,
+    format: str = ""
 ) -> str:
     """Get context around a specific WhatsApp message.
     
@@ -183,12 +246,61 @@ def get_message_context(
     - message_id: The ID of the message to get context for
     - before: Number of messages to include before the target message (default: 5)
     - after: Number of messages to include after the target message (default: 5)
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
-    context = whatsapp_get_message_context(message_id, before, after)
-    return str(context)
+    context = await run_blocking(RESOURCE_DB, whatsapp_get_message_context, message_id, before, after)
+    return _respond(context, format)
 
 @mcp.tool()
-def send_message(
+async def get_changes(
+    watermark: str = "",
+    chat_jids: Optional[List[str]] = None,
+    limit: int = 100,
+    wait_seconds: float = 0,
+    format: str = ""
+) -> str:
+    """Get WhatsApp messages stored since the previous call, oldest first. Use this to watch for new messages instead of re-running list_messages.
+    
+    Call it first without a watermark to get the current position, then pass the returned watermark back on every call. Edited messages show up again.
+    
+    Parameters:
+    - watermark: "watermark" value from the previous call (optional; empty starts from now and returns no messages)
+    - chat_jids: Only return messages from these chats (optional, leave empty for all chats)
+    - limit: Maximum number of messages to return; "has_more" is true if more are waiting (default: 100)
+    - wait_seconds: If nothing is new, wait up to this many seconds for a message to arrive before returning (default: 0, at most 60)
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
+    """
+    response_format = serialization.resolve_format(format)
+    try:
+        result = await whatsapp_get_changes(
+            watermark or None,
+            chat_jids or None,
+            limit=limit,
+            wait_seconds=wait_seconds,
+            formatted=response_format == serialization.FORMAT_TEXT
+        )
+    except ValueError as e:
+        return _status({"success": False, "message": str(e)})
+    if response_format == serialization.FORMAT_TEXT:
+        more = "\nMore messages are waiting." if result["has_more"] else ""
+        return f"{result['messages']}{more}\nWatermark: {result['watermark']}"
+    return serialization.dumps(result, response_format)
+
+@mcp.tool()
+async def get_store_stats(format: str = "") -> str:
+    """Get WhatsApp store statistics: message/chat/contact counts, database and WAL file sizes, the busiest chats, index status, name-cache hit rates and tool worker pool usage.
+    
+    Database figures are refreshed in the background and may be up to a minute old.
+
+    Parameters:
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
+    """
+    result = await run_blocking(RESOURCE_DB, whatsapp_get_store_stats)
+    result["worker_pools"] = concurrency_stats()
+    return _respond(result, format)
+
+@mcp.tool()
+async def send_message(
     recipient: str,
     message: str
 ) -> str:
@@ -200,21 +312,66 @@ def send_message(
     """
     # Validate input
     if not recipient:
-        return str({
+        return _status({
             "success": False,
             "message": "Recipient must be provided"
         })
     
     # Call the whatsapp_send_message function with the unified recipient parameter
-    success, status_message = whatsapp_send_message(recipient, message)
+    success, status_message = await whatsapp_send_message(recipient, message)
     result = {
         "success": success,
         "message": status_message
     }
-    return str(result)
+    return _status(result)
 
 @mcp.tool()
-def send_file(recipient: str, media_path: str) -> str:
+async def send_messages_batch(
+    recipients: Optional[List[str]] = None,
+    message: str = "",
+    items: Optional[List[Dict[str, str]]] = None,
+    concurrency: int = 0,
+    rate_per_second: float = 0,
+    format: str = "",
+    ctx: Context = None
+) -> str:
+    """Send WhatsApp messages to many recipients in one call, e.g. for announcements. Reports progress and returns a per-recipient result.
+
+    Parameters:
+    - recipients: Phone numbers or JIDs that should all get the same message (optional if items is given)
+    - message: The text to send to every entry in recipients
+    - items: Individual sends, each {"recipient": ..., "message": ...} for text or {"recipient": ..., "media_path": ...} for a file (optional if recipients is given)
+    - concurrency: Maximum sends in flight at once (default: server setting, usually 4)
+    - rate_per_second: Maximum sends started per second (default: server setting, usually 2)
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
+    """
+    batch = [{"recipient": recipient, "message": message} for recipient in recipients or []] + list(items or [])
+    if not batch:
+        return _status({
+            "success": False,
+            "message": "Provide recipients with a message, or items"
+        })
+    if len(batch) > BATCH_SEND_MAX_ITEMS:
+        return _status({
+            "success": False,
+            "message": f"At most {BATCH_SEND_MAX_ITEMS} sends per batch, got {len(batch)}"
+        })
+
+    async def on_progress(done: int, total: int) -> None:
+        if ctx is not None:
+            await ctx.report_progress(done, total)
+
+    result = await whatsapp_send_messages_batch(
+        batch,
+        concurrency=concurrency if concurrency > 0 else BATCH_SEND_CONCURRENCY,
+        rate_per_second=rate_per_second if rate_per_second > 0 else BATCH_SEND_RATE,
+        on_progress=on_progress
+    )
+    result["success"] = result["failed"] == 0
+    return _respond(result, format)
+
+@mcp.tool()
+async def send_file(recipient: str, media_path: str) -> str:
     """Send a file such as a picture, raw audio, video or document via WhatsApp to the specified recipient. For group messages use the JID.
     
     Parameters:
@@ -222,37 +379,37 @@ def send_file(recipient: str, media_path: str) -> str:
     - media_path: The absolute path to the media file to send (image, video, document)
     """
     # Call the whatsapp_send_file function
-    success, status_message = whatsapp_send_file(recipient, media_path)
+    success, status_message = await whatsapp_send_file(recipient, media_path)
     result = {
         "success": success,
         "message": status_message
     }
-    return str(result)
+    return _status(result)
 
 @mcp.tool()
-def send_audio_message(recipient: str, media_path: str) -> str:
+async def send_audio_message(recipient: str, media_path: str) -> str:
     """Send any audio file as a WhatsApp audio message to the specified recipient. For group messages use the JID. If it errors due to ffmpeg not being installed, use send_file instead.
     
     Parameters:
     - recipient: The recipient - either a phone number with country code but no + or other symbols, or a JID (e.g., "123456789@s.whatsapp.net" or a group JID like "123456789@g.us")
     - media_path: The absolute path to the audio file to send (will be converted to Opus .ogg if it's not a .ogg file)
     """
-    success, status_message = whatsapp_audio_voice_message(recipient, media_path)
+    success, status_message = await run_blocking(RESOURCE_AUDIO, whatsapp_audio_voice_message, recipient, media_path)
     result = {
         "success": success,
         "message": status_message
     }
-    return str(result)
+    return _status(result)
 
 @mcp.tool()
-def download_media(message_id: str, chat_jid: str) -> str:
+async def download_media(message_id: str, chat_jid: str) -> str:
     """Download media from a WhatsApp message and get the local file path.
     
     Parameters:
     - message_id: The ID of the message containing the media
     - chat_jid: The JID of the chat containing the message
     """
-    file_path = whatsapp_download_media(message_id, chat_jid)
+    file_path = await whatsapp_download_media(message_id, chat_jid)
     
     if file_path:
         result = {
@@ -265,16 +422,74 @@ def download_media(message_id: str, chat_jid: str) -> str:
             "success": False,
             "message": "Failed to download media"
         }
-    return str(result)
+    return _status(result)
+
+@mcp.tool()
+async def download_media_batch(
+    chat_jid: str,
+    message_ids: Optional[List[str]] = None,
+    media_type: str = "",
+    after: str = "",
+    before: str = "",
+    limit: int = 50,
+    concurrency: int = 0,
+    format: str = "",
+    ctx: Context = None
+) -> str:
+    """Download the media of many messages in a chat in one call, e.g. all images. Media downloaded before is returned without fetching it again. Reports progress and returns the path and size of every file.
+
+    Parameters:
+    - chat_jid: The JID of the chat containing the messages
+    - message_ids: IDs of the messages to download (optional; if empty, the filters below select the chat's newest media)
+    - media_type: Only download this type, e.g. "image", "video", "audio" or "document" (optional, leave empty if not needed)
+    - after: ISO-8601 formatted date string to only download media sent after this date (optional, leave empty if not needed)
+    - before: ISO-8601 formatted date string to only download media sent before this date (optional, leave empty if not needed)
+    - limit: Maximum number of files to download (default: 50)
+    - concurrency: Maximum downloads in flight at once (default: server setting, usually 4)
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
+    """
+    message_ids = message_ids or []
+    if len(message_ids) > MEDIA_BATCH_MAX_ITEMS or limit > MEDIA_BATCH_MAX_ITEMS:
+        return _status({
+            "success": False,
+            "message": f"At most {MEDIA_BATCH_MAX_ITEMS} downloads per batch"
+        })
+    try:
+        candidates = await run_blocking(
+            RESOURCE_DB, whatsapp_find_media_messages,
+            chat_jid,
+            message_ids=message_ids or None,
+            media_type=media_type or None,
+            after=after or None,
+            before=before or None,
+            limit=max(1, limit)
+        )
+    except ValueError as e:
+        return _status({"success": False, "message": str(e)})
+    if not candidates:
+        return _status({"success": False, "message": "No media messages found"})
+
+    async def on_progress(done: int, total: int) -> None:
+        if ctx is not None:
+            await ctx.report_progress(done, total)
+
+    result = await whatsapp_download_media_batch(
+        candidates,
+        concurrency=concurrency if concurrency > 0 else MEDIA_BATCH_CONCURRENCY,
+        on_progress=on_progress
+    )
+    result["success"] = result["failed"] == 0
+    return _respond(result, format)
 
 @mcp.tool()
-def get_contact_details(chat_jid: str) -> str:
+async def get_contact_details(chat_jid: str, format: str = "") -> str:
     """Get detailed contact information for a chat.
     
     Parameters:
     - chat_jid: The JID of the chat to get details for
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
-    contact_details = whatsapp_get_contact_by_jid(chat_jid)
+    contact_details = await run_blocking(RESOURCE_DB, whatsapp_get_contact_by_jid, chat_jid)
     
     if contact_details:
         result = {
@@ -286,93 +501,81 @@ def get_contact_details(chat_jid: str) -> str:
             "success": False,
             "message": "Contact not found"
         }
-    return str(result)
+    return _respond(result, format)
 
 
 @mcp.tool()
-def list_all_contacts(limit: str = "100") -> str:
+async def list_all_contacts(limit: str = "100", format: str = "") -> str:
     """Get all contacts with their detailed information.
     
     Parameters:
     - limit: Maximum number of contacts to return
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
     limit_int = int(limit) if limit else 100
-    contacts = whatsapp_list_all_contacts(limit_int)
-    result = [
-        {
-            "phone_number": contact.phone_number,
-            "name": contact.name,
-            "jid": contact.jid,
-            "first_name": contact.first_name,
-            "full_name": contact.full_name,
-            "push_name": contact.push_name,
-            "business_name": contact.business_name,
-            "nickname": contact.nickname
-        }
-        for contact in contacts
-    ]
-    return str(result)
+    contacts = await run_blocking(RESOURCE_DB, whatsapp_list_all_contacts, limit_int)
+    return _respond(contacts, format)
 
 
 @mcp.tool()
-def set_contact_nickname(jid: str, nickname: str) -> str:
+async def set_contact_nickname(jid: str, nickname: str) -> str:
     """Set a custom nickname for a contact.
     
     Parameters:
     - jid: WhatsApp JID of the contact
     - nickname: Custom nickname to set for the contact
     """
-    success, message = whatsapp_set_contact_nickname(jid, nickname)
+    success, message = await run_blocking(RESOURCE_DB, whatsapp_set_contact_nickname, jid, nickname)
     result = {"success": success, "message": message}
-    return str(result)
+    return _status(result)
 
 
 @mcp.tool()
-def get_contact_nickname(jid: str) -> str:
+async def get_contact_nickname(jid: str) -> str:
     """Get a contact's custom nickname.
     
     Parameters:
     - jid: WhatsApp JID of the contact
     """
-    nickname = whatsapp_get_contact_nickname(jid)
+    nickname = await run_blocking(RESOURCE_DB, whatsapp_get_contact_nickname, jid)
     result = {"jid": jid, "nickname": nickname}
-    return str(result)
+    return _status(result)
 
 
 @mcp.tool()
-def remove_contact_nickname(jid: str) -> str:
+async def remove_contact_nickname(jid: str) -> str:
     """Remove a contact's custom nickname.
     
     Parameters:
     - jid: WhatsApp JID of the contact
     """
-    success, message = whatsapp_remove_contact_nickname(jid)
+    success, message = await run_blocking(RESOURCE_DB, whatsapp_remove_contact_nickname, jid)
     result = {"success": success, "message": message}
-    return str(result)
+    return _status(result)
 
 
 @mcp.tool()
-def list_contact_nicknames() -> str:
+async def list_contact_nicknames(format: str = "") -> str:
     """List all custom contact nicknames.
     
     Parameters:
-    None required
+    - format: Response format: "json" (compact), "columns" (lists as {"columns": [...], "rows": [[...]]}, fewest tokens) or "text" (default: "json")
     """
-    nicknames = whatsapp_list_contact_nicknames()
+    nicknames = await run_blocking(RESOURCE_DB, whatsapp_list_contact_nicknames)
     result = [{"jid": jid, "nickname": nickname} for jid, nickname in nicknames]
-    return str(result)
+    return _respond(result, format)
 
 # Gradio UI functions (these wrap the MCP tools for use with the Gradio UI)
 
-def gradio_search_contacts(query):
-    contacts = search_contacts(query)
+async def gradio_search_contacts(query):
+    contacts = await search_contacts(query)
     if contacts:
         return gr.update(value=str(contacts), visible=True)
     else:
         return gr.update(value="No contacts found", visible=True)
 
-def gradio_list_chats(query, limit, include_last_message, sort_by):
-    chats = list_chats(
+async def gradio_list_chats(query, limit, include_last_message, sort_by):
+    chats = await list_chats(
         query=query if query else None, 
         limit=int(limit), 
         page=0,
@@ -384,8 +587,8 @@ def gradio_list_chats(query, limit, include_last_message, sort_by):
     else:
         return gr.update(value="No chats found", visible=True)
 
-def gradio_list_messages(chat_jid, query, limit):
-    messages = list_messages(
+async def gradio_list_messages(chat_jid, query, limit):
+    messages = await list_messages(
         chat_jid=chat_jid if chat_jid else None,
         query=query if query else None,
         limit=int(limit),
@@ -396,35 +599,38 @@ def gradio_list_messages(chat_jid, query, limit):
     else:
         return gr.update(value="No messages found", visible=True)
 
-def gradio_send_message(recipient, message):
-    result = send_message(recipient, message)
+async def gradio_send_message(recipient, message):
+    result = json.loads(await send_message(recipient, message))
     return f"Status: {result['success']}, Message: {result['message']}"
 
-def gradio_send_file(recipient, file):
-    result = send_file(recipient, file.name)
+async def gradio_send_file(recipient, file):
+    result = json.loads(await send_file(recipient, file.name))
     return f"Status: {result['success']}, Message: {result['message']}"
 
-def gradio_send_audio(recipient, file):
-    result = send_audio_message(recipient, file.name)
+async def gradio_send_audio(recipient, file):
+    # Gradio has already written the upload to disk, so send it by path: that
+    # lets prepare_voice_note pass through or remux Opus and lets ffmpeg seek
+    # in containers like M4A
+    result = json.loads(await send_audio_message(recipient, file.name))
     return f"Status: {result['success']}, Message: {result['message']}"
 
 # Gradio wrapper functions for contact management
 
-def gradio_get_contact_details(jid, phone_number):
+async def gradio_get_contact_details(jid, phone_number):
     """Gradio wrapper for get_contact_details"""
     if not jid and not phone_number:
         return "Error: Either JID or phone number must be provided"
     
-    result = get_contact_details(jid=jid if jid else None, phone_number=phone_number if phone_number else None)
+    result = await get_contact_details(jid=jid if jid else None, phone_number=phone_number if phone_number else None)
     
     if "error" in result:
         return result["error"]
     else:
         return result["formatted_info"]
 
-def gradio_list_all_contacts(limit):
+async def gradio_list_all_contacts(limit):
     """Gradio wrapper for list_all_contacts"""
-    contacts = list_all_contacts(limit=int(limit))
+    contacts = json.loads(await list_all_contacts(limit=str(int(limit)), format=serialization.FORMAT_JSON))
     
     if contacts:
         formatted_contacts = []
@@ -442,20 +648,20 @@ def gradio_list_all_contacts(limit):
     else:
         return "No contacts found"
 
-def gradio_set_contact_nickname(jid, nickname):
+async def gradio_set_contact_nickname(jid, nickname):
     """Gradio wrapper for set_contact_nickname"""
     if not jid or not nickname:
         return "Error: Both JID and nickname must be provided"
     
-    result = set_contact_nickname(jid, nickname)
+    result = json.loads(await set_contact_nickname(jid, nickname))
     return f"Status: {result['success']}, Message: {result['message']}"
 
-def gradio_get_contact_nickname(jid):
+async def gradio_get_contact_nickname(jid):
     """Gradio wrapper for get_contact_nickname"""
     if not jid:
         return "Error: JID must be provided"
     
-    result = get_contact_nickname(jid)
+    result = json.loads(await get_contact_nickname(jid))
     nickname = result.get('nickname')
     
     if nickname:
@@ -463,17 +669,17 @@ def gradio_get_contact_nickname(jid):
     else:
         return f"No nickname set for {jid}"
 
-def gradio_remove_contact_nickname(jid):
+async def gradio_remove_contact_nickname(jid):
     """Gradio wrapper for remove_contact_nickname"""
     if not jid:
         return "Error: JID must be provided"
     
-    result = remove_contact_nickname(jid)
+    result = json.loads(await remove_contact_nickname(jid))
     return f"Status: {result['success']}, Message: {result['message']}"
 
-def gradio_list_contact_nicknames():
+async def gradio_list_contact_nicknames():
     """Gradio wrapper for list_contact_nicknames"""
-    nicknames = list_contact_nicknames()
+    nicknames = json.loads(await list_contact_nicknames(format=serialization.FORMAT_JSON))
     
     if nicknames:
         formatted_nicknames = []
@@ -668,6 +874,9 @@ if __name__ == "__main__":
     # Check if Gradio should be enabled (default: True for backward compatibility)
     enable_gradio = os.environ.get('GRADIO', 'true').lower() in ('true', '1', 'yes', 'on')
     
+    # Build/refresh sidecar indexes in the background so first queries don't pay for it
+    whatsapp_start_background_services()
+    
     if enable_gradio:
         # Start MCP server in a separate thread
         import threading
@@ -0,0 +1,268 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import db
+from sidecar import SIDECAR_DIR
+
+# Downloaded media is kept here under its content hash. Like the bridge's own
+# downloads, the directory must be readable by whoever opens the returned paths.
+MEDIA_STORE_DIR = os.getenv('MEDIA_STORE_DIR', os.path.join(SIDECAR_DIR, 'media'))
+MEDIA_STORE_MAX_BYTES = int(os.getenv('MEDIA_STORE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+# Where the bridge sees MEDIA_STORE_DIR when it mounts the shared volume at
+# another path (e.g. /app/whatsapp-bridge/store/mcp/media). Returned paths
+# use it, so they can be handed back to the bridge like its own downloads.
+MEDIA_STORE_BRIDGE_DIR = os.getenv('MEDIA_STORE_BRIDGE_DIR', '')
+
+_PARTIAL_SUFFIX = ".partial"
+
+
+def file_sha256(path: str) -> str:
+    """Hex SHA-256 of a file's content."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class MediaStore:
+    """Content-addressed cache of downloaded media.
+
+    Files are stored once per SHA-256 of their decrypted content, which is what
+    the bridge records in messages.file_sha256, so forwarded copies of the same
+    image or document share one entry. message_media maps (id, chat_jid) to the
+    content hash it resolved to; media_blobs tracks each stored file's size and
+    last use for the least-recently-used eviction that keeps the store under
+    MEDIA_STORE_MAX_BYTES. Files are copied in rather than hard-linked, so
+    evicting one frees its disk space even while the bridge keeps its download.
+    """
+
+    def __init__(self, directory: str = MEDIA_STORE_DIR, max_bytes: int = MEDIA_STORE_MAX_BYTES,
+                 bridge_directory: str = MEDIA_STORE_BRIDGE_DIR):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bridge_directory = bridge_directory
+        self.index_path = os.path.join(directory, "media_index.db")
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._stats = {"message_hits": 0, "content_hits": 0, "misses": 0, "stored": 0, "evictions": 0}
+
+    # -- storage ------------------------------------------------------------
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection to the index, creating it on first use."""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(self.directory, exist_ok=True)
+                    conn = db.get_connection(self.index_path, readonly=False)
+                    conn.execute("PRAGMA journal_mode = WAL")
+                    conn.execute("PRAGMA synchronous = NORMAL")
+                    with conn:
+                        conn.execute("""
+                            CREATE TABLE IF NOT EXISTS media_blobs (
+                                sha256 TEXT PRIMARY KEY,
+                                path TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                last_used REAL NOT NULL
+                            )
+                        """)
+                        conn.execute("CREATE INDEX IF NOT EXISTS idx_media_blobs_last_used ON media_blobs (last_used)")
+                        conn.execute("""
+                            CREATE TABLE IF NOT EXISTS message_media (
+                                id TEXT NOT NULL,
+                                chat_jid TEXT NOT NULL,
+                                sha256 TEXT NOT NULL,
+                                PRIMARY KEY (id, chat_jid)
+                            )
+                        """)
+                        conn.execute("""
+                            CREATE TABLE IF NOT EXISTS media_meta (
+                                key TEXT PRIMARY KEY,
+                                value INTEGER NOT NULL
+                            )
+                        """)
+                    self._initialized = True
+        return db.get_connection(self.index_path, readonly=False)
+
+    def _count(self, counter: str, delta: int = 1) -> None:
+        with self._locks_lock:
+            self._stats[counter] += delta
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def bridge_path(self, path: str) -> str:
+        """path as the bridge sees it (unchanged unless bridge_directory is set)."""
+        if not self.bridge_directory:
+            return path
+        return os.path.join(self.bridge_directory, os.path.relpath(path, self.directory))
+
+    def _blob_path(self, sha256: str) -> Optional[str]:
+        """Path of the stored file for sha256, touching its LRU position; None if absent."""
+        conn = self.connection()
+        row = conn.execute("SELECT path, size FROM media_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None:
+            return None
+        path, size = row
+        try:
+            present = os.path.getsize(path) == size
+        except OSError:
+            present = False
+        with conn:
+            if not present:
+                # Removed or truncated behind our back
+                conn.execute("DELETE FROM media_blobs WHERE sha256 = ?", (sha256,))
+                return None
+            conn.execute("UPDATE media_blobs SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+        return path
+
+    def get_meta(self, key: str) -> Optional[int]:
+        row = self.connection().execute("SELECT value FROM media_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: int) -> None:
+        with self.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO media_meta (key, value) VALUES (?, ?)", (key, value))
+
+    # -- lookups and ingest ---------------------------------------------------
+
+    def has_content(self, sha256: str) -> bool:
+        """Whether a file with this content hash is stored (without counting a hit or miss)."""
+        row = self.connection().execute("SELECT 1 FROM media_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        return row is not None
+
+    def lookup(self, message_id: str, chat_jid: str, expected_sha256: Optional[str] = None) -> Optional[str]:
+        """Return the bridge-visible path of a stored copy of a message's media, or None if it has to be downloaded.
+
+        The message's own earlier download is found through message_media; any
+        other message with the same content (e.g. a forward) is found through
+        expected_sha256, the hex file_sha256 the bridge recorded for it.
+        """
+        row = self.connection().execute(
+            "SELECT sha256 FROM message_media WHERE id = ? AND chat_jid = ?", (message_id, chat_jid)
+        ).fetchone()
+        if row is not None:
+            path = self._blob_path(row[0])
+            if path is not None:
+                self._count("message_hits")
+                return self.bridge_path(path)
+        if expected_sha256:
+            path = self._blob_path(expected_sha256)
+            if path is not None:
+                with self.connection() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO message_media (id, chat_jid, sha256) VALUES (?, ?, ?)",
+                        (message_id, chat_jid, expected_sha256),
+                    )
+                self._count("content_hits")
+                return self.bridge_path(path)
+        self._count("misses")
+        return None
+
+    def ingest(self, message_id: str, chat_jid: str, source_path: str,
+               expected_sha256: Optional[str] = None) -> str:
+        """Copy a file the bridge downloaded into the store and return the stored copy's bridge-visible path.
+
+        The original is left in place for the bridge.
+
+        Raises:
+            OSError: If the file cannot be read or stored
+        """
+        sha256 = file_sha256(source_path)
+        if expected_sha256 and sha256 != expected_sha256:
+            print(f"Media for {message_id} in {chat_jid} hashes to {sha256}, expected {expected_sha256}")
+
+        with self._lock_for(sha256):
+            path = self._blob_path(sha256)
+            if path is None:
+                extension = os.path.splitext(source_path)[1]
+                path = os.path.join(self.directory, sha256[:2], sha256 + extension)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial = f"{path}.{uuid.uuid4().hex}{_PARTIAL_SUFFIX}"
+                try:
+                    shutil.copyfile(source_path, partial)
+                    os.replace(partial, path)
+                finally:
+                    if os.path.exists(partial):
+                        os.unlink(partial)
+                with self.connection() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO media_blobs (sha256, path, size, last_used) VALUES (?, ?, ?, ?)",
+                        (sha256, path, os.path.getsize(path), time.time()),
+                    )
+                self._count("stored")
+            with self.connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO message_media (id, chat_jid, sha256) VALUES (?, ?, ?)",
+                    (message_id, chat_jid, sha256),
+                )
+
+        self.sweep(keep=sha256)
+        return self.bridge_path(path)
+
+    # -- quota ----------------------------------------------------------------
+
+    def sweep(self, keep: Optional[str] = None) -> None:
+        """Evict least recently used files until the store fits in max_bytes.
+
+        Args:
+            keep: Content hash that must not be evicted (e.g. the file about to be returned)
+        """
+        conn = self.connection()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM media_blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT sha256, path, size FROM media_blobs ORDER BY last_used").fetchall()
+        for sha256, path, size in rows:
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep:
+                continue
+            with self._lock_for(sha256):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Could not evict {path}: {e}")
+                    continue
+                with conn:
+                    conn.execute("DELETE FROM media_blobs WHERE sha256 = ?", (sha256,))
+                    conn.execute("DELETE FROM message_media WHERE sha256 = ?", (sha256,))
+            total -= size
+            self._count("evictions")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters plus the number and total size of stored files."""
+        with self._locks_lock:
+            snapshot: Dict[str, Any] = dict(self._stats)
+        try:
+            files, size = self.connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media_blobs"
+            ).fetchone()
+            snapshot.update(files=files, size_bytes=size)
+        except (sqlite3.Error, OSError) as e:
+            snapshot["error"] = str(e)
+        snapshot.update(directory=self.directory, bridge_directory=self.bridge_directory or self.directory,
+                        max_bytes=self.max_bytes)
+        return snapshot
+
+
+_store = MediaStore()
+
+
+def get_store() -> MediaStore:
+    return _store
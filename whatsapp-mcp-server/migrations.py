@@ -0,0 +1,262 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import db
+
+MCP_AUTO_INDEX = os.getenv('MCP_AUTO_INDEX', 'true').lower() in ('true', '1', 'yes', 'on')
+# Wait for the bridge to be quiet this long before taking the write lock to build an index
+MIGRATION_QUIET_SECONDS = float(os.getenv('MIGRATION_QUIET_SECONDS', '2.0'))
+MIGRATION_MAX_WAIT_SECONDS = float(os.getenv('MIGRATION_MAX_WAIT_SECONDS', '300'))
+
+
+@dataclass
+class IndexSpec:
+    name: str
+    table: str
+    columns: Tuple[str, ...]
+
+    @property
+    def ddl(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table} ({', '.join(self.columns)})"
+
+
+@dataclass
+class QueryShape:
+    """A hot query from whatsapp.py and the index that should serve it."""
+    name: str
+    sql: str
+    params: Tuple
+    index: IndexSpec
+
+
+@dataclass
+class ShapeReport:
+    shape: str
+    index: str
+    plan_before: List[str]
+    plan_after: List[str] = field(default_factory=list)
+    created: bool = False
+    error: Optional[str] = None
+
+
+# The bridge only creates the (id, chat_jid) primary key on messages and jid on chats.
+# Each index leads with the filter column and continues with the ORDER BY key
+# (including the keyset tie-breakers) so pages come straight off the index.
+MESSAGES_CHAT_TIME = IndexSpec("idx_mcp_messages_chat_time", "messages", ("chat_jid", "timestamp", "id"))
+MESSAGES_SENDER_TIME = IndexSpec("idx_mcp_messages_sender_time", "messages", ("sender", "timestamp", "id", "chat_jid"))
+MESSAGES_TIME = IndexSpec("idx_mcp_messages_time", "messages", ("timestamp", "id", "chat_jid"))
+MESSAGES_ID = IndexSpec("idx_mcp_messages_id", "messages", ("id",))
+CHATS_LAST_TIME = IndexSpec("idx_mcp_chats_last_time", "chats", ("last_message_time", "jid"))
+
+# Indexes a fully migrated store is expected to have. MESSAGES_ID is left out:
+# the (id, chat_jid) primary key already serves lookups by id alone.
+EXPECTED_INDEXES = [MESSAGES_CHAT_TIME, MESSAGES_SENDER_TIME, MESSAGES_TIME, CHATS_LAST_TIME]
+
+# Keep in sync with the query shapes in whatsapp.py
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape(
+        "list_messages by chat",
+        """SELECT messages.id FROM messages JOIN chats ON messages.chat_jid = chats.jid
+           WHERE messages.chat_jid = ?
+           ORDER BY messages.timestamp DESC, messages.id DESC, messages.chat_jid DESC LIMIT 20""",
+        ("x",),
+        MESSAGES_CHAT_TIME,
+    ),
+    QueryShape(
+        "get_message_context neighbours",
+        """SELECT messages.id FROM messages JOIN chats ON messages.chat_jid = chats.jid
+           WHERE messages.chat_jid = ? AND messages.timestamp < ?
+           ORDER BY messages.timestamp DESC LIMIT 5""",
+        ("x", "x"),
+        MESSAGES_CHAT_TIME,
+    ),
+    QueryShape(
+        "list_messages by sender",
+        """SELECT messages.id FROM messages JOIN chats ON messages.chat_jid = chats.jid
+           WHERE messages.sender = ?
+           ORDER BY messages.timestamp DESC, messages.id DESC, messages.chat_jid DESC LIMIT 20""",
+        ("x",),
+        MESSAGES_SENDER_TIME,
+    ),
+    QueryShape(
+        "list_messages newest first",
+        """SELECT messages.id FROM messages JOIN chats ON messages.chat_jid = chats.jid
+           ORDER BY messages.timestamp DESC, messages.id DESC, messages.chat_jid DESC LIMIT 20""",
+        (),
+        MESSAGES_TIME,
+    ),
+    QueryShape(
+        "get_message_context target by id",
+        """SELECT messages.id FROM messages JOIN chats ON messages.chat_jid = chats.jid
+           WHERE messages.id = ?""",
+        ("x",),
+        MESSAGES_ID,
+    ),
+    QueryShape(
+        "get_last_interaction from contact",
+        """SELECT * FROM messages WHERE sender = ? ORDER BY timestamp DESC LIMIT 1""",
+        ("x",),
+        MESSAGES_SENDER_TIME,
+    ),
+    QueryShape(
+        "get_last_interaction in chat",
+        """SELECT * FROM messages WHERE chat_jid = ? ORDER BY timestamp DESC LIMIT 1""",
+        ("x",),
+        MESSAGES_CHAT_TIME,
+    ),
+    QueryShape(
+        "list_chats by last activity",
+        """SELECT chats.jid FROM chats
+           ORDER BY chats.last_message_time DESC, chats.jid DESC LIMIT 20""",
+        (),
+        CHATS_LAST_TIME,
+    ),
+    QueryShape(
+        "last message per chat",
+        """SELECT chats.jid, messages.content FROM chats
+           LEFT JOIN messages ON chats.jid = messages.chat_jid AND chats.last_message_time = messages.timestamp
+           WHERE chats.jid = ?""",
+        ("x",),
+        MESSAGES_CHAT_TIME,
+    ),
+]
+
+
+def explain(db_path: str, sql: str, params: Tuple) -> List[str]:
+    """Return the EXPLAIN QUERY PLAN detail lines for sql.
+
+    Uses a fresh connection each time: EXPLAIN does not re-read a schema that
+    changed since the connection loaded it, so a pooled connection would keep
+    reporting the plan from before an index was created.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    finally:
+        conn.close()
+
+
+def plan_is_poor(plan: List[str], table: str) -> bool:
+    """A plan is poor if it full-scans table or sorts the whole result in a temp B-tree."""
+    for detail in plan:
+        words = detail.split()
+        if words[:2] == ["SCAN", table] and "INDEX" not in words:
+            return True
+        if detail.startswith("USE TEMP B-TREE FOR ORDER BY"):
+            return True
+    return False
+
+
+def existing_indexes(db_path: str) -> Dict[str, str]:
+    """Map every index name in db_path to its table."""
+    rows = db.fetchall(db_path, "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'")
+    return {name: table for name, table in rows}
+
+
+def _wait_for_quiet_window(db_path: str) -> bool:
+    """Wait until nothing has written to db_path for MIGRATION_QUIET_SECONDS."""
+    watcher = db.DataVersionWatcher(db_path)
+    try:
+        watcher.poll()
+        deadline = time.monotonic() + MIGRATION_MAX_WAIT_SECONDS
+        quiet_since = time.monotonic()
+        while time.monotonic() < deadline:
+            time.sleep(min(0.5, MIGRATION_QUIET_SECONDS))
+            if watcher.poll():
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= MIGRATION_QUIET_SECONDS:
+                return True
+        return False
+    finally:
+        watcher.close()
+
+
+def _create_index(db_path: str, index: IndexSpec) -> None:
+    """Build index inside a BEGIN IMMEDIATE transaction during a quiet window."""
+    if not _wait_for_quiet_window(db_path):
+        raise sqlite3.OperationalError(f"no quiet window to build {index.name}")
+
+    def build(conn: sqlite3.Connection) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(index.ddl)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    started = time.monotonic()
+    db.run_with_retry(db_path, build, readonly=False)
+    print(f"Created index {index.name} on {index.table}({', '.join(index.columns)}) in {time.monotonic() - started:.2f}s")
+
+
+def _advise(db_path: str, shape: QueryShape, indexes: Dict[str, str], apply: bool) -> ShapeReport:
+    """Explain one query shape and create its index if the plan needs it."""
+    try:
+        plan = explain(db_path, shape.sql, shape.params)
+    except sqlite3.Error as e:
+        return ShapeReport(shape.name, shape.index.name, [], error=str(e))
+    report = ShapeReport(shape.name, shape.index.name, plan)
+
+    if not plan_is_poor(plan, shape.index.table):
+        report.plan_after = plan
+        return report
+    if shape.index.name in indexes:
+        report.plan_after = plan
+        print(f"Query shape '{shape.name}' still has a poor plan with {shape.index.name}: {plan}")
+        return report
+    if not apply:
+        print(f"Query shape '{shape.name}' would benefit from {shape.index.name}: {plan}")
+        return report
+
+    try:
+        _create_index(db_path, shape.index)
+    except sqlite3.Error as e:
+        report.error = str(e)
+        print(f"Could not create {shape.index.name}: {e}")
+        return report
+    indexes[shape.index.name] = shape.index.table
+    report.created = True
+    report.plan_after = explain(db_path, shape.sql, shape.params)
+    print(f"Query shape '{shape.name}': plan before {plan}, after {report.plan_after}")
+    return report
+
+
+def run_index_advisor(db_path: str, apply: bool = True) -> List[ShapeReport]:
+    """Check every hot query shape's plan and create the missing indexes.
+
+    Creating an index is idempotent and only done when the shape's current plan
+    is poor; the before/after plans are logged and returned.
+    """
+    indexes = existing_indexes(db_path)
+    return [_advise(db_path, shape, indexes, apply) for shape in QUERY_SHAPES]
+
+
+_last_reports: List[ShapeReport] = []
+
+
+def last_reports() -> List[ShapeReport]:
+    """Reports from the most recent advisor run in this process."""
+    return list(_last_reports)
+
+
+def start(db_path: str) -> Optional[threading.Thread]:
+    """Run the index advisor once in a background thread at server start."""
+    if not MCP_AUTO_INDEX:
+        print("Automatic index creation disabled via MCP_AUTO_INDEX")
+        return None
+
+    def run() -> None:
+        global _last_reports
+        try:
+            _last_reports = run_index_advisor(db_path)
+        except sqlite3.Error as e:
+            print(f"Index advisor failed: {e}")
+
+    thread = threading.Thread(target=run, name="index-advisor", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import db
+
+NAME_CACHE_SIZE = int(os.getenv('NAME_CACHE_SIZE', '10000'))
+# Source tables are re-checked at most this often while the bridge keeps writing
+NAME_CACHE_VALIDATE_SECONDS = float(os.getenv('NAME_CACHE_VALIDATE_SECONDS', '1.0'))
+
+# Where a cached display name came from, in resolution priority order. When a
+# source table changes, entries from that source and every lower-priority
+# source are dropped, since a better name may now exist for them.
+SOURCE_NICKNAME = 0
+SOURCE_CONTACT = 1
+SOURCE_CHAT = 2
+SOURCE_FALLBACK = 3
+
+# Rows whose content decides the names served, fingerprinted only after
+# PRAGMA data_version moves. chats is rewritten on every incoming message, but
+# only name changes matter here.
+NICKNAMES_FINGERPRINT = "SELECT jid, nickname FROM contact_nicknames"
+CHATS_FINGERPRINT = "SELECT jid, name FROM chats"
+CONTACTS_FINGERPRINT = """
+    SELECT their_jid, full_name, push_name, first_name, business_name
+    FROM whatsmeow_contacts
+"""
+
+
+def content_fingerprint(db_path: str, sql: str) -> Tuple[int, int]:
+    """Row count and an order-independent checksum of every row sql returns.
+
+    Each row is hashed in full and the hashes are summed, so any change to any
+    value (not just its length or first character) changes the fingerprint,
+    and no ORDER BY is needed. Python's hash() is salted per process, which is
+    fine for comparing fingerprints taken by the same process.
+
+    Raises:
+        sqlite3.Error: If the query fails
+    """
+    def operation(conn: sqlite3.Connection) -> Tuple[int, int]:
+        count = 0
+        checksum = 0
+        for row in conn.execute(sql):
+            checksum = (checksum + hash(row)) & 0xFFFFFFFFFFFFFFFF
+            count += 1
+        return count, checksum
+
+    return db.run_with_retry(db_path, operation)
+
+
+class NameCache:
+    """Bounded LRU cache of JID -> display name with change-driven invalidation."""
+
+    def __init__(self, max_size: int = NAME_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._validate_lock = threading.Lock()
+        self._watchers: Dict[str, db.DataVersionWatcher] = {}
+        self._fingerprints: Dict[str, Optional[tuple]] = {}
+        # contact_nicknames is small and user-edited, so it is snapshotted per JID
+        # to tell our own writes apart from anyone else's
+        self._nicknames: Optional[Dict[str, str]] = None
+        self._last_validate = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_many(self, jids: Iterable[str]) -> Tuple[Dict[str, str], List[str]]:
+        """Split jids into cached names and the JIDs that still need resolving."""
+        found: Dict[str, str] = {}
+        missing: List[str] = []
+        with self._lock:
+            for jid in jids:
+                entry = self._entries.get(jid)
+                if entry is None:
+                    self.misses += 1
+                    missing.append(jid)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(jid)
+                    found[jid] = entry[0]
+        return found, missing
+
+    def put(self, jid: str, name: str, source: int) -> None:
+        with self._lock:
+            self._entries[jid] = (name, source)
+            self._entries.move_to_end(jid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def evict(self, jid: str) -> None:
+        """Drop a single JID, e.g. after its nickname was changed in this process."""
+        with self._lock:
+            self._entries.pop(jid, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _drop_sources_from(self, source: int) -> None:
+        with self._lock:
+            stale = [jid for jid, (_, entry_source) in self._entries.items() if entry_source >= source]
+            for jid in stale:
+                del self._entries[jid]
+            if stale:
+                self.invalidations += 1
+
+    def _fingerprint_changed(self, db_path: str, key: str, sql: str) -> bool:
+        try:
+            fingerprint = content_fingerprint(db_path, sql)
+        except sqlite3.Error:
+            fingerprint = None
+        previous = self._fingerprints.get(key, fingerprint)
+        self._fingerprints[key] = fingerprint
+        return previous != fingerprint
+
+    def _poll(self, db_path: str) -> bool:
+        watcher = self._watchers.get(db_path)
+        if watcher is None:
+            watcher = self._watchers[db_path] = db.DataVersionWatcher(db_path)
+        try:
+            return watcher.poll()
+        except sqlite3.Error:
+            return False
+
+    def _changed_nicknames(self, db_path: str) -> Optional[set]:
+        """JIDs whose nickname changed since the previous snapshot; None if unreadable."""
+        try:
+            current = dict(db.fetchall(db_path, NICKNAMES_FINGERPRINT))
+        except sqlite3.Error:
+            return None
+        previous, self._nicknames = self._nicknames, current
+        if previous is None:
+            return set()
+        return {jid for jid in previous.keys() | current.keys() if previous.get(jid) != current.get(jid)}
+
+    def _check_messages_db(self, messages_db_path: str, local_jid: Optional[str] = None) -> None:
+        if not self._poll(messages_db_path):
+            return
+        changed = self._changed_nicknames(messages_db_path)
+        chats_changed = self._fingerprint_changed(messages_db_path, 'chats', CHATS_FINGERPRINT)
+        # Our own write was evicted already; anything else changed behind our back
+        if changed is None or changed - {local_jid}:
+            self._drop_sources_from(SOURCE_NICKNAME)
+        elif chats_changed:
+            self._drop_sources_from(SOURCE_CHAT)
+
+    def validate(self, messages_db_path: str, whatsapp_db_path: str) -> None:
+        """Drop entries whose source tables changed since the last check.
+
+        Runs at most once per NAME_CACHE_VALIDATE_SECONDS, and never makes a
+        caller wait for a check already running on another thread. PRAGMA
+        data_version then tells us cheaply whether either database was written
+        at all; only then are the contact/nickname/chat-name fingerprints
+        recomputed to find out which sources actually changed.
+        """
+        now = time.monotonic()
+        if now - self._last_validate < NAME_CACHE_VALIDATE_SECONDS:
+            return
+        if not self._validate_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_validate = now
+            self._check_messages_db(messages_db_path)
+            if self._poll(whatsapp_db_path):
+                if self._fingerprint_changed(whatsapp_db_path, 'contacts', CONTACTS_FINGERPRINT):
+                    self._drop_sources_from(SOURCE_CONTACT)
+        finally:
+            self._validate_lock.release()
+
+    def note_nickname_write(self, jid: str, messages_db_path: str) -> None:
+        """Evict jid after a local nickname change and re-baseline the nickname snapshot.
+
+        Without re-baselining, the next validate() would see our own write and
+        flush every cached name instead of just this one. Nicknames changed by
+        anyone else in the meantime still flush the nickname-derived names.
+        """
+        self.evict(jid)
+        with self._validate_lock:
+            self._check_messages_db(messages_db_path, local_jid=jid)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
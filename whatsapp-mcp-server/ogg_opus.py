@@ -0,0 +1,171 @@
+import struct
+from typing import BinaryIO, List, NamedTuple, Optional
+
+# Ogg Opus granule positions always count 48 kHz samples, whatever the input rate
+OPUS_GRANULE_RATE = 48000
+
+_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+_FLAG_CONTINUED = 0x01
+_FLAG_BOS = 0x02
+_FLAG_EOS = 0x04
+# A page is closed once its body reaches this size (a page holds at most 255 lacing values)
+_PAGE_TARGET_BYTES = 4096
+
+
+def _crc_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def _ogg_crc(data: bytes) -> int:
+    """The Ogg page checksum (CRC-32, polynomial 0x04C11DB7, not bit-reflected)."""
+    crc = 0
+    table = _CRC_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ byte]
+    return crc
+
+
+class OpusStream(NamedTuple):
+    """Packets of an Ogg Opus stream: the two header packets, the audio packets and the final granule position."""
+    head: bytes
+    tags: bytes
+    packets: List[bytes]
+    final_granule: int
+
+    @property
+    def pre_skip(self) -> int:
+        return struct.unpack_from("<H", self.head, 10)[0]
+
+
+def read_opus_stream(f: BinaryIO) -> OpusStream:
+    """Read the first logical stream of an Ogg Opus file, packet by packet.
+
+    Raises:
+        ValueError: If the data is not an Ogg Opus stream
+    """
+    serial: Optional[int] = None
+    packets: List[bytes] = []
+    partial = bytearray()
+    final_granule = 0
+    while True:
+        header = f.read(_PAGE_HEADER.size)
+        if not header:
+            break
+        if len(header) < _PAGE_HEADER.size:
+            raise ValueError("Truncated Ogg page header")
+        capture, _, _, granule, page_serial, _, _, segment_count = _PAGE_HEADER.unpack(header)
+        if capture != b"OggS":
+            raise ValueError("Not an Ogg stream")
+        lacing = f.read(segment_count)
+        body = f.read(sum(lacing))
+        if serial is None:
+            serial = page_serial
+        if page_serial != serial:
+            continue
+        offset = 0
+        for value in lacing:
+            partial += body[offset:offset + value]
+            offset += value
+            if value < 255:
+                packets.append(bytes(partial))
+                partial.clear()
+        if granule != -1:
+            final_granule = granule
+    if len(packets) < 2 or not packets[0].startswith(b"OpusHead") or not packets[1].startswith(b"OpusTags"):
+        raise ValueError("Not an Ogg Opus stream")
+    return OpusStream(packets[0], packets[1], packets[2:], final_granule)
+
+
+def packet_samples(packet: bytes) -> int:
+    """Duration of an Opus packet in 48 kHz samples, from its TOC byte (RFC 6716 section 3.1)."""
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config & 3]
+    elif config < 16:
+        frame = (480, 960)[config & 1]
+    else:
+        frame = (120, 240, 480, 960)[config & 3]
+    code = toc & 3
+    if code == 0:
+        count = 1
+    elif code in (1, 2):
+        count = 2
+    else:
+        count = packet[1] & 0x3F
+    return frame * count
+
+
+class OggOpusWriter:
+    """Writes an Ogg Opus stream from packets, computing granule positions.
+
+    Granule positions are pre-skip plus the samples of every packet completed
+    so far; finish() can lower the last page's position to trim padding from
+    the end of the stream, the only place besides pre-skip where Opus allows
+    a partial packet to be discarded.
+    """
+
+    def __init__(self, out: BinaryIO, head: bytes, tags: bytes, serial: int = 0x4F505553):
+        self.out = out
+        self.serial = serial
+        self.granule = struct.unpack_from("<H", head, 10)[0]
+        self._sequence = 0
+        self._lacing = bytearray()
+        self._body = bytearray()
+        self._page_granule = -1
+        self._continued = False
+        self._bos = True
+        self._add(head)
+        self._flush()
+        self._add(tags)
+        self._flush()
+
+    def _flush(self, eos: bool = False, granule: Optional[int] = None) -> None:
+        flags = (_FLAG_CONTINUED if self._continued else 0) | (_FLAG_BOS if self._bos else 0) | (_FLAG_EOS if eos else 0)
+        header = _PAGE_HEADER.pack(
+            b"OggS", 0, flags, self._page_granule if granule is None else granule,
+            self.serial, self._sequence, 0, len(self._lacing),
+        )
+        page = header + bytes(self._lacing) + bytes(self._body)
+        crc = _ogg_crc(page)
+        page = page[:22] + struct.pack("<I", crc) + page[26:]
+        self.out.write(page)
+        self._sequence += 1
+        self._bos = False
+        self._lacing.clear()
+        self._body.clear()
+        self._page_granule = -1
+
+    def _add(self, packet: bytes) -> None:
+        values = [255] * (len(packet) // 255) + [len(packet) % 255]
+        offset = 0
+        for index, value in enumerate(values):
+            if len(self._lacing) == 255:
+                self._flush()
+                # The packet being added carries on into the next page
+                self._continued = index > 0
+            self._lacing.append(value)
+            self._body += packet[offset:offset + value]
+            offset += value
+        self._continued = False
+
+    def write(self, packet: bytes) -> None:
+        """Append an audio packet."""
+        if self._body and len(self._body) + len(packet) > _PAGE_TARGET_BYTES:
+            self._flush()
+        self._add(packet)
+        self.granule += packet_samples(packet)
+        self._page_granule = self.granule
+
+    def finish(self, final_granule: Optional[int] = None) -> None:
+        """Write the last page, ending the stream at final_granule (default: after the last packet)."""
+        self._flush(eos=True, granule=self.granule if final_granule is None else final_granule)
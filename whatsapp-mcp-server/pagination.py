@@ -0,0 +1,27 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence
+
+
+def encode_cursor(kind: str, values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row on a page as an opaque continuation cursor."""
+    payload = json.dumps({"k": kind, "v": list(values)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, size: Optional[int] = None) -> List[Any]:
+    """Decode a cursor produced by encode_cursor for the same kind of listing.
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to a different listing
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        values = payload["v"]
+        cursor_kind = payload["k"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if cursor_kind != kind or not isinstance(values, list) or (size is not None and len(values) != size):
+        raise ValueError(f"Cursor does not belong to this listing: {cursor}")
+    return values
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+from typing import List
+
+import db
+from sidecar import SidecarIndex
+
+# Schema alias the index is attached under on pooled messages.db readers
+PARTICIPANTS_SCHEMA = "participants"
+
+_NEWER = "COALESCE(excluded.last_time, '') >= COALESCE(last_time, '')"
+_UPSERT_PARTICIPANT = f"""
+    INSERT INTO chat_participants (participant, chat_jid, first_time, last_time, last_message_id, message_count)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (participant, chat_jid) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        first_time = MIN(COALESCE(first_time, excluded.first_time), COALESCE(excluded.first_time, first_time)),
+        last_message_id = CASE WHEN {_NEWER} THEN excluded.last_message_id ELSE last_message_id END,
+        last_time = CASE WHEN {_NEWER} THEN excluded.last_time ELSE last_time END
+"""
+
+
+def participant_key(jid: str) -> str:
+    """Key a sender or chat JID is indexed under.
+
+    The bridge stores senders both as bare users ("972501234567") and as full
+    or device JIDs, so contacts are keyed by their user part. Group JIDs are
+    kept whole so a group only matches itself.
+    """
+    if jid.endswith("@g.us"):
+        return jid
+    return jid.split('@')[0].split(':')[0]
+
+
+class ParticipantIndex(SidecarIndex):
+    """Which chats each contact takes part in, with first/last message time and count.
+
+    A message involves its sender and, in a direct chat, the other party
+    (the chat JID), so (participant, chat) rows cover both of the conditions
+    get_contact_chats and get_last_interaction used to OR together over
+    messages. participant_messages records every (id, chat_jid) counted so
+    rewritten messages are not counted twice.
+    """
+
+    name = "participants"
+    filename = "participants.db"
+    source_columns = "id, chat_jid, sender, timestamp"
+
+    def create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_participants (
+                participant TEXT NOT NULL,
+                chat_jid TEXT NOT NULL,
+                first_time TIMESTAMP,
+                last_time TIMESTAMP,
+                last_message_id TEXT,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (participant, chat_jid)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_participants_last_time
+            ON chat_participants (participant, last_time)
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS participant_messages (
+                id TEXT NOT NULL,
+                chat_jid TEXT NOT NULL,
+                PRIMARY KEY (id, chat_jid)
+            ) WITHOUT ROWID
+        """)
+
+    def apply(self, conn: sqlite3.Connection, rows: List[tuple]) -> None:
+        for _, message_id, chat_jid, sender, timestamp in rows:
+            added = conn.execute(
+                "INSERT OR IGNORE INTO participant_messages (id, chat_jid) VALUES (?, ?)",
+                (message_id, chat_jid),
+            ).rowcount
+            participants = {participant_key(chat_jid)}
+            if sender:
+                participants.add(participant_key(sender))
+            for participant in participants:
+                conn.execute(
+                    _UPSERT_PARTICIPANT,
+                    (participant, chat_jid, timestamp, timestamp, message_id, added),
+                )
+
+    def reset(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM chat_participants")
+        conn.execute("DELETE FROM participant_messages")
+
+    def attach_to(self, source_path: str) -> None:
+        """Make the index queryable as participants.* from pooled readers of source_path."""
+        self.connection()
+        db.register_attachment(source_path, PARTICIPANTS_SCHEMA, self.path)
+
+
+_index = ParticipantIndex(os.getenv('PARTICIPANT_INDEX_PATH') or None)
+
+
+def get_index() -> ParticipantIndex:
+    return _index
+
+
+def prepare(source_path: str) -> bool:
+    """Get the index ready for a query against source_path.
+
+    Returns True if contact lookups can use it, False if they should query
+    messages directly (the index is still building).
+    """
+    try:
+        _index.attach_to(source_path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Participant index unavailable: {e}")
+        return False
+    return _index.refresh(source_path)
+
+
+def start(source_path: str) -> None:
+    """Start building/maintaining the index in the background (e.g. at server start)."""
+    try:
+        _index.attach_to(source_path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Participant index unavailable: {e}")
+        return
+    _index.start_background_sync(source_path)
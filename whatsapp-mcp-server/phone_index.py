@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+import db
+
+# Source tables are re-checked at most this often while the bridge keeps writing
+PHONE_INDEX_REFRESH_SECONDS = float(os.getenv('PHONE_INDEX_REFRESH_SECONDS', '1.0'))
+
+# Where a JID was seen; lookups can be restricted to one source
+SOURCE_CHAT = 1
+SOURCE_CONTACT = 2
+SOURCE_ANY = SOURCE_CHAT | SOURCE_CONTACT
+
+# Servers whose JID user part is a phone number (unlike @lid, @g.us, @newsletter)
+_PHONE_SERVERS = ("s.whatsapp.net", "c.us")
+# Shortest number a bare national number (no country code) may be matched by
+_MIN_SUFFIX_DIGITS = 7
+# Trailing digits used to bucket numbers for national-number lookups
+_SUFFIX_KEY_DIGITS = 7
+
+
+def normalize_phone(phone: str) -> str:
+    """Digits-only (E.164 without the +) form of a phone number or phone JID.
+
+    "+972 50-123-4567", "00972501234567", "972501234567@s.whatsapp.net" and
+    "972501234567:12@s.whatsapp.net" (a device JID) all give "972501234567".
+    Group, LID and other non-phone JIDs give "".
+    """
+    user, _, server = phone.strip().partition('@')
+    if server and server not in _PHONE_SERVERS:
+        return ""
+    user = user.split(':')[0].split('.')[0]
+    digits = "".join(ch for ch in user if ch.isdigit())
+    if user.lstrip().startswith("00"):
+        digits = digits[2:]
+    return digits
+
+
+class PhoneIndex:
+    """Maps normalized phone numbers to the chat and contact JIDs carrying them.
+
+    Replaces jid LIKE '%<phone>%' scans, which read every chat and can return
+    the wrong contact when one number is a substring of another. Numbers are
+    matched exactly; a number typed without its country code (optionally with
+    a trunk 0) matches only if it identifies a single known number.
+
+    Kept in memory and refreshed incrementally by rowid: the bridge rewrites a
+    chat row (new rowid) on every message and never changes a contact's JID, so
+    rows above the last seen rowid are all that can add numbers. A shrinking
+    table (deleted chats or contacts) triggers a rebuild of that source.
+    """
+
+    def __init__(self, messages_db_path: str, whatsapp_db_path: str):
+        self.messages_db_path = messages_db_path
+        self.whatsapp_db_path = whatsapp_db_path
+        self._numbers: Dict[str, Dict[str, int]] = {}
+        self._by_suffix: Dict[str, Set[str]] = {}
+        self._lock = threading.RLock()
+        self._watchers = {
+            messages_db_path: db.DataVersionWatcher(messages_db_path),
+            whatsapp_db_path: db.DataVersionWatcher(whatsapp_db_path),
+        }
+        # Per source: rowid watermark and the JIDs indexed from it
+        self._watermarks = {SOURCE_CHAT: 0, SOURCE_CONTACT: 0}
+        self._jids: Dict[int, Set[str]] = {SOURCE_CHAT: set(), SOURCE_CONTACT: set()}
+        self._loaded = False
+        self._last_check = 0.0
+        self.rebuilds = 0
+        self.hits = 0
+        self.misses = 0
+
+    # -- loading --------------------------------------------------------------
+
+    def _add(self, jid: str, source: int) -> None:
+        # Every JID is remembered, phone or not, so its count matches the source table's
+        self._jids[source].add(jid)
+        number = normalize_phone(jid)
+        if not number:
+            return
+        sources = self._numbers.setdefault(number, {})
+        sources[jid] = sources.get(jid, 0) | source
+        self._by_suffix.setdefault(number[-_SUFFIX_KEY_DIGITS:], set()).add(number)
+
+    def _drop_source(self, source: int) -> None:
+        for jid in self._jids[source]:
+            number = normalize_phone(jid)
+            sources = self._numbers.get(number)
+            if sources is None or jid not in sources:
+                continue
+            sources[jid] &= ~source
+            if not sources[jid]:
+                del sources[jid]
+            if not sources:
+                del self._numbers[number]
+                bucket = self._by_suffix.get(number[-_SUFFIX_KEY_DIGITS:])
+                if bucket is not None:
+                    bucket.discard(number)
+                    if not bucket:
+                        del self._by_suffix[number[-_SUFFIX_KEY_DIGITS:]]
+        self._jids[source] = set()
+        self._watermarks[source] = 0
+
+    def _sync(self, source: int, db_path: str, table: str, column: str) -> None:
+        count_sql = f"SELECT COUNT(DISTINCT {column}) FROM {table}" if source == SOURCE_CONTACT else \
+            f"SELECT COUNT(*) FROM {table}"
+        if db.fetchone(db_path, count_sql)[0] < len(self._jids[source]):
+            self._drop_source(source)
+            self.rebuilds += 1
+        rows = db.fetchall(db_path, f"SELECT rowid, {column} FROM {table} WHERE rowid > ? ORDER BY rowid",
+                           (self._watermarks[source],))
+        for rowid, jid in rows:
+            if jid:
+                self._add(jid, source)
+        if rows:
+            self._watermarks[source] = rows[-1][0]
+
+    def refresh(self, force: bool = False) -> None:
+        """Index chats and contacts added since the last refresh.
+
+        Raises:
+            sqlite3.Error: If the source tables cannot be read
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._loaded and now - self._last_check < PHONE_INDEX_REFRESH_SECONDS:
+                return
+            self._last_check = now
+            if self._watchers[self.messages_db_path].poll() or not self._loaded:
+                self._sync(SOURCE_CHAT, self.messages_db_path, "chats", "jid")
+            if self._watchers[self.whatsapp_db_path].poll() or not self._loaded:
+                self._sync(SOURCE_CONTACT, self.whatsapp_db_path, "whatsmeow_contacts", "their_jid")
+            self._loaded = True
+
+    # -- queries --------------------------------------------------------------
+
+    def _resolve_number(self, digits: str) -> Optional[str]:
+        if digits in self._numbers:
+            return digits
+        national = digits.lstrip('0')
+        if len(national) < _MIN_SUFFIX_DIGITS:
+            return None
+        candidates = [
+            number for number in self._by_suffix.get(national[-_SUFFIX_KEY_DIGITS:], ())
+            if number.endswith(national)
+        ]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def lookup(self, phone: str, source: int = SOURCE_ANY) -> List[str]:
+        """JIDs for a phone number (any format, or a phone JID), phone-server JIDs first.
+
+        Args:
+            phone: Phone number with or without country code and punctuation
+            source: SOURCE_CHAT, SOURCE_CONTACT or SOURCE_ANY
+
+        Returns:
+            Matching JIDs, empty if the number is unknown or ambiguous
+        """
+        digits = normalize_phone(phone)
+        if not digits:
+            return []
+        self.refresh()
+        with self._lock:
+            number = self._resolve_number(digits)
+            jids = [jid for jid, seen in self._numbers.get(number, {}).items() if seen & source] if number else []
+            if jids:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return sorted(jids, key=lambda jid: (not jid.endswith("@s.whatsapp.net"), ':' in jid, jid))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "numbers": len(self._numbers),
+                "chat_jids": len(self._jids[SOURCE_CHAT]),
+                "contact_jids": len(self._jids[SOURCE_CONTACT]),
+                "rebuilds": self.rebuilds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
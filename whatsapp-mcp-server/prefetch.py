@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+import concurrency
+import db
+import media_store
+
+# Background download of new media so interactive download_media calls are
+# served from the media store. Disabled unless MEDIA_PREFETCH_ENABLED is set.
+MEDIA_PREFETCH_ENABLED = os.getenv('MEDIA_PREFETCH_ENABLED', 'false').lower() in ('true', '1', 'yes', 'on')
+# Comma-separated chat JIDs to prefetch for; empty means every chat
+MEDIA_PREFETCH_CHATS = os.getenv('MEDIA_PREFETCH_CHATS', '')
+MEDIA_PREFETCH_TYPES = os.getenv('MEDIA_PREFETCH_TYPES', 'image,document')
+MEDIA_PREFETCH_MAX_FILE_BYTES = int(os.getenv('MEDIA_PREFETCH_MAX_FILE_BYTES', str(16 * 1024 * 1024)))
+# Per-chat overrides as JSON, e.g. {"123@g.us": {"media_types": ["image"], "max_file_bytes": 1048576}}
+MEDIA_PREFETCH_POLICIES = os.getenv('MEDIA_PREFETCH_POLICIES', '')
+MEDIA_PREFETCH_RATE = float(os.getenv('MEDIA_PREFETCH_RATE', '0.5'))
+# Only download once no tool call has run for this many seconds
+MEDIA_PREFETCH_IDLE_SECONDS = float(os.getenv('MEDIA_PREFETCH_IDLE_SECONDS', '5'))
+MEDIA_PREFETCH_INTERVAL = float(os.getenv('MEDIA_PREFETCH_INTERVAL', '10'))
+MEDIA_PREFETCH_BATCH_SIZE = int(os.getenv('MEDIA_PREFETCH_BATCH_SIZE', '200'))
+
+_WATERMARK_KEY = "prefetch_watermark"
+
+
+@dataclass
+class PrefetchPolicy:
+    """Which media of a chat is worth downloading ahead of time."""
+    media_types: FrozenSet[str]
+    max_file_bytes: int
+
+    def accepts(self, media_type: str, file_length: Optional[int]) -> bool:
+        if media_type not in self.media_types:
+            return False
+        return file_length is None or file_length <= self.max_file_bytes
+
+
+@dataclass
+class PrefetchConfig:
+    default: Optional[PrefetchPolicy]
+    chats: Dict[str, PrefetchPolicy] = field(default_factory=dict)
+
+    def policy_for(self, chat_jid: str) -> Optional[PrefetchPolicy]:
+        return self.chats.get(chat_jid, self.default)
+
+
+def _split(value: str) -> FrozenSet[str]:
+    return frozenset(part.strip() for part in value.split(",") if part.strip())
+
+
+def load_config() -> PrefetchConfig:
+    """Build the prefetch policies from the MEDIA_PREFETCH_* environment variables.
+
+    Raises:
+        ValueError: If MEDIA_PREFETCH_POLICIES is not valid JSON
+    """
+    default = PrefetchPolicy(_split(MEDIA_PREFETCH_TYPES), MEDIA_PREFETCH_MAX_FILE_BYTES)
+    allowlist = _split(MEDIA_PREFETCH_CHATS)
+    config = PrefetchConfig(default=None if allowlist else default)
+    for chat_jid in allowlist:
+        config.chats[chat_jid] = default
+    if MEDIA_PREFETCH_POLICIES:
+        for chat_jid, overrides in json.loads(MEDIA_PREFETCH_POLICIES).items():
+            config.chats[chat_jid] = PrefetchPolicy(
+                frozenset(overrides.get("media_types", default.media_types)),
+                int(overrides.get("max_file_bytes", default.max_file_bytes)),
+            )
+    return config
+
+
+class MediaPrefetcher:
+    """Downloads media of new messages in the background, one file at a time.
+
+    New media rows are found by a messages rowid watermark kept in the media
+    store, so a restart resumes where it left off; on first start only media
+    arriving from then on is considered. Downloads wait until no tool call has
+    run for MEDIA_PREFETCH_IDLE_SECONDS and are spaced to MEDIA_PREFETCH_RATE
+    per second. A failed download is counted and skipped, not retried.
+    """
+
+    def __init__(self, messages_db_path: str, download: Callable[[str, str], Optional[str]],
+                 config: Optional[PrefetchConfig] = None):
+        self.messages_db_path = messages_db_path
+        self.download = download
+        self.config = config or load_config()
+        self._store = media_store.get_store()
+        self._stats = {"downloaded": 0, "already_stored": 0, "skipped_by_policy": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._background: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _max_rowid(self) -> int:
+        return db.fetchone(self.messages_db_path, "SELECT MAX(rowid) FROM messages")[0] or 0
+
+    def watermark(self) -> int:
+        watermark = self._store.get_meta(_WATERMARK_KEY)
+        if watermark is None:
+            watermark = self._max_rowid()
+            self._store.set_meta(_WATERMARK_KEY, watermark)
+        return watermark
+
+    def _candidates(self, watermark: int, max_rowid: int) -> List[tuple]:
+        return db.fetchall(self.messages_db_path, """
+            SELECT rowid, id, chat_jid, media_type, file_length, file_sha256
+            FROM messages
+            WHERE rowid > ? AND rowid <= ? AND media_type IS NOT NULL AND media_type != ''
+            ORDER BY rowid
+            LIMIT ?
+        """, (watermark, max_rowid, MEDIA_PREFETCH_BATCH_SIZE))
+
+    def _wait_for_idle(self) -> bool:
+        """Block until interactive calls have been quiet for a while; False if stopping."""
+        while not self._stop.is_set():
+            idle = concurrency.idle_seconds()
+            if idle >= MEDIA_PREFETCH_IDLE_SECONDS:
+                return True
+            self._stop.wait(max(0.1, MEDIA_PREFETCH_IDLE_SECONDS - idle))
+        return False
+
+    def run_once(self) -> int:
+        """Prefetch media from one batch of new rows; return the number of rows handled."""
+        watermark = self.watermark()
+        max_rowid = self._max_rowid()
+        rows = self._candidates(watermark, max_rowid)
+        interval = 1.0 / MEDIA_PREFETCH_RATE if MEDIA_PREFETCH_RATE > 0 else 0.0
+
+        handled = 0
+        for rowid, message_id, chat_jid, media_type, file_length, digest in rows:
+            policy = self.config.policy_for(chat_jid)
+            if policy is None or not policy.accepts(media_type, file_length):
+                self._count("skipped_by_policy")
+            elif isinstance(digest, bytes) and self._store.has_content(digest.hex()):
+                self._count("already_stored")
+            else:
+                if not self._wait_for_idle():
+                    return handled
+                started = time.monotonic()
+                try:
+                    # Our own bridge calls must not count as the activity we wait out
+                    with concurrency.background():
+                        path = self.download(message_id, chat_jid)
+                except Exception as e:
+                    print(f"Prefetch of {message_id} in {chat_jid} failed: {e}")
+                    path = None
+                self._count("downloaded" if path else "failed")
+                self._stop.wait(max(0.0, interval - (time.monotonic() - started)))
+            self._store.set_meta(_WATERMARK_KEY, rowid)
+            handled += 1
+
+        if len(rows) < MEDIA_PREFETCH_BATCH_SIZE and max_rowid > watermark:
+            # Every media row up to max_rowid was handled; skip the text rows after them
+            self._store.set_meta(_WATERMARK_KEY, max_rowid)
+        return handled
+
+    def start(self, interval: float = MEDIA_PREFETCH_INTERVAL) -> None:
+        """Poll for new media from a daemon thread (idempotent)."""
+        if self._background is not None and self._background.is_alive():
+            return
+        watcher = db.DataVersionWatcher(self.messages_db_path)
+
+        def run() -> None:
+            pending = True
+            while not self._stop.is_set():
+                try:
+                    pending = watcher.poll() or pending
+                    if pending:
+                        pending = self.run_once() >= MEDIA_PREFETCH_BATCH_SIZE
+                except (sqlite3.Error, OSError) as e:
+                    print(f"Error prefetching media: {e}")
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._background = threading.Thread(target=run, name="media-prefetch", daemon=True)
+        self._background.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(self._stats)
+        snapshot["running"] = self._background is not None and self._background.is_alive()
+        try:
+            snapshot["watermark"] = self._store.get_meta(_WATERMARK_KEY)
+        except (sqlite3.Error, OSError):
+            snapshot["watermark"] = None
+        return snapshot
+
+
+_prefetcher: Optional[MediaPrefetcher] = None
+
+
+def start(messages_db_path: str, download: Callable[[str, str], Optional[str]]) -> Optional[MediaPrefetcher]:
+    """Start the prefetcher if MEDIA_PREFETCH_ENABLED is set."""
+    global _prefetcher
+    if not MEDIA_PREFETCH_ENABLED:
+        return None
+    if _prefetcher is None:
+        try:
+            _prefetcher = MediaPrefetcher(messages_db_path, download)
+        except ValueError as e:
+            print(f"Media prefetch disabled, invalid MEDIA_PREFETCH_POLICIES: {e}")
+            return None
+    _prefetcher.start()
+    return _prefetcher
+
+
+def stats() -> Optional[Dict[str, Any]]:
+    return _prefetcher.stats() if _prefetcher is not None else None
@@ -0,0 +1,135 @@
+import os
+import re
+import sqlite3
+from typing import List, Optional
+
+import db
+from sidecar import SidecarIndex
+
+# Schema alias the index is attached under on pooled messages.db readers
+SEARCH_SCHEMA = "search"
+
+_TERM_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def fts5_available() -> bool:
+    """Check whether the linked SQLite library was built with FTS5."""
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE probe USING fts5(content)")
+            return True
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def to_match_expression(query: str) -> Optional[str]:
+    """Translate a user search string into an FTS5 MATCH expression.
+
+    "quoted text" is matched as a phrase; every other word is matched as a
+    prefix (so "meet" finds "meeting"), and all parts must match. Returns None
+    if nothing searchable is left, in which case callers fall back to LIKE.
+    """
+    parts = []
+    for phrase, word in _TERM_PATTERN.findall(query):
+        text = phrase if phrase else word.rstrip('*')
+        if not any(ch.isalnum() for ch in text):
+            continue
+        escaped = '"' + text.replace('"', '""') + '"'
+        parts.append(escaped if phrase else escaped + '*')
+    return " AND ".join(parts) if parts else None
+
+
+class MessageSearchIndex(SidecarIndex):
+    """FTS5 index over messages.content, keyed by (id, chat_jid).
+
+    message_keys maps each indexed message to the FTS rowid so that messages
+    the bridge rewrites (INSERT OR REPLACE) are replaced rather than duplicated.
+    The unicode61 tokenizer folds case and diacritics for all scripts, unlike
+    SQLite's ASCII-only LOWER().
+    """
+
+    name = "message_search"
+    filename = "search_index.db"
+    source_columns = "id, chat_jid, content"
+
+    def create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS message_keys (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                chat_jid TEXT NOT NULL,
+                UNIQUE (id, chat_jid)
+            )
+        """)
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+                content,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+
+    def apply(self, conn: sqlite3.Connection, rows: List[tuple]) -> None:
+        for _, message_id, chat_jid, content in rows:
+            existing = conn.execute(
+                "SELECT rowid FROM message_keys WHERE id = ? AND chat_jid = ?",
+                (message_id, chat_jid),
+            ).fetchone()
+            if existing:
+                key = existing[0]
+                conn.execute("DELETE FROM message_fts WHERE rowid = ?", (key,))
+            else:
+                key = conn.execute(
+                    "INSERT INTO message_keys (id, chat_jid) VALUES (?, ?)",
+                    (message_id, chat_jid),
+                ).lastrowid
+            if content:
+                conn.execute("INSERT INTO message_fts (rowid, content) VALUES (?, ?)", (key, content))
+
+    def reset(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM message_fts")
+        conn.execute("DELETE FROM message_keys")
+
+    def attach_to(self, source_path: str) -> None:
+        """Make the index queryable as search.* from pooled readers of source_path."""
+        self.connection()
+        db.register_attachment(source_path, SEARCH_SCHEMA, self.path)
+
+
+_FTS5_AVAILABLE = fts5_available()
+_index = MessageSearchIndex(os.getenv('SEARCH_INDEX_PATH') or None)
+
+
+def get_index() -> MessageSearchIndex:
+    return _index
+
+
+def prepare(source_path: str) -> bool:
+    """Get the search index ready for a query against source_path.
+
+    Returns True if list_messages can plan through the FTS index, False if it
+    should fall back to a LIKE scan (no FTS5, or the index is still building).
+    """
+    if not _FTS5_AVAILABLE:
+        return False
+    try:
+        _index.attach_to(source_path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Search index unavailable: {e}")
+        return False
+    return _index.refresh(source_path)
+
+
+def start(source_path: str) -> None:
+    """Start building/maintaining the index in the background (e.g. at server start)."""
+    if not _FTS5_AVAILABLE:
+        print("SQLite was built without FTS5; message search will use LIKE scans")
+        return
+    try:
+        _index.attach_to(source_path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Search index unavailable: {e}")
+        return
+    _index.start_background_sync(source_path)
@@ -0,0 +1,85 @@
+import dataclasses
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Response formats accepted by the tools' format option
+FORMAT_JSON = "json"        # compact JSON, null fields dropped
+FORMAT_COLUMNS = "columns"  # compact JSON with lists of records as {"columns": [...], "rows": [[...]]}
+FORMAT_TEXT = "text"        # the original text rendering (message transcripts, Python reprs)
+FORMATS = (FORMAT_JSON, FORMAT_COLUMNS, FORMAT_TEXT)
+
+MCP_RESPONSE_FORMAT = os.getenv('MCP_RESPONSE_FORMAT', FORMAT_JSON)
+
+
+def resolve_format(fmt: Optional[str], default: Optional[str] = None) -> str:
+    """Pick the response format: fmt if given, else default, else MCP_RESPONSE_FORMAT.
+
+    Raises:
+        ValueError: If the format is not one of FORMATS
+    """
+    chosen = (fmt or default or MCP_RESPONSE_FORMAT).lower()
+    if chosen not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of: {', '.join(FORMATS)}")
+    return chosen
+
+
+def to_plain(value: Any) -> Any:
+    """Convert dataclasses, datetimes and containers to JSON-ready values, dropping None fields."""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {
+            f.name: to_plain(item)
+            for f in dataclasses.fields(value)
+            for item in (getattr(value, f.name),)
+            if item is not None
+        }
+    if isinstance(value, dict):
+        return {str(key): to_plain(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def to_columns(value: Any) -> Any:
+    """Rewrite every list of records in a plain value as {"columns": [...], "rows": [[...]]}.
+
+    Columns appear in order of first use; a record missing a column gets null
+    in that position.
+    """
+    if isinstance(value, dict):
+        return {key: to_columns(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if value and all(isinstance(item, dict) for item in value):
+            columns: Dict[str, None] = {}
+            for record in value:
+                columns.update(dict.fromkeys(record))
+            names: List[str] = list(columns)
+            return {
+                "columns": names,
+                "rows": [[to_columns(record.get(name)) for name in names] for record in value],
+            }
+        return [to_columns(item) for item in value]
+    return value
+
+
+def dumps(value: Any, fmt: str) -> str:
+    """Render a tool result in the given format (see FORMATS)."""
+    if fmt == FORMAT_TEXT:
+        return value if isinstance(value, str) else str(value)
+    plain = to_plain(value)
+    if fmt == FORMAT_COLUMNS:
+        plain = to_columns(plain)
+    return json.dumps(plain, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def dumps_page(items: Any, next_cursor: Optional[str], fmt: str) -> str:
+    """Render one page of a listing together with the cursor for the next page."""
+    if fmt == FORMAT_TEXT:
+        output = items if isinstance(items, str) else str(items)
+        return f"{output}\nNext cursor: {next_cursor}" if next_cursor else output
+    return dumps({"results": items, "next_cursor": next_cursor}, fmt)
@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+import db
+
+# Sidecar indexes live next to the bridge's databases but in files the bridge never touches
+SIDECAR_DIR = os.getenv('SIDECAR_DIR', os.path.join('/app', 'store', 'mcp'))
+SIDECAR_BATCH_SIZE = int(os.getenv('SIDECAR_BATCH_SIZE', '5000'))
+# Backlogs up to this many rows are indexed inline by the query that needs them;
+# larger ones (e.g. the first build on a big store) are left to the background thread.
+SIDECAR_INLINE_SYNC_ROWS = int(os.getenv('SIDECAR_INLINE_SYNC_ROWS', '20000'))
+SIDECAR_SYNC_INTERVAL = float(os.getenv('SIDECAR_SYNC_INTERVAL', '2.0'))
+
+
+class SidecarIndex:
+    """A derived index over messages.db kept in its own SQLite file.
+
+    The Go bridge owns the messages.db schema, so anything the MCP server wants
+    to precompute lives in a sidecar file and is brought up to date
+    incrementally: every messages row with a rowid above the stored watermark
+    is fed to apply(). The bridge writes with INSERT OR REPLACE, which gives a
+    replaced message a new rowid, so apply() must upsert by (id, chat_jid).
+
+    Subclasses set name/filename/source_columns and implement create_schema,
+    apply and reset.
+    """
+
+    name = "sidecar"
+    filename = "sidecar.db"
+    # Columns read from messages for each new row; rowid is always selected first
+    source_columns = "id, chat_jid"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(SIDECAR_DIR, self.filename)
+        self._sync_lock = threading.Lock()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._watchers = {}
+        self._caught_up = False
+        # Bumped whenever a source change is seen; a sync that started before
+        # the bump must not report the index caught up
+        self._generation = 0
+        self._state_lock = threading.Lock()
+        self._background: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # -- subclass hooks ---------------------------------------------------
+
+    def create_schema(self, conn: sqlite3.Connection) -> None:
+        raise NotImplementedError
+
+    def apply(self, conn: sqlite3.Connection, rows: List[tuple]) -> None:
+        """Fold a batch of (rowid, *source_columns) rows into the index."""
+        raise NotImplementedError
+
+    def reset(self, conn: sqlite3.Connection) -> None:
+        """Drop all derived rows before a full rebuild."""
+        raise NotImplementedError
+
+    # -- storage ------------------------------------------------------------
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's writable connection to the sidecar, creating it on first use."""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    conn = db.get_connection(self.path, readonly=False)
+                    conn.execute("PRAGMA journal_mode = WAL")
+                    conn.execute("PRAGMA synchronous = NORMAL")
+                    with conn:
+                        conn.execute("""
+                            CREATE TABLE IF NOT EXISTS sidecar_meta (
+                                key TEXT PRIMARY KEY,
+                                value INTEGER NOT NULL
+                            )
+                        """)
+                        self.create_schema(conn)
+                    self._initialized = True
+        return db.get_connection(self.path, readonly=False)
+
+    def watermark(self) -> int:
+        row = self.connection().execute(
+            "SELECT value FROM sidecar_meta WHERE key = ?", (f"{self.name}_watermark",)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _set_watermark(self, conn: sqlite3.Connection, value: int) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO sidecar_meta (key, value) VALUES (?, ?)",
+            (f"{self.name}_watermark", value),
+        )
+
+    # -- syncing --------------------------------------------------------------
+
+    def backlog(self, source_path: str) -> int:
+        """Approximate number of source rows not yet indexed."""
+        max_rowid = db.fetchone(source_path, "SELECT MAX(rowid) FROM messages")[0] or 0
+        return max(0, max_rowid - self.watermark())
+
+    def sync(self, source_path: str, max_rows: Optional[int] = None, wait: bool = True) -> bool:
+        """Index new source rows; return True once the index is caught up.
+
+        With wait=False, returns immediately (reporting the last known state)
+        if another thread is already syncing.
+        """
+        if not self._sync_lock.acquire(blocking=wait):
+            return self._caught_up
+        try:
+            generation = self._generation
+            conn = self.connection()
+            watermark = self.watermark()
+            max_rowid = db.fetchone(source_path, "SELECT MAX(rowid) FROM messages")[0] or 0
+            if max_rowid < watermark:
+                # Source was rebuilt or replaced underneath us: start over
+                with conn:
+                    self.reset(conn)
+                    self._set_watermark(conn, 0)
+                watermark = 0
+
+            processed = 0
+            while max_rows is None or processed < max_rows:
+                rows = db.fetchall(source_path, f"""
+                    SELECT rowid, {self.source_columns}
+                    FROM messages
+                    WHERE rowid > ?
+                    ORDER BY rowid
+                    LIMIT ?
+                """, (watermark, SIDECAR_BATCH_SIZE))
+                if not rows:
+                    break
+                with conn:
+                    self.apply(conn, rows)
+                    watermark = rows[-1][0]
+                    self._set_watermark(conn, watermark)
+                processed += len(rows)
+                if len(rows) < SIDECAR_BATCH_SIZE:
+                    break
+
+            with self._state_lock:
+                # A commit noticed while we ran may hold rows above max_rowid
+                self._caught_up = watermark >= max_rowid and generation == self._generation
+                return self._caught_up
+        finally:
+            self._sync_lock.release()
+
+    def _check_source(self, source_path: str) -> None:
+        """Mark the index stale if the source database was written since the last check."""
+        watcher = self._watchers.get(source_path)
+        if watcher is None:
+            watcher = self._watchers.setdefault(source_path, db.DataVersionWatcher(source_path))
+        if watcher.poll():
+            with self._state_lock:
+                self._generation += 1
+                self._caught_up = False
+
+    def refresh(self, source_path: str) -> bool:
+        """Bring the index up to date for a query; return True if it can be used.
+
+        Cheap when nothing changed (one PRAGMA data_version). Small backlogs are
+        indexed inline; large ones are handed to the background thread and the
+        caller should fall back to querying messages.db directly.
+        """
+        try:
+            self._check_source(source_path)
+            if self._caught_up:
+                return True
+            if self.backlog(source_path) <= SIDECAR_INLINE_SYNC_ROWS:
+                return self.sync(source_path, wait=False)
+            self.start_background_sync(source_path)
+            return False
+        except sqlite3.Error as e:
+            print(f"Error refreshing {self.name} index: {e}")
+            return False
+
+    def start_background_sync(self, source_path: str, interval: float = SIDECAR_SYNC_INTERVAL) -> None:
+        """Keep the index current from a daemon thread (idempotent)."""
+        if self._background is not None and self._background.is_alive():
+            return
+
+        def run() -> None:
+            while not self._stop.is_set():
+                try:
+                    self._check_source(source_path)
+                    if not self._caught_up:
+                        self.sync(source_path)
+                except sqlite3.Error as e:
+                    print(f"Error syncing {self.name} index: {e}")
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._background = threading.Thread(target=run, name=f"{self.name}-sync", daemon=True)
+        self._background.start()
+
+    def stop(self) -> None:
+        self._stop.set()
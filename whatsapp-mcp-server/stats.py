@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import db
+import migrations
+
+# Recompute at most this often, and only when a database actually changed
+STATS_REFRESH_INTERVAL = float(os.getenv('STATS_REFRESH_INTERVAL', '60'))
+STATS_TOP_CHATS = int(os.getenv('STATS_TOP_CHATS', '20'))
+
+
+def file_size(path: str) -> Optional[int]:
+    """Size of path in bytes, or None if it does not exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def _database_files(db_path: str) -> Dict[str, Any]:
+    """On-disk size of a database and its WAL/shared-memory files, in bytes."""
+    info = {
+        "path": db_path,
+        "size_bytes": file_size(db_path),
+        "wal_bytes": file_size(db_path + "-wal"),
+        "shm_bytes": file_size(db_path + "-shm"),
+    }
+    if info["size_bytes"] is not None:
+        try:
+            page_size = db.fetchone(db_path, "PRAGMA page_size")[0]
+            info["freelist_bytes"] = db.fetchone(db_path, "PRAGMA freelist_count")[0] * page_size
+        except sqlite3.Error:
+            pass
+    return info
+
+
+def _count(db_path: str, table: str) -> Optional[int]:
+    try:
+        return db.fetchone(db_path, f"SELECT COUNT(*) FROM {table}")[0]
+    except sqlite3.Error:
+        return None
+
+
+def compute_stats(messages_db_path: str, whatsapp_db_path: str) -> Dict[str, Any]:
+    """Collect table counts, file sizes, busiest chats and index presence."""
+    started = time.monotonic()
+    stats: Dict[str, Any] = {
+        "databases": {
+            "messages": _database_files(messages_db_path),
+            "whatsapp": _database_files(whatsapp_db_path),
+        },
+        "tables": {
+            "messages": _count(messages_db_path, "messages"),
+            "chats": _count(messages_db_path, "chats"),
+            "contact_nicknames": _count(messages_db_path, "contact_nicknames"),
+            "whatsmeow_contacts": _count(whatsapp_db_path, "whatsmeow_contacts"),
+        },
+    }
+
+    try:
+        rows = db.fetchall(messages_db_path, """
+            SELECT counts.chat_jid, chats.name, counts.message_count
+            FROM (
+                SELECT chat_jid, COUNT(*) AS message_count
+                FROM messages
+                GROUP BY chat_jid
+            ) counts
+            LEFT JOIN chats ON chats.jid = counts.chat_jid
+            ORDER BY counts.message_count DESC
+            LIMIT ?
+        """, (STATS_TOP_CHATS,))
+        stats["top_chats"] = [
+            {"jid": jid, "name": name, "messages": count} for jid, name, count in rows
+        ]
+    except sqlite3.Error as e:
+        print(f"Error computing per-chat message counts: {e}")
+        stats["top_chats"] = []
+
+    try:
+        existing = migrations.existing_indexes(messages_db_path)
+    except sqlite3.Error:
+        existing = {}
+    stats["indexes"] = {
+        "present": sorted(f"{table}.{name}" for name, table in existing.items()),
+        "missing": [
+            f"{index.table}.{index.name}" for index in migrations.EXPECTED_INDEXES
+            if index.name not in existing
+        ],
+    }
+
+    stats["computed_at"] = datetime.now(timezone.utc).isoformat()
+    stats["compute_seconds"] = round(time.monotonic() - started, 3)
+    return stats
+
+
+class StoreStats:
+    """Cached store statistics, recomputed off the request path.
+
+    The snapshot is rebuilt by a background thread when PRAGMA data_version
+    shows that either database was written since the last run, but no more
+    than once per STATS_REFRESH_INTERVAL. Readers always get the last snapshot.
+    """
+
+    def __init__(self, messages_db_path: str, whatsapp_db_path: str):
+        self.messages_db_path = messages_db_path
+        self.whatsapp_db_path = whatsapp_db_path
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._watchers = [
+            db.DataVersionWatcher(messages_db_path),
+            db.DataVersionWatcher(whatsapp_db_path),
+        ]
+        self._background: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _changed(self) -> bool:
+        changed = False
+        for watcher in self._watchers:
+            try:
+                # Poll every watcher so each one's baseline stays current
+                changed = watcher.poll() or changed
+            except sqlite3.Error:
+                changed = True
+        return changed
+
+    def refresh(self) -> Dict[str, Any]:
+        snapshot = compute_stats(self.messages_db_path, self.whatsapp_db_path)
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def get(self) -> Dict[str, Any]:
+        """Return the latest snapshot, computing the first one if needed."""
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    def start_background_refresh(self, interval: float = STATS_REFRESH_INTERVAL) -> None:
+        """Keep the snapshot current from a daemon thread (idempotent)."""
+        if self._background is not None and self._background.is_alive():
+            return
+
+        def run() -> None:
+            while not self._stop.is_set():
+                try:
+                    if self._changed():
+                        self.refresh()
+                except sqlite3.Error as e:
+                    print(f"Error computing store stats: {e}")
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._background = threading.Thread(target=run, name="store-stats", daemon=True)
+        self._background.start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -1,12 +1,29 @@
+import asyncio
 import sqlite3
+import threading
+import time
 from datetime import datetime
 from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from typing import Any, Awaitable, Callable, Optional, List, Tuple, Dict, Iterable
 import os
 import os.path
-import requests
+import httpx
 import json
 import audio
+from bridge_client import BridgeClient
+import chat_summary
+from concurrency import RESOURCE_DB, RateLimiter, interactive, run_blocking
+import db
+import media_store
+import migrations
+import participant_index
+import phone_index
+import prefetch
+import search_index
+import stats
+from pagination import encode_cursor, decode_cursor
+from name_cache import NameCache, SOURCE_NICKNAME, SOURCE_CONTACT, SOURCE_CHAT, SOURCE_FALLBACK
+from contact_directory import ContactDirectory, ContactEntry
 
 MESSAGES_DB_PATH = os.path.join('/app', 'store', 'messages.db')
 # MESSAGES_DB_PATH = "/home/ubuntu/docker/whatsapp-mcp/store/messages.db"
@@ -17,6 +34,21 @@ WHATSAPP_DB_PATH = os.path.join('/app', 'store', 'whatsapp.db')
 # Use environment variable for bridge host, default to localhost for development
 BRIDGE_HOST = os.getenv('BRIDGE_HOST', 'localhost')
 WHATSAPP_API_BASE_URL = f"http://{BRIDGE_HOST}:8080/api"
+_bridge = BridgeClient(WHATSAPP_API_BASE_URL)
+
+# Fan-out limits for send_messages_batch; the rate keeps broadcasts well below
+# what WhatsApp tolerates from one account
+BATCH_SEND_CONCURRENCY = int(os.getenv('BATCH_SEND_CONCURRENCY', '4'))
+BATCH_SEND_RATE = float(os.getenv('BATCH_SEND_RATE', '2'))
+BATCH_SEND_MAX_ITEMS = int(os.getenv('BATCH_SEND_MAX_ITEMS', '1000'))
+# Limits for download_media_batch
+MEDIA_BATCH_CONCURRENCY = int(os.getenv('MEDIA_BATCH_CONCURRENCY', '4'))
+MEDIA_BATCH_MAX_ITEMS = int(os.getenv('MEDIA_BATCH_MAX_ITEMS', '200'))
+
+# Change feed (get_changes): rows per call, and how long and how often a call may wait for new rows
+CHANGE_FEED_MAX_ITEMS = int(os.getenv('CHANGE_FEED_MAX_ITEMS', '500'))
+CHANGE_FEED_MAX_WAIT_SECONDS = float(os.getenv('CHANGE_FEED_MAX_WAIT_SECONDS', '60'))
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv('CHANGE_FEED_POLL_INTERVAL', '0.5'))
 
 @dataclass
 class Message:
@@ -37,6 +69,7 @@ class Chat:
     last_message: Optional[str] = None
     last_sender: Optional[str] = None
     last_is_from_me: Optional[bool] = None
+    message_count: Optional[int] = None
 
     @property
     def is_group(self) -> bool:
@@ -60,79 +93,163 @@ class MessageContext:
     before: List[Message]
     after: List[Message]
 
-def get_sender_name(sender_jid: str) -> str:
-    """Get the best available name for a sender using both contact and chat data."""
+# In-process cache of resolved display names, invalidated when the source tables change
+_name_cache = NameCache()
+# Memory-resident contacts with a trigram index, for search_contacts and list_all_contacts
+_contact_directory = ContactDirectory(MESSAGES_DB_PATH, WHATSAPP_DB_PATH)
+# Phone number -> chat/contact JIDs, for exact phone lookups
+_phone_index = phone_index.PhoneIndex(MESSAGES_DB_PATH, WHATSAPP_DB_PATH)
+_store_stats = stats.StoreStats(MESSAGES_DB_PATH, WHATSAPP_DB_PATH)
+
+# Keep IN (...) lists below SQLite's default host parameter limit
+_IN_CHUNK_SIZE = 500
+
+def _chunks(items: List[str], size: int = _IN_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def resolve_sender_names(sender_jids: Iterable[str]) -> Dict[str, str]:
+    """Resolve display names for many senders at once.
+
+    Uses the same priority order as get_sender_name (nickname > full_name >
+    push_name > first_name > business_name > chat name) but with a handful of
+    IN (...) queries for the whole set instead of several queries per sender.
+    Names already in the cache are served without touching the database.
+    """
+    requested = list(dict.fromkeys(jid for jid in sender_jids if jid))
+    if not requested:
+        return {}
+
+    _name_cache.validate(MESSAGES_DB_PATH, WHATSAPP_DB_PATH)
+    cached, pending = _name_cache.get_many(requested)
+    if not pending:
+        return cached
+
+    names: Dict[str, str] = {}
+    sources: Dict[str, int] = {}
+
     try:
-        # First check for custom nickname
-        nickname = get_contact_nickname(sender_jid)
-        if nickname:
-            return nickname
-        
-        # Try to get rich contact information from WhatsApp store
-        whatsapp_conn = sqlite3.connect(WHATSAPP_DB_PATH)
-        whatsapp_cursor = whatsapp_conn.cursor()
-        
-        # Look for contact in WhatsApp contacts
-        whatsapp_cursor.execute("""
-            SELECT first_name, full_name, push_name, business_name
-            FROM whatsmeow_contacts
-            WHERE their_jid = ?
-            LIMIT 1
-        """, (sender_jid,))
-        
-        contact_result = whatsapp_cursor.fetchone()
-        whatsapp_conn.close()
-        
-        if contact_result:
-            first_name, full_name, push_name, business_name = contact_result
-            # Return the best available name
-            return full_name or push_name or first_name or business_name or sender_jid
-        
-        # Fall back to chat database
-        messages_conn = sqlite3.connect(MESSAGES_DB_PATH)
-        messages_cursor = messages_conn.cursor()
-        
-        # First try matching by exact JID
-        messages_cursor.execute("""
-            SELECT name
-            FROM chats
-            WHERE jid = ?
-            LIMIT 1
-        """, (sender_jid,))
-        
-        result = messages_cursor.fetchone()
-        
-        # If no result, try looking for the number within JIDs
-        if not result:
-            # Extract the phone number part if it's a JID
-            if '@' in sender_jid:
-                phone_part = sender_jid.split('@')[0]
-            else:
-                phone_part = sender_jid
-                
-            messages_cursor.execute("""
-                SELECT name
+        # First check for custom nicknames
+        for chunk in _chunks(pending):
+            placeholders = ",".join("?" * len(chunk))
+            rows = db.fetchall(MESSAGES_DB_PATH, f"""
+                SELECT jid, nickname
+                FROM contact_nicknames
+                WHERE jid IN ({placeholders})
+            """, chunk)
+            for jid, nickname in rows:
+                if nickname:
+                    names[jid] = nickname
+                    sources[jid] = SOURCE_NICKNAME
+        pending = [jid for jid in pending if jid not in names]
+
+        # Then rich contact information from WhatsApp store
+        for chunk in _chunks(pending):
+            placeholders = ",".join("?" * len(chunk))
+            rows = db.fetchall(WHATSAPP_DB_PATH, f"""
+                SELECT their_jid, first_name, full_name, push_name, business_name
+                FROM whatsmeow_contacts
+                WHERE their_jid IN ({placeholders})
+            """, chunk)
+            for jid, first_name, full_name, push_name, business_name in rows:
+                if jid not in names:
+                    names[jid] = full_name or push_name or first_name or business_name or jid
+                    sources[jid] = SOURCE_CONTACT
+        pending = [jid for jid in pending if jid not in names]
+
+        # Fall back to chat database, first trying to match by exact JID
+        for chunk in _chunks(pending):
+            placeholders = ",".join("?" * len(chunk))
+            rows = db.fetchall(MESSAGES_DB_PATH, f"""
+                SELECT jid, name
                 FROM chats
-                WHERE jid LIKE ?
-                LIMIT 1
-            """, (f"%{phone_part}%",))
-            
-            result = messages_cursor.fetchone()
-        
-        if result and result[0]:
-            return result[0]
-        else:
-            return sender_jid
-        
+                WHERE jid IN ({placeholders})
+            """, chunk)
+            for jid, name in rows:
+                names[jid] = name or jid
+                sources[jid] = SOURCE_CHAT
+        pending = [jid for jid in pending if jid not in names]
+
+        # If still unresolved, look for a chat with the same phone number
+        chat_jids = {jid: _phone_index.lookup(jid, phone_index.SOURCE_CHAT) for jid in pending}
+        candidates = list(dict.fromkeys(chat_jid for matches in chat_jids.values() for chat_jid in matches))
+        chat_names: Dict[str, Optional[str]] = {}
+        for chunk in _chunks(candidates):
+            placeholders = ",".join("?" * len(chunk))
+            chat_names.update(db.fetchall(MESSAGES_DB_PATH, f"""
+                SELECT jid, name
+                FROM chats
+                WHERE jid IN ({placeholders})
+            """, chunk))
+        for jid in pending:
+            name = next((chat_names[chat_jid] for chat_jid in chat_jids[jid] if chat_names.get(chat_jid)), None)
+            names[jid] = name or jid
+            sources[jid] = SOURCE_FALLBACK
+
     except sqlite3.Error as e:
-        print(f"Database error while getting sender name: {e}")
-        return sender_jid
-    finally:
-        if 'messages_conn' in locals():
-            messages_conn.close()
-
-def format_message(message: Message, show_chat_info: bool = True) -> None:
-    """Print a single message with consistent formatting."""
+        print(f"Database error while resolving sender names: {e}")
+
+    # Only cache names that were actually resolved, not error fallbacks
+    for jid, source in sources.items():
+        _name_cache.put(jid, names[jid], source)
+    for jid in pending:
+        names.setdefault(jid, jid)
+    names.update(cached)
+    return names
+
+def start_background_services() -> None:
+    """Start the background workers (index advisor, sidecar index sync, store stats, media prefetch) and clean up old audio files."""
+    migrations.start(MESSAGES_DB_PATH)
+    search_index.start(MESSAGES_DB_PATH)
+    chat_summary.start(MESSAGES_DB_PATH)
+    participant_index.start(MESSAGES_DB_PATH)
+    _store_stats.start_background_refresh()
+    prefetch.start(MESSAGES_DB_PATH, download_media)
+    audio.sweep_cache()
+
+def get_name_cache_stats() -> Dict[str, int]:
+    """Get hit/miss counters and size of the display-name cache."""
+    return _name_cache.stats()
+
+def get_store_stats() -> Dict[str, Any]:
+    """Get row counts, file sizes, busiest chats, index status and bridge latencies.
+
+    Database figures come from the last background snapshot (see stats.py);
+    cache counters are live.
+    """
+    result = dict(_store_stats.get())
+    result["search_index"] = {
+        "path": search_index.get_index().path,
+        "size_bytes": stats.file_size(search_index.get_index().path),
+    }
+    result["chat_summary"] = {
+        "path": chat_summary.get_index().path,
+        "size_bytes": stats.file_size(chat_summary.get_index().path),
+    }
+    result["participant_index"] = {
+        "path": participant_index.get_index().path,
+        "size_bytes": stats.file_size(participant_index.get_index().path),
+    }
+    result["name_cache"] = _name_cache.stats()
+    result["contact_directory"] = _contact_directory.stats()
+    result["phone_index"] = _phone_index.stats()
+    result["bridge"] = _bridge.stats()
+    result["audio_cache"] = audio.cache_stats()
+    result["ffmpeg"] = audio.get_pool().stats()
+    result["media_store"] = media_store.get_store().stats()
+    result["media_prefetch"] = prefetch.stats()
+    return result
+
+def get_sender_name(sender_jid: str) -> str:
+    """Get the best available name for a sender using both contact and chat data."""
+    return resolve_sender_names([sender_jid]).get(sender_jid, sender_jid)
+
+def format_message(message: Message, show_chat_info: bool = True, sender_names: Optional[Dict[str, str]] = None) -> None:
+    """Print a single message with consistent formatting.
+
+    sender_names is an optional pre-resolved map from resolve_sender_names; senders
+    missing from it are looked up individually.
+    """
     output = ""
     
     if show_chat_info and message.chat_name:
@@ -145,22 +262,118 @@ def format_message(message: Message, show_chat_info: bool = True) -> None:
         content_prefix = f"[{message.media_type} - Message ID: {message.id} - Chat JID: {message.chat_jid}] "
     
     try:
-        sender_name = get_sender_name(message.sender) if not message.is_from_me else "Me"
+        if message.is_from_me:
+            sender_name = "Me"
+        elif sender_names is not None and message.sender in sender_names:
+            sender_name = sender_names[message.sender]
+        else:
+            sender_name = get_sender_name(message.sender)
         output += f"From: {sender_name}: {content_prefix}{message.content}\n"
     except Exception as e:
         print(f"Error formatting message: {e}")
     return output
 
-def format_messages_list(messages: List[Message], show_chat_info: bool = True) -> None:
+def format_messages_list(messages: List[Message], show_chat_info: bool = True, sender_names: Optional[Dict[str, str]] = None) -> None:
     output = ""
     if not messages:
         output += "No messages to display."
         return output
     
+    if sender_names is None:
+        sender_names = resolve_sender_names(message.sender for message in messages if not message.is_from_me)
+    
     for message in messages:
-        output += format_message(message, show_chat_info)
+        output += format_message(message, show_chat_info, sender_names)
     return output
 
+def message_records(messages: List[Message]) -> List[Dict[str, Any]]:
+    """Messages as plain dicts with resolved sender names, for structured tool output."""
+    sender_names = resolve_sender_names(message.sender for message in messages if not message.is_from_me)
+    return [
+        {
+            "id": message.id,
+            "timestamp": message.timestamp,
+            "chat_jid": message.chat_jid,
+            "chat_name": message.chat_name,
+            "sender": message.sender,
+            "sender_name": "Me" if message.is_from_me else sender_names.get(message.sender, message.sender),
+            "is_from_me": bool(message.is_from_me),
+            "content": message.content,
+            "media_type": message.media_type,
+        }
+        for message in messages
+    ]
+
+# Columns selected for every Message row, in the order _message_from_row expects
+_MESSAGE_COLUMNS = "messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type"
+
+# Hits per context query; each hit adds up to two compound SELECT branches and six parameters
+_CONTEXT_CHUNK_SIZE = 100
+
+def _message_from_row(row: tuple) -> Message:
+    return Message(
+        timestamp=datetime.fromisoformat(row[0]),
+        sender=row[1],
+        chat_name=row[2],
+        content=row[3],
+        is_from_me=row[4],
+        chat_jid=row[5],
+        id=row[6],
+        media_type=row[7]
+    )
+
+def _fetch_contexts(conn: sqlite3.Connection, targets: List[tuple], before: int, after: int) -> List[MessageContext]:
+    """Fetch the before/after neighbours of many messages with one compound query.
+
+    targets are rows in _MESSAGE_COLUMNS order. Each target contributes a
+    "before" and an "after" branch (a LIMITed range over chat_jid + timestamp)
+    to a single UNION ALL statement, so a page of hits costs one query instead
+    of three per hit. Rows are bucketed back per target in branch order.
+    """
+    neighbours: Dict[Tuple[int, int], List[Message]] = {}
+    for chunk_start in range(0, len(targets), _CONTEXT_CHUNK_SIZE):
+        branches = []
+        params = []
+        for pos in range(chunk_start, min(chunk_start + _CONTEXT_CHUNK_SIZE, len(targets))):
+            timestamp, chat_jid = targets[pos][0], targets[pos][5]
+            if before:
+                branches.append(f"""
+                    SELECT * FROM (
+                        SELECT {pos}, 0, {_MESSAGE_COLUMNS}
+                        FROM messages
+                        JOIN chats ON messages.chat_jid = chats.jid
+                        WHERE messages.chat_jid = ? AND messages.timestamp < ?
+                        ORDER BY messages.timestamp DESC
+                        LIMIT ?
+                    )
+                """)
+                params.extend([chat_jid, timestamp, before])
+            if after:
+                branches.append(f"""
+                    SELECT * FROM (
+                        SELECT {pos}, 1, {_MESSAGE_COLUMNS}
+                        FROM messages
+                        JOIN chats ON messages.chat_jid = chats.jid
+                        WHERE messages.chat_jid = ? AND messages.timestamp > ?
+                        ORDER BY messages.timestamp ASC
+                        LIMIT ?
+                    )
+                """)
+                params.extend([chat_jid, timestamp, after])
+        if not branches:
+            break
+        for row in conn.execute(" UNION ALL ".join(branches), params):
+            neighbours.setdefault((row[0], row[1]), []).append(_message_from_row(row[2:]))
+
+    return [
+        MessageContext(
+            message=_message_from_row(target),
+            before=neighbours.get((pos, 0), []),
+            after=neighbours.get((pos, 1), [])
+        )
+        for pos, target in enumerate(targets)
+    ]
+
 def list_messages(
     after: Optional[str] = None,
     before: Optional[str] = None,
@@ -171,31 +384,66 @@ def list_messages(
     page: int = 0,
     include_context: bool = True,
     context_before: int = 1,
-    context_after: int = 1
+    context_after: int = 1,
+    sort_by: str = "timestamp"
 ) -> List[Message]:
     """Get messages matching the specified criteria with optional context."""
-    print(f"Debug: Database path: {MESSAGES_DB_PATH}")
-    print(f"Debug: Database exists: {os.path.exists(MESSAGES_DB_PATH)}")
-    
+    return list_messages_page(
+        after=after,
+        before=before,
+        sender_phone_number=sender_phone_number,
+        chat_jid=chat_jid,
+        query=query,
+        limit=limit,
+        page=page,
+        include_context=include_context,
+        context_before=context_before,
+        context_after=context_after,
+        sort_by=sort_by
+    )[0]
+
+def list_messages_page(
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    sender_phone_number: Optional[str] = None,
+    chat_jid: Optional[str] = None,
+    query: Optional[str] = None,
+    limit: int = 20,
+    page: int = 0,
+    include_context: bool = True,
+    context_before: int = 1,
+    context_after: int = 1,
+    sort_by: str = "timestamp",
+    cursor: Optional[str] = None,
+    formatted: bool = True
+) -> Tuple[Any, Optional[str]]:
+    """Get a page of messages plus a cursor for the next page (None on the last page).
+
+    The page is a text transcript, or with formatted=False a list of
+    message_records() in the same order.
+
+    Pass the returned cursor back to continue where the page ended; unlike
+    page/OFFSET this stays fast on deep pages and does not skip or repeat
+    messages when new ones arrive in between. page is ignored when cursor is set.
+
+    When query is set, matching goes through the full-text index: words match
+    by prefix, "quoted text" matches as a phrase, and sort_by="relevance"
+    orders hits by bm25 rank instead of newest first. If the index is not
+    available yet, query falls back to a case-insensitive substring scan.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        # Debug: Check if tables exist
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        print(f"Debug: Available tables: {tables}")
-        
-        # Debug: Check row counts
-        try:
-            cursor.execute("SELECT COUNT(*) FROM messages")
-            msg_count = cursor.fetchone()[0]
-            print(f"Debug: Total messages in database: {msg_count}")
-        except Exception as e:
-            print(f"Debug: Error counting messages: {e}")
+        # Plan content search through the FTS sidecar when it is ready
+        match_expression = None
+        if query and search_index.prepare(MESSAGES_DB_PATH):
+            match_expression = search_index.to_match_expression(query)
         
         # Build base query
-        query_parts = ["SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type FROM messages"]
+        if match_expression:
+            query_parts = [f"SELECT {_MESSAGE_COLUMNS} FROM {search_index.SEARCH_SCHEMA}.message_fts"]
+            query_parts.append(f"JOIN {search_index.SEARCH_SCHEMA}.message_keys ON message_keys.rowid = message_fts.rowid")
+            query_parts.append("JOIN messages ON messages.id = message_keys.id AND messages.chat_jid = message_keys.chat_jid")
+        else:
+            query_parts = [f"SELECT {_MESSAGE_COLUMNS} FROM messages"]
         query_parts.append("JOIN chats ON messages.chat_jid = chats.jid")
         where_clauses = []
         params = []
@@ -227,56 +475,69 @@ def list_messages(
             where_clauses.append("messages.chat_jid = ?")
             params.append(chat_jid)
             
-        if query:
+        if match_expression:
+            where_clauses.append("message_fts MATCH ?")
+            params.append(match_expression)
+        elif query:
             where_clauses.append("LOWER(messages.content) LIKE LOWER(?)")
             params.append(f"%{query}%")
             
+        # Add pagination: relevance order pages by offset, newest-first by keyset
+        by_relevance = bool(match_expression) and sort_by == "relevance"
+        offset = page * limit
+        if cursor and by_relevance:
+            offset = decode_cursor(cursor, "messages_relevance", 1)[0]
+        elif cursor:
+            cursor_timestamp, cursor_id, cursor_chat_jid = decode_cursor(cursor, "messages", 3)
+            where_clauses.append("(messages.timestamp, messages.id, messages.chat_jid) < (?, ?, ?)")
+            params.extend([cursor_timestamp, cursor_id, cursor_chat_jid])
+            offset = 0
+            
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
-        # Add pagination
-        offset = page * limit
-        query_parts.append("ORDER BY messages.timestamp DESC")
+        if by_relevance:
+            query_parts.append("ORDER BY bm25(message_fts), messages.timestamp DESC")
+        else:
+            query_parts.append("ORDER BY messages.timestamp DESC, messages.id DESC, messages.chat_jid DESC")
+        # Fetch one extra row to know whether another page follows
         query_parts.append("LIMIT ? OFFSET ?")
-        params.extend([limit, offset])
+        params.extend([limit + 1, offset])
         
-        cursor.execute(" ".join(query_parts), tuple(params))
-        messages = cursor.fetchall()
+        # Fetch the hits and, if requested, all their context in one read transaction
+        def fetch(conn):
+            rows = conn.execute(" ".join(query_parts), tuple(params)).fetchall()
+            rows, more = rows[:limit], len(rows) > limit
+            contexts = _fetch_contexts(conn, rows, context_before, context_after) if include_context and rows else []
+            return rows, more, contexts
         
-        result = []
-        for msg in messages:
-            message = Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            )
-            result.append(message)
+        messages, more, contexts = db.read_transaction(MESSAGES_DB_PATH, fetch)
+        
+        next_cursor = None
+        if more and by_relevance:
+            next_cursor = encode_cursor("messages_relevance", [offset + len(messages)])
+        elif more:
+            last = messages[-1]
+            next_cursor = encode_cursor("messages", [last[0], last[6], last[5]])
+        
+        result = [_message_from_row(msg) for msg in messages]
             
         if include_context and result:
             # Add context for each message
             messages_with_context = []
-            for msg in result:
-                context = get_message_context(msg.id, context_before, context_after)
+            for context in contexts:
                 messages_with_context.extend(context.before)
                 messages_with_context.append(context.message)
                 messages_with_context.extend(context.after)
-            
-            return format_messages_list(messages_with_context, show_chat_info=True)
-            
-        # Format and display messages without context
-        return format_messages_list(result, show_chat_info=True)    
+            result = messages_with_context
+        
+        if not formatted:
+            return message_records(result), next_cursor
+        return format_messages_list(result, show_chat_info=True), next_cursor
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
+        return [], None
 
 
 def get_message_context(
@@ -286,91 +547,195 @@ def get_message_context(
 ) -> MessageContext:
     """Get context around a specific message."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
+        # Get the target message first, then its neighbours in the same snapshot
+        def fetch(conn):
+            msg_data = conn.execute(f"""
+                SELECT {_MESSAGE_COLUMNS}
+                FROM messages
+                JOIN chats ON messages.chat_jid = chats.jid
+                WHERE messages.id = ?
+            """, (message_id,)).fetchone()
+            if not msg_data:
+                return None
+            return _fetch_contexts(conn, [msg_data], before, after)[0]
         
-        # Get the target message first
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.chat_jid, messages.media_type
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.id = ?
-        """, (message_id,))
-        msg_data = cursor.fetchone()
+        context = db.read_transaction(MESSAGES_DB_PATH, fetch)
         
-        if not msg_data:
+        if not context:
             raise ValueError(f"Message with ID {message_id} not found")
-            
-        target_message = Message(
-            timestamp=datetime.fromisoformat(msg_data[0]),
-            sender=msg_data[1],
-            chat_name=msg_data[2],
-            content=msg_data[3],
-            is_from_me=msg_data[4],
-            chat_jid=msg_data[5],
-            id=msg_data[6],
-            media_type=msg_data[8]
-        )
-        
-        # Get messages before
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type
-            FROM messages
-            JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp < ?
-            ORDER BY messages.timestamp DESC
-            LIMIT ?
-        """, (msg_data[7], msg_data[0], before))
         
-        before_messages = []
-        for msg in cursor.fetchall():
-            before_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            ))
+        return context
         
-        # Get messages after
-        cursor.execute("""
-            SELECT messages.timestamp, messages.sender, chats.name, messages.content, messages.is_from_me, chats.jid, messages.id, messages.media_type
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        raise
+
+
+def get_changes(
+    watermark: Optional[str] = None,
+    chat_jids: Optional[List[str]] = None,
+    limit: int = 100,
+    formatted: bool = False
+) -> Dict[str, Any]:
+    """Get messages stored since watermark, oldest first, plus the watermark to pass next time.
+
+    The watermark is an opaque cursor over messages rowids. Without one the
+    feed starts at the newest message and returns nothing. Messages the
+    bridge rewrites (e.g. edits) get a new rowid and show up again. If
+    messages.db was rebuilt (its rowids went backwards) the feed restarts at
+    the newest message and reports "reset".
+
+    Returns:
+        {"messages": records (or a transcript with formatted=True), "count": int,
+         "watermark": cursor, "has_more": True if limit cut the batch short,
+         "reset": bool}
+
+    Raises:
+        ValueError: If watermark is not a change-feed cursor
+    """
+    after = decode_cursor(watermark, "changes", 1)[0] if watermark else None
+    limit = max(1, min(limit, CHANGE_FEED_MAX_ITEMS))
+    chat_filter = ""
+    params: List[Any] = []
+    if chat_jids:
+        chat_filter = f"AND messages.chat_jid IN ({','.join('?' * len(chat_jids))})"
+        params.extend(chat_jids)
+
+    def fetch(conn):
+        max_rowid = conn.execute("SELECT MAX(rowid) FROM messages").fetchone()[0] or 0
+        if after is None or after > max_rowid:
+            return max_rowid, [], after is not None
+        rows = conn.execute(f"""
+            SELECT messages.rowid, {_MESSAGE_COLUMNS}
             FROM messages
             JOIN chats ON messages.chat_jid = chats.jid
-            WHERE messages.chat_jid = ? AND messages.timestamp > ?
-            ORDER BY messages.timestamp ASC
+            WHERE messages.rowid > ? AND messages.rowid <= ? {chat_filter}
+            ORDER BY messages.rowid
             LIMIT ?
-        """, (msg_data[7], msg_data[0], after))
-        
-        after_messages = []
-        for msg in cursor.fetchall():
-            after_messages.append(Message(
-                timestamp=datetime.fromisoformat(msg[0]),
-                sender=msg[1],
-                chat_name=msg[2],
-                content=msg[3],
-                is_from_me=msg[4],
-                chat_jid=msg[5],
-                id=msg[6],
-                media_type=msg[7]
-            ))
-        
-        return MessageContext(
-            message=target_message,
-            before=before_messages,
-            after=after_messages
-        )
-        
+        """, [after, max_rowid, *params, limit + 1]).fetchall()
+        return max_rowid, rows, False
+
+    try:
+        max_rowid, rows, reset = db.read_transaction(MESSAGES_DB_PATH, fetch)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         raise
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # Rows skipped by the chat filter are consumed too, so resume after the last row scanned
+    position = rows[-1][0] if has_more else max_rowid
+    messages = [_message_from_row(row[1:]) for row in rows]
+    return {
+        "messages": format_messages_list(messages) if formatted else message_records(messages),
+        "count": len(messages),
+        "watermark": encode_cursor("changes", [position]),
+        "has_more": has_more,
+        "reset": reset,
+    }
+
+# One watcher for all long-polls; the generation counter lets each waiter see every change
+_feed_watcher = db.DataVersionWatcher(MESSAGES_DB_PATH)
+_feed_lock = threading.Lock()
+_feed_generation = 0
+
+def _feed_changed_generation() -> int:
+    """Bump and return the change generation when messages.db was written since the last check."""
+    global _feed_generation
+    with _feed_lock:
+        if _feed_watcher.poll():
+            _feed_generation += 1
+        return _feed_generation
+
+@interactive
+async def get_changes_async(
+    watermark: Optional[str] = None,
+    chat_jids: Optional[List[str]] = None,
+    limit: int = 100,
+    wait_seconds: float = 0,
+    formatted: bool = False
+) -> Dict[str, Any]:
+    """get_changes that long-polls: with nothing new, wait up to wait_seconds for new messages.
+
+    Waiting costs one PRAGMA data_version per CHANGE_FEED_POLL_INTERVAL on a
+    dedicated connection; the feed is only re-queried once the database
+    reports a commit. Waiting does not hold a database worker.
+    """
+    deadline = time.monotonic() + max(0.0, min(wait_seconds, CHANGE_FEED_MAX_WAIT_SECONDS))
+    generation = await asyncio.to_thread(_feed_changed_generation)
+    result = await run_blocking(RESOURCE_DB, get_changes, watermark, chat_jids, limit, formatted)
+    reset = result["reset"]
+    while not result["count"] and time.monotonic() < deadline:
+        await asyncio.sleep(min(CHANGE_FEED_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+        current = await asyncio.to_thread(_feed_changed_generation)
+        if current != generation:
+            generation = current
+            result = await run_blocking(RESOURCE_DB, get_changes, result["watermark"], chat_jids, limit, formatted)
+    result["reset"] = reset
+    return result
+
+
+def _chat_keyset(cursor: str, sort_by: str, time_column: str, name_column: str, jid_column: str) -> Tuple[str, list]:
+    """Build the WHERE predicate that resumes a chat listing after cursor.
+
+    NULL last_message_time/name values sort last/first respectively, so they
+    need explicit handling instead of a plain row-value comparison.
+    """
+    if sort_by == "last_active":
+        last_time, last_jid = decode_cursor(cursor, "chats_last_active", 2)
+        if last_time is None:
+            return f"({time_column} IS NULL AND {jid_column} < ?)", [last_jid]
+        return (
+            f"({time_column} < ? OR ({time_column} = ? AND {jid_column} < ?) OR {time_column} IS NULL)",
+            [last_time, last_time, last_jid],
+        )
+    last_name, last_jid = decode_cursor(cursor, "chats_name", 2)
+    if last_name is None:
+        return f"(({name_column} IS NULL AND {jid_column} > ?) OR {name_column} IS NOT NULL)", [last_jid]
+    return f"({name_column} > ? OR ({name_column} = ? AND {jid_column} > ?))", [last_name, last_name, last_jid]
+
+def _chat_cursor(chat_data: tuple, sort_by: str) -> str:
+    if sort_by == "last_active":
+        return encode_cursor("chats_last_active", [chat_data[2], chat_data[0]])
+    return encode_cursor("chats_name", [chat_data[1], chat_data[0]])
+
+def _chat_select(include_last_message: bool) -> str:
+    """SELECT ... FROM chats yielding the columns _chat_from_row expects.
+
+    The last message comes from the chat summary sidecar when it is up to
+    date. While the summary is still building it is joined from messages at
+    chats.last_message_time, grouped so that messages sharing that timestamp
+    yield one row (SQLite takes the bare columns from the MAX(rowid) row).
+    """
+    columns = "chats.jid, chats.name, chats.last_message_time"
+    if not include_last_message:
+        return f"SELECT {columns}, NULL, NULL, NULL, NULL FROM chats"
+    if chat_summary.prepare(MESSAGES_DB_PATH):
+        return f"""
+            SELECT {columns}, s.last_content, s.last_sender, s.last_is_from_me, s.message_count
+            FROM chats
+            LEFT JOIN {chat_summary.SUMMARY_SCHEMA}.chat_summary s ON s.chat_jid = chats.jid
+        """
+    return f"""
+        SELECT * FROM (
+            SELECT {columns}, messages.content, messages.sender, messages.is_from_me, NULL, MAX(messages.rowid)
+            FROM chats
+            LEFT JOIN messages ON chats.jid = messages.chat_jid
+                AND chats.last_message_time = messages.timestamp
+            GROUP BY chats.jid
+        ) chats
+    """
+
+def _chat_from_row(chat_data: tuple) -> Chat:
+    return Chat(
+        jid=chat_data[0],
+        name=chat_data[1],
+        last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
+        last_message=chat_data[3],
+        last_sender=chat_data[4],
+        last_is_from_me=chat_data[5],
+        message_count=chat_data[6]
+    )
 
 def list_chats(
     query: Optional[str] = None,
@@ -380,43 +745,29 @@ def list_chats(
     sort_by: str = "last_active"
 ) -> List[Chat]:
     """Get chats matching the specified criteria."""
-    print(f"Debug: Database path: {MESSAGES_DB_PATH}")
-    print(f"Debug: Database exists: {os.path.exists(MESSAGES_DB_PATH)}")
-    
+    return list_chats_page(
+        query=query,
+        limit=limit,
+        page=page,
+        include_last_message=include_last_message,
+        sort_by=sort_by
+    )[0]
+
+def list_chats_page(
+    query: Optional[str] = None,
+    limit: int = 20,
+    page: int = 0,
+    include_last_message: bool = True,
+    sort_by: str = "last_active",
+    cursor: Optional[str] = None
+) -> Tuple[List[Chat], Optional[str]]:
+    """Get a page of chats plus a cursor for the next page (None on the last page).
+
+    page is ignored when cursor is set.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        # Debug: Check if tables exist
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        print(f"Debug: Available tables: {tables}")
-        
-        # Debug: Check row counts
-        try:
-            cursor.execute("SELECT COUNT(*) FROM chats")
-            chat_count = cursor.fetchone()[0]
-            print(f"Debug: Total chats in database: {chat_count}")
-        except Exception as e:
-            print(f"Debug: Error counting chats: {e}")
-        
         # Build base query
-        query_parts = ["""
-            SELECT 
-                chats.jid,
-                chats.name,
-                chats.last_message_time,
-                messages.content as last_message,
-                messages.sender as last_sender,
-                messages.is_from_me as last_is_from_me
-            FROM chats
-        """]
-        
-        if include_last_message:
-            query_parts.append("""
-                LEFT JOIN messages ON chats.jid = messages.chat_jid 
-                AND chats.last_message_time = messages.timestamp
-            """)
+        query_parts = [_chat_select(include_last_message)]
             
         where_clauses = []
         params = []
@@ -424,109 +775,57 @@ def list_chats(
         if query:
             where_clauses.append("(LOWER(chats.name) LIKE LOWER(?) OR chats.jid LIKE ?)")
             params.extend([f"%{query}%", f"%{query}%"])
+        
+        offset = (page ) * limit
+        if cursor:
+            predicate, cursor_params = _chat_keyset(cursor, sort_by, "chats.last_message_time", "chats.name", "chats.jid")
+            where_clauses.append(predicate)
+            params.extend(cursor_params)
+            offset = 0
             
         if where_clauses:
             query_parts.append("WHERE " + " AND ".join(where_clauses))
             
-        # Add sorting
-        order_by = "chats.last_message_time DESC" if sort_by == "last_active" else "chats.name"
+        # Add sorting, with the JID as a tie-breaker so keyset pages are stable
+        order_by = "chats.last_message_time DESC, chats.jid DESC" if sort_by == "last_active" else "chats.name, chats.jid"
         query_parts.append(f"ORDER BY {order_by}")
         
-        # Add pagination
-        offset = (page ) * limit
+        # Add pagination, fetching one extra row to know whether another page follows
         query_parts.append("LIMIT ? OFFSET ?")
-        params.extend([limit, offset])
+        params.extend([limit + 1, offset])
         
-        cursor.execute(" ".join(query_parts), tuple(params))
-        chats = cursor.fetchall()
+        chats = db.fetchall(MESSAGES_DB_PATH, " ".join(query_parts), tuple(params))
+        next_cursor = _chat_cursor(chats[limit - 1], sort_by) if len(chats) > limit else None
+        chats = chats[:limit]
         
-        result = []
-        for chat_data in chats:
-            chat = Chat(
-                jid=chat_data[0],
-                name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-                last_message=chat_data[3],
-                last_sender=chat_data[4],
-                last_is_from_me=chat_data[5]
-            )
-            result.append(chat)
-            
-        return result
+        return [_chat_from_row(chat_data) for chat_data in chats], next_cursor
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
+        return [], None
+
+
+def _contact_from_entry(entry: ContactEntry) -> Contact:
+    return Contact(
+        phone_number=entry.phone_number,
+        name=entry.display_name,
+        jid=entry.jid,
+        first_name=entry.first_name,
+        full_name=entry.full_name,
+        push_name=entry.push_name,
+        business_name=entry.business_name,
+        nickname=entry.nickname
+    )
 
 
 def search_contacts(query: str) -> List[Contact]:
-    """Search contacts by name or phone number using both WhatsApp contacts and chat data."""
+    """Search contacts by name, nickname or phone number."""
     try:
-        # Connect to both databases
-        whatsapp_conn = sqlite3.connect(WHATSAPP_DB_PATH)
-        whatsapp_cursor = whatsapp_conn.cursor()
-        
-        # Split query into characters to support partial matching
-        search_pattern = '%' + query + '%'
-        
-        # Query WhatsApp contacts database for rich contact information
-        whatsapp_cursor.execute("""
-            SELECT DISTINCT 
-                their_jid,
-                first_name,
-                full_name,
-                push_name,
-                business_name
-            FROM whatsmeow_contacts
-            WHERE 
-                (LOWER(COALESCE(first_name, '')) LIKE LOWER(?) OR 
-                 LOWER(COALESCE(full_name, '')) LIKE LOWER(?) OR 
-                 LOWER(COALESCE(push_name, '')) LIKE LOWER(?) OR 
-                 LOWER(COALESCE(business_name, '')) LIKE LOWER(?) OR
-                 LOWER(their_jid) LIKE LOWER(?))
-                AND their_jid NOT LIKE '%@g.us'
-            ORDER BY 
-                CASE 
-                    WHEN full_name IS NOT NULL AND full_name != '' THEN full_name
-                    WHEN push_name IS NOT NULL AND push_name != '' THEN push_name
-                    WHEN first_name IS NOT NULL AND first_name != '' THEN first_name
-                    ELSE their_jid
-                END
-            LIMIT 50
-        """, (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
-        whatsapp_contacts = whatsapp_cursor.fetchall()           
-        result = []
-        # If whatsapp_contacts is not empty, use only those
-        for contact_data in whatsapp_contacts:
-            jid = contact_data[0]
-            phone_number = jid.split('@')[0] if '@' in jid else jid
-            # Determine best display name
-            first_name = contact_data[1]
-            full_name = contact_data[2]
-            push_name = contact_data[3]
-            business_name = contact_data[4]
-            display_name = full_name or push_name or first_name or business_name or phone_number
-            contact = Contact(
-                phone_number=phone_number,
-                name=display_name,
-                jid=jid,
-                first_name=first_name,
-                full_name=full_name,
-                push_name=push_name,
-                business_name=business_name
-            )
-            result.append(contact)
-        return result
+        return [_contact_from_entry(entry) for entry in _contact_directory.search(query, limit=50)]
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return []
-    finally:
-        if 'whatsapp_conn' in locals():
-            whatsapp_conn.close()
 
 
 def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Chat]:
@@ -537,73 +836,106 @@ def get_contact_chats(jid: str, limit: int = 20, page: int = 0) -> List[Chat]:
         limit: Maximum number of chats to return (default 20)
         page: Page number for pagination (default 0)
     """
+    return get_contact_chats_page(jid, limit, page)[0]
+
+
+def get_contact_chats_page(jid: str, limit: int = 20, page: int = 0, cursor: Optional[str] = None) -> Tuple[List[Chat], Optional[str]]:
+    """Get a page of chats involving the contact plus a cursor for the next page.
+    
+    Args:
+        jid: The contact's JID to search for
+        limit: Maximum number of chats to return (default 20)
+        page: Page number for pagination, ignored when cursor is set (default 0)
+        cursor: Continuation cursor returned by the previous page (optional)
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT DISTINCT
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-            JOIN messages m ON c.jid = m.chat_jid
-            WHERE m.sender = ? OR c.jid = ?
-            ORDER BY c.last_message_time DESC
+        participant = participant_index.participant_key(jid)
+        if participant_index.prepare(MESSAGES_DB_PATH):
+            membership = f"""
+                JOIN {participant_index.PARTICIPANTS_SCHEMA}.chat_participants p ON p.chat_jid = chats.jid
+                WHERE p.participant = ?
+            """
+            params = [participant]
+        else:
+            # Index still building: the chats the index would give, i.e. chats with a
+            # message from the contact plus their direct chat if it has messages,
+            # with sender and chat JIDs matched by user part as participant_key does
+            membership = """
+                WHERE chats.jid IN (
+                    SELECT chat_jid FROM messages WHERE sender = ? OR sender GLOB ?
+                    UNION
+                    SELECT chat_jid FROM messages WHERE chat_jid = ? OR chat_jid GLOB ?
+                )
+            """
+            pattern = participant + "[@:]*"
+            params = [participant, pattern, participant, pattern]
+        keyset = ""
+        offset = page * limit
+        if cursor:
+            predicate, cursor_params = _chat_keyset(cursor, "last_active", "chats.last_message_time", "chats.name", "chats.jid")
+            keyset = f"AND {predicate}"
+            params.extend(cursor_params)
+            offset = 0
+        params.extend([limit + 1, offset])
+        
+        chats = db.fetchall(MESSAGES_DB_PATH, f"""
+            {_chat_select(True)}
+            {membership} {keyset}
+            ORDER BY chats.last_message_time DESC, chats.jid DESC
             LIMIT ? OFFSET ?
-        """, (jid, jid, limit, page * limit))
-        
-        chats = cursor.fetchall()
+        """, params)
+        next_cursor = _chat_cursor(chats[limit - 1], "last_active") if len(chats) > limit else None
         
-        result = []
-        for chat_data in chats:
-            chat = Chat(
-                jid=chat_data[0],
-                name=chat_data[1],
-                last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-                last_message=chat_data[3],
-                last_sender=chat_data[4],
-                last_is_from_me=chat_data[5]
-            )
-            result.append(chat)
-            
-        return result
+        return [_chat_from_row(chat_data) for chat_data in chats[:limit]], next_cursor
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        return []
-    finally:
-        if 'conn' in locals():
-            conn.close()
+        return [], None
+
 
+def get_last_interaction(jid: str, formatted: bool = True) -> Any:
+    """Get most recent message involving the contact.
 
-def get_last_interaction(jid: str) -> str:
-    """Get most recent message involving the contact."""
+    Returns a formatted line, or with formatted=False a message_records() dict.
+    """
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                m.timestamp,
-                m.sender,
-                c.name,
-                m.content,
-                m.is_from_me,
-                c.jid,
-                m.id,
-                m.media_type
-            FROM messages m
-            JOIN chats c ON m.chat_jid = c.jid
-            WHERE m.sender = ? OR c.jid = ?
-            ORDER BY m.timestamp DESC
-            LIMIT 1
-        """, (jid, jid))
-        
-        msg_data = cursor.fetchone()
+        participant = participant_index.participant_key(jid)
+        if participant_index.prepare(MESSAGES_DB_PATH):
+            msg_data = db.fetchone(MESSAGES_DB_PATH, f"""
+                SELECT m.timestamp, m.sender, c.name, m.content, m.is_from_me, c.jid, m.id, m.media_type
+                FROM {participant_index.PARTICIPANTS_SCHEMA}.chat_participants p
+                JOIN messages m ON m.id = p.last_message_id AND m.chat_jid = p.chat_jid
+                JOIN chats c ON m.chat_jid = c.jid
+                WHERE p.participant = ?
+                ORDER BY p.last_time DESC
+                LIMIT 1
+            """, (participant,))
+        else:
+            msg_data = db.fetchone(MESSAGES_DB_PATH, """
+                SELECT 
+                    m.timestamp,
+                    m.sender,
+                    c.name,
+                    m.content,
+                    m.is_from_me,
+                    c.jid,
+                    m.id,
+                    m.media_type
+                FROM (
+                    -- Newest message from the contact and newest in their chat, each
+                    -- read off its (column, timestamp) index, instead of an OR scan
+                    SELECT * FROM (
+                        SELECT * FROM messages WHERE sender IN (?, ?) ORDER BY timestamp DESC LIMIT 1
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT * FROM messages WHERE chat_jid = ? ORDER BY timestamp DESC LIMIT 1
+                    )
+                ) m
+                JOIN chats c ON m.chat_jid = c.jid
+                ORDER BY m.timestamp DESC
+                LIMIT 1
+            """, (jid, participant, jid))
         
         if not msg_data:
             return None
@@ -619,211 +951,278 @@ def get_last_interaction(jid: str) -> str:
             media_type=msg_data[7]
         )
         
-        return format_message(message)
+        if not formatted:
+            return message_records([message])[0]
+        return format_message(message, sender_names=resolve_sender_names([message.sender]))
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def get_chat(chat_jid: str, include_last_message: bool = True) -> Optional[Chat]:
     """Get chat metadata by JID."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT 
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-        """
-        
-        if include_last_message:
-            query += """
-                LEFT JOIN messages m ON c.jid = m.chat_jid 
-                AND c.last_message_time = m.timestamp
-            """
-            
-        query += " WHERE c.jid = ?"
-        
-        cursor.execute(query, (chat_jid,))
-        chat_data = cursor.fetchone()
+        query = _chat_select(include_last_message) + " WHERE chats.jid = ?"
+        chat_data = db.fetchone(MESSAGES_DB_PATH, query, (chat_jid,))
         
         if not chat_data:
             return None
             
-        return Chat(
-            jid=chat_data[0],
-            name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-            last_message=chat_data[3],
-            last_sender=chat_data[4],
-            last_is_from_me=chat_data[5]
-        )
+        return _chat_from_row(chat_data)
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def get_direct_chat_by_contact(sender_phone_number: str) -> Optional[Chat]:
     """Get chat metadata by sender phone number."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                c.jid,
-                c.name,
-                c.last_message_time,
-                m.content as last_message,
-                m.sender as last_sender,
-                m.is_from_me as last_is_from_me
-            FROM chats c
-            LEFT JOIN messages m ON c.jid = m.chat_jid 
-                AND c.last_message_time = m.timestamp
-            WHERE c.jid LIKE ? AND c.jid NOT LIKE '%@g.us'
+        chat_jids = _phone_index.lookup(sender_phone_number, phone_index.SOURCE_CHAT)
+        if not chat_jids:
+            return None
+        placeholders = ",".join("?" * len(chat_jids))
+        chat_data = db.fetchone(MESSAGES_DB_PATH, f"""
+            {_chat_select(True)}
+            WHERE chats.jid IN ({placeholders})
+            ORDER BY chats.last_message_time DESC
             LIMIT 1
-        """, (f"%{sender_phone_number}%",))
-        
-        chat_data = cursor.fetchone()
+        """, chat_jids)
         
         if not chat_data:
             return None
             
-        return Chat(
-            jid=chat_data[0],
-            name=chat_data[1],
-            last_message_time=datetime.fromisoformat(chat_data[2]) if chat_data[2] else None,
-            last_message=chat_data[3],
-            last_sender=chat_data[4],
-            last_is_from_me=chat_data[5]
-        )
+        return _chat_from_row(chat_data)
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
-def send_message(recipient: str, message: str) -> Tuple[bool, str]:
+def _parse_send_response(response: httpx.Response) -> Tuple[bool, str]:
+    """Turn a bridge /send response into (success, message)."""
+    if response.status_code != 200:
+        return False, f"Error: HTTP {response.status_code} - {response.text}"
     try:
-        # Validate input
-        if not recipient:
-            return False, "Recipient must be provided"
-        
-        url = f"{WHATSAPP_API_BASE_URL}/send"
-        payload = {
-            "recipient": recipient,
-            "message": message,
-        }
-        
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-            
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+        result = response.json()
     except json.JSONDecodeError:
         return False, f"Error parsing response: {response.text}"
+    return result.get("success", False), result.get("message", "Unknown response")
+
+def _post_send(payload: Dict[str, str]) -> Tuple[bool, str]:
+    try:
+        return _parse_send_response(_bridge.post("/send", payload))
+    except httpx.HTTPError as e:
+        return False, f"Request error: {str(e)}"
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
-def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
+async def _post_send_async(payload: Dict[str, str]) -> Tuple[bool, str]:
     try:
-        # Validate input
-        if not recipient:
-            return False, "Recipient must be provided"
-        
-        if not media_path:
-            return False, "Media path must be provided"
-        
-        if not os.path.isfile(media_path):
-            return False, f"Media file not found: {media_path}"
-        
-        url = f"{WHATSAPP_API_BASE_URL}/send"
-        payload = {
-            "recipient": recipient,
-            "media_path": media_path
-        }
-        
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-            
-    except requests.RequestException as e:
+        return _parse_send_response(await _bridge.apost("/send", payload))
+    except httpx.HTTPError as e:
         return False, f"Request error: {str(e)}"
-    except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
     except Exception as e:
         return False, f"Unexpected error: {str(e)}"
 
+def _check_media_send(recipient: str, media_path: str) -> Optional[str]:
+    """Return why a media send cannot be attempted, or None if it can."""
+    if not recipient:
+        return "Recipient must be provided"
+    if not media_path:
+        return "Media path must be provided"
+    if not os.path.isfile(media_path):
+        return f"Media file not found: {media_path}"
+    return None
+
+def send_message(recipient: str, message: str) -> Tuple[bool, str]:
+    # Validate input
+    if not recipient:
+        return False, "Recipient must be provided"
+    return _post_send({
+        "recipient": recipient,
+        "message": message,
+    })
+
+@interactive
+async def send_message_async(recipient: str, message: str) -> Tuple[bool, str]:
+    """Async flavor of send_message for use on an event loop."""
+    if not recipient:
+        return False, "Recipient must be provided"
+    return await _post_send_async({
+        "recipient": recipient,
+        "message": message,
+    })
+
+def send_file(recipient: str, media_path: str) -> Tuple[bool, str]:
+    error = _check_media_send(recipient, media_path)
+    if error:
+        return False, error
+    return _post_send({
+        "recipient": recipient,
+        "media_path": media_path
+    })
+
+@interactive
+async def send_file_async(recipient: str, media_path: str) -> Tuple[bool, str]:
+    """Async flavor of send_file for use on an event loop."""
+    error = _check_media_send(recipient, media_path)
+    if error:
+        return False, error
+    return await _post_send_async({
+        "recipient": recipient,
+        "media_path": media_path
+    })
+
 def send_audio_message(recipient: str, media_path: str) -> Tuple[bool, str]:
+    error = _check_media_send(recipient, media_path)
+    if error:
+        return False, error
+
     try:
-        # Validate input
-        if not recipient:
-            return False, "Recipient must be provided"
-        
-        if not media_path:
-            return False, "Media path must be provided"
-        
-        if not os.path.isfile(media_path):
-            return False, f"Media file not found: {media_path}"
+        # Pass Ogg/Opus through, remux Opus from other containers, encode the rest
+        media_path = audio.prepare_voice_note(media_path)
+    except audio.FfmpegBusyError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"Error converting file to opus ogg. You likely need to install ffmpeg: {str(e)}"
 
-        if not media_path.endswith(".ogg"):
-            try:
-                media_path = audio.convert_to_opus_ogg_temp(media_path)
-            except Exception as e:
-                return False, f"Error converting file to opus ogg. You likely need to install ffmpeg: {str(e)}"
-        
-        url = f"{WHATSAPP_API_BASE_URL}/send"
-        payload = {
+    return _post_send({
+        "recipient": recipient,
+        "media_path": media_path
+    })
+
+def send_audio_data(recipient: str, source: Any) -> Tuple[bool, str]:
+    """Send audio that only exists in memory (bytes or a stream) as a voice message.
+
+    The audio is piped through ffmpeg in chunks and the encoded result is
+    streamed straight into the conversion cache, which the bridge reads from.
+    Audio already on disk should go through send_audio_message instead: it can
+    pass through or remux Opus, and ffmpeg can seek in MP4/M4A files.
+    """
+    if not recipient:
+        return False, "Recipient must be provided"
+    if source is None:
+        return False, "Audio data must be provided"
+
+    try:
+        media_path = audio.convert_to_opus_ogg_cached(source)
+    except audio.FfmpegBusyError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"Error converting audio to opus ogg. You likely need to install ffmpeg: {str(e)}"
+
+    return _post_send({
+        "recipient": recipient,
+        "media_path": media_path
+    })
+
+@interactive
+async def send_messages_batch_async(
+    items: List[Dict[str, str]],
+    concurrency: int = BATCH_SEND_CONCURRENCY,
+    rate_per_second: float = BATCH_SEND_RATE,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> Dict[str, Any]:
+    """Send many messages/files with bounded concurrency and rate.
+
+    Each item is {"recipient": ..., "message": ...} for text or
+    {"recipient": ..., "media_path": ...} for a file (an optional "message"
+    is ignored then, as with send_file). One failed recipient never stops the
+    batch; every item gets its own result, in input order. on_progress is
+    awaited with (done, total) after each item completes.
+    """
+    total = len(items)
+    results: List[Optional[Dict[str, Any]]] = [None] * total
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rate_per_second)
+    done = 0
+
+    async def send_one(index: int, item: Dict[str, str]) -> None:
+        nonlocal done
+        recipient = item.get("recipient", "")
+        async with semaphore:
+            await limiter.wait()
+            if item.get("media_path"):
+                success, status_message = await send_file_async(recipient, item["media_path"])
+            elif item.get("message"):
+                success, status_message = await send_message_async(recipient, item["message"])
+            else:
+                success, status_message = False, "Message or media_path must be provided"
+        results[index] = {
             "recipient": recipient,
-            "media_path": media_path
+            "success": success,
+            "message": status_message
         }
-        
-        response = requests.post(url, json=payload)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("success", False), result.get("message", "Unknown response")
-        else:
-            return False, f"Error: HTTP {response.status_code} - {response.text}"
-            
-    except requests.RequestException as e:
-        return False, f"Request error: {str(e)}"
+        done += 1
+        if on_progress is not None:
+            await on_progress(done, total)
+
+    await asyncio.gather(*(send_one(index, item) for index, item in enumerate(items)))
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "total": total,
+        "succeeded": succeeded,
+        "failed": total - succeeded,
+        "results": results
+    }
+
+def _parse_download_response(response: httpx.Response) -> Optional[str]:
+    """Return the local path from a bridge /download response, or None on failure."""
+    if response.status_code != 200:
+        print(f"Error: HTTP {response.status_code} - {response.text}")
+        return None
+    try:
+        result = response.json()
     except json.JSONDecodeError:
-        return False, f"Error parsing response: {response.text}"
-    except Exception as e:
-        return False, f"Unexpected error: {str(e)}"
+        print(f"Error parsing response: {response.text}")
+        return None
+    if result.get("success", False):
+        path = result.get("path")
+        print(f"Media downloaded successfully: {path}")
+        return path
+    print(f"Download failed: {result.get('message', 'Unknown error')}")
+    return None
+
+def _hex_sha256(digest: Any) -> Optional[str]:
+    """Normalize a messages.file_sha256 value (the bridge stores raw bytes) to hex."""
+    if not digest:
+        return None
+    if isinstance(digest, bytes):
+        return digest.hex() if len(digest) == 32 else None
+    return digest.lower() if len(digest) == 64 else None
+
+def _media_sha256(message_id: str, chat_jid: str) -> Optional[str]:
+    """Hex SHA-256 of a message's media content as recorded by the bridge, if known."""
+    row = db.fetchone(MESSAGES_DB_PATH, """
+        SELECT file_sha256 FROM messages WHERE id = ? AND chat_jid = ?
+    """, (message_id, chat_jid))
+    return _hex_sha256(row[0]) if row else None
+
+def _lookup_stored_media(message_id: str, chat_jid: str, expected: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Return (stored path or None, expected content hash) for a message's media."""
+    try:
+        if expected is None:
+            expected = _media_sha256(message_id, chat_jid)
+        return media_store.get_store().lookup(message_id, chat_jid, expected), expected
+    except (sqlite3.Error, OSError) as e:
+        print(f"Media store lookup failed: {e}")
+        return None, None
+
+def _store_downloaded_media(message_id: str, chat_jid: str, path: str, expected: Optional[str]) -> str:
+    """Move a bridge download into the media store; fall back to the bridge's path on failure."""
+    try:
+        return media_store.get_store().ingest(message_id, chat_jid, path, expected)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Could not add {path} to the media store: {e}")
+        return path
 
 def download_media(message_id: str, chat_jid: str) -> Optional[str]:
     """Download media from a message and return the local file path.
     
+    Media downloaded before, by this message or any other message with the
+    same content, is served from the local media store without asking the bridge.
+    
     Args:
         message_id: The ID of the message containing the media
         chat_jid: The JID of the chat containing the message
@@ -831,55 +1230,174 @@ def download_media(message_id: str, chat_jid: str) -> Optional[str]:
     Returns:
         The local file path if download was successful, None otherwise
     """
+    stored, expected = _lookup_stored_media(message_id, chat_jid)
+    if stored:
+        return stored
     try:
-        url = f"{WHATSAPP_API_BASE_URL}/download"
-        payload = {
+        path = _parse_download_response(_bridge.post("/download", {
             "message_id": message_id,
             "chat_jid": chat_jid
-        }
-        
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success", False):
-                path = result.get("path")
-                print(f"Media downloaded successfully: {path}")
-                return path
-            else:
-                print(f"Download failed: {result.get('message', 'Unknown error')}")
-                return None
-        else:
-            print(f"Error: HTTP {response.status_code} - {response.text}")
-            return None
-            
-    except requests.RequestException as e:
+        }))
+    except httpx.HTTPError as e:
         print(f"Request error: {str(e)}")
         return None
-    except json.JSONDecodeError:
-        print(f"Error parsing response: {response.text}")
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return None
+    return _store_downloaded_media(message_id, chat_jid, path, expected) if path else None
+
+@interactive
+async def download_media_async(message_id: str, chat_jid: str) -> Optional[str]:
+    """Async flavor of download_media for use on an event loop."""
+    stored, expected = await run_blocking(RESOURCE_DB, _lookup_stored_media, message_id, chat_jid)
+    if stored:
+        return stored
+    return await _download_from_bridge_async(message_id, chat_jid, expected)
+
+async def _download_from_bridge_async(message_id: str, chat_jid: str, expected: Optional[str]) -> Optional[str]:
+    """Have the bridge download a message's media and add it to the media store."""
+    try:
+        path = _parse_download_response(await _bridge.apost("/download", {
+            "message_id": message_id,
+            "chat_jid": chat_jid
+        }))
+    except httpx.HTTPError as e:
+        print(f"Request error: {str(e)}")
         return None
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
         return None
+    if not path:
+        return None
+    return await run_blocking(RESOURCE_DB, _store_downloaded_media, message_id, chat_jid, path, expected)
+
+def find_media_messages(
+    chat_jid: str,
+    message_ids: Optional[List[str]] = None,
+    media_type: Optional[str] = None,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """Find messages with media in a chat, newest first.
+
+    Either message_ids picks the messages explicitly (those without media are
+    left out) or media_type/after/before/limit filter the chat's media.
+    """
+    where_clauses = ["chat_jid = ?", "media_type IS NOT NULL", "media_type != ''"]
+    params: List[Any] = [chat_jid]
+
+    if message_ids:
+        rows = []
+        for chunk in _chunks(list(dict.fromkeys(message_ids))):
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(db.fetchall(MESSAGES_DB_PATH, f"""
+                SELECT id, media_type, filename, file_length, file_sha256, timestamp
+                FROM messages
+                WHERE {" AND ".join(where_clauses)} AND id IN ({placeholders})
+            """, params + chunk))
+        rows.sort(key=lambda row: row[5], reverse=True)
+    else:
+        if media_type:
+            where_clauses.append("media_type = ?")
+            params.append(media_type)
+        if after:
+            try:
+                where_clauses.append("timestamp > ?")
+                params.append(datetime.fromisoformat(after))
+            except ValueError:
+                raise ValueError(f"Invalid date format for 'after': {after}. Please use ISO-8601 format.")
+        if before:
+            try:
+                where_clauses.append("timestamp < ?")
+                params.append(datetime.fromisoformat(before))
+            except ValueError:
+                raise ValueError(f"Invalid date format for 'before': {before}. Please use ISO-8601 format.")
+        rows = db.fetchall(MESSAGES_DB_PATH, f"""
+            SELECT id, media_type, filename, file_length, file_sha256, timestamp
+            FROM messages
+            WHERE {" AND ".join(where_clauses)}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, params + [limit])
+
+    return [
+        {
+            "message_id": message_id,
+            "chat_jid": chat_jid,
+            "media_type": row_media_type,
+            "filename": filename,
+            "file_length": file_length,
+            "file_sha256": _hex_sha256(digest),
+            "timestamp": timestamp,
+        }
+        for message_id, row_media_type, filename, file_length, digest, timestamp in rows
+    ]
+
+@interactive
+async def download_media_batch_async(
+    candidates: List[Dict[str, Any]],
+    concurrency: int = MEDIA_BATCH_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> Dict[str, Any]:
+    """Download the media of many messages (as returned by find_media_messages) concurrently.
+
+    Media already in the local store is returned without asking the bridge
+    and marked "cached". At most concurrency bridge downloads run at once;
+    one failure never stops the batch. on_progress is awaited with
+    (done, total) after each item completes.
+    """
+    total = len(candidates)
+    results: List[Optional[Dict[str, Any]]] = [None] * total
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    done = 0
+
+    async def download_one(index: int, candidate: Dict[str, Any]) -> None:
+        nonlocal done
+        message_id, chat_jid = candidate["message_id"], candidate["chat_jid"]
+        path, _ = await run_blocking(
+            RESOURCE_DB, _lookup_stored_media, message_id, chat_jid, candidate.get("file_sha256")
+        )
+        cached = path is not None
+        if not cached:
+            async with semaphore:
+                path = await _download_from_bridge_async(message_id, chat_jid, candidate.get("file_sha256"))
+        size = stats.file_size(path) if path else None
+        results[index] = {
+            "message_id": message_id,
+            "media_type": candidate.get("media_type"),
+            "filename": candidate.get("filename"),
+            "success": path is not None,
+            "cached": cached,
+            "path": path,
+            "size_bytes": size if size is not None else candidate.get("file_length"),
+        }
+        done += 1
+        if on_progress is not None:
+            await on_progress(done, total)
+
+    await asyncio.gather(*(download_one(index, candidate) for index, candidate in enumerate(candidates)))
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "total": total,
+        "succeeded": succeeded,
+        "failed": total - succeeded,
+        "cached": sum(1 for result in results if result["cached"]),
+        "total_bytes": sum(result["size_bytes"] or 0 for result in results if result["success"]),
+        "results": results
+    }
 
 def get_contact_by_jid(jid: str) -> Optional[Contact]:
     """Get detailed contact information by JID."""
     try:
         # First try WhatsApp contacts database
-        whatsapp_conn = sqlite3.connect(WHATSAPP_DB_PATH)
-        whatsapp_cursor = whatsapp_conn.cursor()
-        
-        whatsapp_cursor.execute("""
+        contact_data = db.fetchone(WHATSAPP_DB_PATH, """
             SELECT their_jid, first_name, full_name, push_name, business_name
             FROM whatsmeow_contacts
             WHERE their_jid = ?
             LIMIT 1
         """, (jid,))
         
-        contact_data = whatsapp_cursor.fetchone()
-        whatsapp_conn.close()
-        
         # Get custom nickname
         nickname = get_contact_nickname(jid)
         
@@ -899,19 +1417,13 @@ def get_contact_by_jid(jid: str) -> Optional[Contact]:
             )
         
         # Fall back to chats database
-        messages_conn = sqlite3.connect(MESSAGES_DB_PATH)
-        messages_cursor = messages_conn.cursor()
-        
-        messages_cursor.execute("""
+        chat_data = db.fetchone(MESSAGES_DB_PATH, """
             SELECT jid, name
             FROM chats
             WHERE jid = ? AND jid NOT LIKE '%@g.us'
             LIMIT 1
         """, (jid,))
         
-        chat_data = messages_cursor.fetchone()
-        messages_conn.close()
-        
         if chat_data:
             phone_number = chat_data[0].split('@')[0] if '@' in chat_data[0] else chat_data[0]
             display_name = nickname or chat_data[1] or phone_number
@@ -933,40 +1445,12 @@ def get_contact_by_jid(jid: str) -> Optional[Contact]:
 def get_contact_by_phone(phone_number: str) -> Optional[Contact]:
     """Get contact information by phone number."""
     try:
-        # Try different JID formats
-        possible_jids = [
-            f"{phone_number}@s.whatsapp.net",
-            f"{phone_number}@c.us",
-            phone_number
-        ]
-        
-        for jid in possible_jids:
+        # Every JID known for the number (contact or chat), phone-number JIDs first
+        for jid in _phone_index.lookup(phone_number):
             contact = get_contact_by_jid(jid)
             if contact:
                 return contact
         
-        # Try partial matching in chats
-        messages_conn = sqlite3.connect(MESSAGES_DB_PATH)
-        messages_cursor = messages_conn.cursor()
-        
-        messages_cursor.execute("""
-            SELECT jid, name
-            FROM chats
-            WHERE jid LIKE ? AND jid NOT LIKE '%@g.us'
-            LIMIT 1
-        """, (f"%{phone_number}%",))
-        
-        chat_data = messages_cursor.fetchone()
-        messages_conn.close()
-        
-        if chat_data:
-            actual_phone = chat_data[0].split('@')[0] if '@' in chat_data[0] else chat_data[0]
-            return Contact(
-                phone_number=actual_phone,
-                name=chat_data[1] or actual_phone,
-                jid=chat_data[0]
-            )
-        
         return None
         
     except sqlite3.Error as e:
@@ -977,52 +1461,7 @@ def get_contact_by_phone(phone_number: str) -> Optional[Contact]:
 def list_all_contacts(limit: int = 100) -> List[Contact]:
     """Get all contacts with their detailed information."""
     try:
-        contacts = []
-        
-        # Get contacts from WhatsApp store
-        whatsapp_conn = sqlite3.connect(WHATSAPP_DB_PATH)
-        whatsapp_cursor = whatsapp_conn.cursor()
-                
-        whatsapp_cursor.execute(f"""
-            SELECT their_jid, first_name, full_name, push_name, business_name
-            FROM whatsmeow_contacts
-            WHERE 1=1 AND their_jid NOT LIKE '%@g.us'
-            ORDER BY 
-                CASE 
-                    WHEN full_name IS NOT NULL AND full_name != '' THEN full_name
-                    WHEN push_name IS NOT NULL AND push_name != '' THEN push_name
-                    WHEN first_name IS NOT NULL AND first_name != '' THEN first_name
-                    ELSE their_jid
-                END
-            LIMIT ?
-        """, (limit,))
-        
-        whatsapp_contacts = whatsapp_cursor.fetchall()
-        whatsapp_conn.close()
-        
-        for contact_data in whatsapp_contacts:
-            jid = contact_data[0]
-            phone_number = jid.split('@')[0] if '@' in jid else jid
-            
-            first_name = contact_data[1]
-            full_name = contact_data[2]
-            push_name = contact_data[3]
-            business_name = contact_data[4]
-            
-            display_name = full_name or push_name or first_name or business_name or phone_number
-            
-            contact = Contact(
-                phone_number=phone_number,
-                name=display_name,
-                jid=jid,
-                first_name=first_name,
-                full_name=full_name,
-                push_name=push_name,
-                business_name=business_name
-            )
-            contacts.append(contact)
-        
-        return contacts
+        return [_contact_from_entry(entry) for entry in _contact_directory.list(limit)]
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
@@ -1054,86 +1493,61 @@ def format_contact_info(contact: Contact) -> str:
 def set_contact_nickname(jid: str, nickname: str) -> Tuple[bool, str]:
     """Set a custom nickname for a contact."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
         # Insert or update nickname
-        cursor.execute("""
+        db.execute_write(MESSAGES_DB_PATH, """
             INSERT OR REPLACE INTO contact_nicknames (jid, nickname, updated_at)
             VALUES (?, ?, CURRENT_TIMESTAMP)
         """, (jid, nickname))
+        _name_cache.note_nickname_write(jid, MESSAGES_DB_PATH)
+        _contact_directory.note_nickname_write()
         
-        conn.commit()
         return True, f"Nickname '{nickname}' set for contact {jid}"
         
     except sqlite3.Error as e:
         return False, f"Database error: {e}"
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def get_contact_nickname(jid: str) -> Optional[str]:
     """Get a contact's custom nickname."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        result = db.fetchone(MESSAGES_DB_PATH, """
             SELECT nickname
             FROM contact_nicknames
             WHERE jid = ?
         """, (jid,))
         
-        result = cursor.fetchone()
         return result[0] if result else None
         
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def remove_contact_nickname(jid: str) -> Tuple[bool, str]:
     """Remove a contact's custom nickname."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM contact_nicknames WHERE jid = ?", (jid,))
+        removed = db.execute_write(MESSAGES_DB_PATH, "DELETE FROM contact_nicknames WHERE jid = ?", (jid,))
+        _name_cache.note_nickname_write(jid, MESSAGES_DB_PATH)
+        _contact_directory.note_nickname_write()
         
-        if cursor.rowcount > 0:
-            conn.commit()
+        if removed > 0:
             return True, f"Nickname removed for contact {jid}"
         else:
             return False, f"No nickname found for contact {jid}"
         
     except sqlite3.Error as e:
         return False, f"Database error: {e}"
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 
 def list_contact_nicknames() -> List[Tuple[str, str]]:
     """List all custom contact nicknames."""
     try:
-        conn = sqlite3.connect(MESSAGES_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        return db.fetchall(MESSAGES_DB_PATH, """
             SELECT jid, nickname
             FROM contact_nicknames
             ORDER BY nickname
         """)
         
-        return cursor.fetchall()
-        
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return []
-    finally:
-        if 'conn' in locals():
-            conn.close()